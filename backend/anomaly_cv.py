@@ -1,9 +1,12 @@
 # anomaly_cv.py
-import json, math, sys
-from dataclasses import dataclass, asdict
-from typing import List, Tuple, Dict, Any
+import json, math, sys, os, hashlib, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict, field
+from typing import List, Tuple, Dict, Any, Optional, Union, Callable
 import numpy as np
 import cv2 as cv
+from scipy.spatial import cKDTree
 from skimage.metrics import structural_similarity as ssim
 from skimage.color import rgb2lab, deltaE_ciede2000
 from skimage.morphology import skeletonize  # for wire centerlines
@@ -23,6 +26,7 @@ class BlobDet:
     subtype: str                   # LooseJoint / PointOverload / FullWireOverload / None
     confidence: float              # 0..1
     severity: float                # 0..100
+    joint_dist: Optional[float] = None  # px from centroid to nearest skeleton joint (None: no joints)
 
 @dataclass
 class DetectionReport:
@@ -35,27 +39,128 @@ class DetectionReport:
     mean_ssim: float
     image_level_label: str
     blobs: List[BlobDet]
+    # True when the no-change pre-screen returned early (no ΔE, skeleton or blob stages ran)
+    fast_path: bool = False
+    # Optional cost breakdown (detect_anomalies(..., instrument=True)): stage timings in seconds,
+    # alignment path, pixel counts per step and connected-component counts.
+    instrumentation: Optional[Dict[str,Any]] = None
+
+# ---------- Tunable parameters ----------
+# Hot-colour (lower, upper) HSV ranges in OpenCV units (H:0..179): reds, oranges, yellows.
+HOT_RANGES = (((0, 90, 120), (10, 255, 255)),
+              ((170, 90, 120), (179, 255, 255)),
+              ((11, 80, 120), (25, 255, 255)),
+              ((26, 60, 120), (35, 255, 255)))
+
+@dataclass
+class DetectionParams:
+    """
+    Thresholds and rule constants applied after ΔE. Changing them only affects masking,
+    blobs and classification, so redetect() can re-apply them to persisted intermediates.
+    """
+    ssim_split: float = 0.70          # below this mean SSIM the *_relaxed ΔE thresholds apply
+    t_pot: float = 8.0
+    t_fault: float = 12.0
+    t_pot_relaxed: float = 10.0
+    t_fault_relaxed: float = 14.0
+    hot_ranges: Tuple = HOT_RANGES
+    joint_radius: int = 8             # px from a skeleton joint that counts as "at the joint"
+    coverage_expand: int = 10         # px around a blob bbox sampled for wire coverage
+    elong_thr: float = 3.0            # elongated blobs with mean ΔE >= t_pot are potential faults
+    full_cover_thr: float = 0.60      # >=60% of local skeleton hot => FullWireOverload
+    point_cover_thr: float = 0.25     # <25% coverage and rest cool => PointOverload
+    rest_cool_thr: float = 0.60       # >=60% of band cool
+
+    @classmethod
+    def from_dict(cls, d: Dict[str,Any]) -> "DetectionParams":
+        """Defaults overridden by d (e.g. parsed JSON); unknown keys raise ValueError."""
+        unknown = set(d) - set(cls.__dataclass_fields__)
+        if unknown:
+            raise ValueError(f"Unknown detection parameters: {sorted(unknown)}")
+        d = dict(d)
+        if 'hot_ranges' in d:
+            d['hot_ranges'] = tuple((tuple(lo), tuple(hi)) for lo, hi in d['hot_ranges'])
+        return cls(**d)
+
+DEFAULT_PARAMS = DetectionParams()
 
 # ---------- Utilities ----------
+class StageTimer:
+    """Lap timer: mark(name) charges the wall time since the previous mark to that stage (seconds)."""
+    def __init__(self, times: Dict[str,float] = None):
+        self.times = times if times is not None else {}
+        self._last = time.perf_counter()
+
+    def mark(self, name: str) -> None:
+        now = time.perf_counter()
+        self.times[name] = self.times.get(name, 0.0) + (now - self._last)
+        self._last = now
+
 def read_bgr(path: str) -> np.ndarray:
     img = cv.imread(path, cv.IMREAD_COLOR)
     if img is None:
         raise FileNotFoundError(path)
     return img
 
+def read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def decode_bgr(data: bytes) -> np.ndarray:
+    img = cv.imdecode(np.frombuffer(data, np.uint8), cv.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image bytes")
+    return img
+
 def to_gray(img_bgr: np.ndarray) -> np.ndarray:
     return cv.cvtColor(img_bgr, cv.COLOR_BGR2GRAY)
 
-def ecc_align(base_gray: np.ndarray, mov_gray: np.ndarray) -> Tuple[np.ndarray, np.ndarray, bool, float]:
+# Image inputs accepted by the detect_* entry points: file path, encoded bytes or a decoded BGR array.
+ImageSource = Union[str, bytes, np.ndarray]
+
+def load_bgr(src: ImageSource) -> np.ndarray:
+    if isinstance(src, np.ndarray):
+        return src if src.ndim == 3 else cv.cvtColor(src, cv.COLOR_GRAY2BGR)
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        return decode_bgr(bytes(src))
+    return read_bgr(src)
+
+def source_name(src: ImageSource) -> str:
+    """Path recorded in reports ('' for in-memory inputs)."""
+    return src if isinstance(src, str) else ""
+
+ORB_FEATURES = 5000
+
+def bbox_iou(a: Tuple[int,int,int,int], b: Tuple[int,int,int,int]) -> float:
+    """Intersection over union of two x,y,w,h boxes."""
+    ax, ay, aw, ah = a; bx, by, bw, bh = b
+    iw = min(ax + aw, bx + bw) - max(ax, bx)
+    ih = min(ay + ah, by + bh) - max(ay, by)
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = float(iw * ih)
+    return inter / (aw * ah + bw * bh - inter)
+
+# ORB (keypoints, descriptors) of the baseline, or a zero-argument callable returning them
+# (e.g. BaselineArtifacts.features) so cached features are only unpacked if ORB actually runs
+OrbFeatures = Union[Tuple[List[cv.KeyPoint], np.ndarray], Callable[[], Tuple[List[cv.KeyPoint], np.ndarray]]]
+
+def ecc_align(base_gray: np.ndarray, mov_gray: np.ndarray,
+              base_features: OrbFeatures = None,
+              warp_init: np.ndarray = None, max_iters: int = 200,
+              orb_fallback: bool = True) -> Tuple[np.ndarray, np.ndarray, bool, float]:
     """
-    Try ECC alignment (affine). If it fails, fall back to ORB+RANSAC homography.
+    Try ECC alignment (affine). If it fails, fall back to ORB+RANSAC homography (if orb_fallback
+    is set; otherwise return the identity with ok False).
+    base_features: precomputed ORB features of base_gray (see OrbFeatures), e.g. from BaselineCache.
+    warp_init: 2x3 starting estimate (e.g. the previous frame's warp) instead of identity.
     Returns: (warp_matrix, aligned_gray, ok, score)
       - warp_matrix is 2x3 (affine) or 3x3 (homography)
-      - score is ECC correlation for ECC; 0.0 for homography fallback
+      - score is ECC correlation for ECC; RANSAC inlier ratio for the homography fallback
     """
     warp_mode = cv.MOTION_AFFINE
-    warp = np.eye(2, 3, dtype=np.float32)
-    criteria = (cv.TERM_CRITERIA_EPS | cv.TERM_CRITERIA_COUNT, 200, 1e-6)
+    warp = warp_init.astype(np.float32).copy() if warp_init is not None else np.eye(2, 3, dtype=np.float32)
+    criteria = (cv.TERM_CRITERIA_EPS | cv.TERM_CRITERIA_COUNT, max_iters, 1e-6)
     try:
         cc, warp = cv.findTransformECC(base_gray, mov_gray, warp, warp_mode, criteria)
         aligned = cv.warpAffine(
@@ -65,49 +170,278 @@ def ecc_align(base_gray: np.ndarray, mov_gray: np.ndarray) -> Tuple[np.ndarray,
         )
         return warp, aligned, True, float(cc)
     except cv.error:
-        # ORB + RANSAC Homography (feature-based) fallback.
-        orb = cv.ORB_create(5000)
-        k1, d1 = orb.detectAndCompute(base_gray, None)
-        k2, d2 = orb.detectAndCompute(mov_gray, None)
-        if d1 is None or d2 is None:
-            return np.eye(2,3,np.float32), mov_gray, False, 0.0
-
-        matcher = cv.BFMatcher(cv.NORM_HAMMING, crossCheck=True)
-        matches = matcher.match(d1, d2)
-        matches = sorted(matches, key=lambda m: m.distance)[:500]
-        if len(matches) < 8:
-            return np.eye(2,3,np.float32), mov_gray, False, 0.0
-
-        pts1 = np.float32([k1[m.queryIdx].pt for m in matches])
-        pts2 = np.float32([k2[m.trainIdx].pt for m in matches])
-        H, mask = cv.findHomography(pts2, pts1, cv.RANSAC, 3.0)
-        if H is None:
-            return np.eye(2,3,np.float32), mov_gray, False, 0.0
-
-        aligned = cv.warpPerspective(
-            mov_gray, H,
-            (base_gray.shape[1], base_gray.shape[0])
-        )
-        # IMPORTANT: return full 3x3 homography
-        return H.astype(np.float32), aligned, True, 0.0
+        if not orb_fallback:
+            return np.eye(2, 3, dtype=np.float32), mov_gray, False, 0.0
+        return orb_homography(base_gray, mov_gray, base_features)
+
+ORB_RATIO = 0.75          # Lowe ratio test on the two nearest descriptor matches
+ORB_MIN_INLIERS = 12
+ORB_MIN_INLIER_RATIO = 0.25
+
+def orb_homography(base_gray: np.ndarray, mov_gray: np.ndarray,
+                   base_features: OrbFeatures = None) -> Tuple[np.ndarray, np.ndarray, bool, float]:
+    """
+    ORB + RANSAC Homography (feature-based) fallback. Same return contract as ecc_align.
+    Matches by brute-force Hamming kNN and a ratio test (exact, so the same pair always gets
+    the same homography; LSH tables are randomized); the homography maps base -> moving
+    coordinates (like the ECC warp) and is rejected below ORB_MIN_INLIERS / ORB_MIN_INLIER_RATIO.
+    """
+    fail = (np.eye(2, 3, dtype=np.float32), mov_gray, False, 0.0)
+    orb = cv.ORB_create(ORB_FEATURES)
+    if callable(base_features):
+        base_features = base_features()
+    k1, d1 = base_features if base_features is not None else orb.detectAndCompute(base_gray, None)
+    k2, d2 = orb.detectAndCompute(mov_gray, None)
+    if d1 is None or d2 is None or len(d1) < 2 or len(d2) < 2:
+        return fail
+
+    matcher = cv.BFMatcher(cv.NORM_HAMMING)
+    pairs = matcher.knnMatch(d2, d1, k=2)
+    matches = [p[0] for p in pairs if len(p) == 2 and p[0].distance < ORB_RATIO * p[1].distance]
+    if len(matches) < ORB_MIN_INLIERS:
+        return fail
+
+    pts1 = np.float32([k1[m.trainIdx].pt for m in matches])
+    pts2 = np.float32([k2[m.queryIdx].pt for m in matches])
+    H, mask = cv.findHomography(pts1, pts2, cv.RANSAC, 3.0)
+    if H is None:
+        return fail
+    inliers = int(mask.sum())
+    if inliers < ORB_MIN_INLIERS or inliers < ORB_MIN_INLIER_RATIO * len(matches):
+        return fail
+
+    aligned = cv.warpPerspective(
+        mov_gray, H,
+        (base_gray.shape[1], base_gray.shape[0]),
+        flags=cv.INTER_LINEAR + cv.WARP_INVERSE_MAP
+    )
+    # IMPORTANT: return full 3x3 homography
+    return H.astype(np.float32), aligned, True, inliers / len(matches)
 
-def lab_and_hsv(img_bgr: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+def ecc_align_pyramid(base_gray: np.ndarray, mov_gray: np.ndarray,
+                      base_pyramid: List[np.ndarray] = None,
+                      base_features: OrbFeatures = None,
+                      levels: int = 4,
+                      coarse_iters: int = 100,
+                      full_res_iters: int = 20,
+                      eps: float = 1e-5,
+                      warp_init: np.ndarray = None,
+                      orb_fallback: bool = True) -> Tuple[np.ndarray, np.ndarray, bool, float, List[Dict[str,Any]]]:
+    """
+    Coarse-to-fine affine ECC: estimate on the coarsest pyramid level, then refine the
+    (translation-rescaled) warp at each finer level. full_res_iters caps the level-0 pass;
+    0 skips it and upsamples the level-1 warp. A level that throws keeps the previous estimate;
+    ORB homography is only used if no level converged (and orb_fallback is set).
+    warp_init: full-resolution 2x3 starting estimate, rescaled to the coarsest level.
+    Returns ecc_align's tuple plus per-level stats: level, shape, max_iters, time_s, cc, ok.
+    (OpenCV does not expose the iteration count actually used, so max_iters is the cap.)
+    """
+    base_pyr = base_pyramid if base_pyramid is not None else gray_pyramid(base_gray, levels)
+    base_pyr = base_pyr[:levels]
+    mov_pyr = gray_pyramid(mov_gray, len(base_pyr))
+    n = min(len(base_pyr), len(mov_pyr))
+
+    warp = np.eye(2, 3, dtype=np.float32)
+    if warp_init is not None:
+        warp = warp_init.astype(np.float32).copy()
+        warp[:, 2] /= 2.0 ** (n - 1)
+    cc, ok = 0.0, False
+    stats: List[Dict[str,Any]] = []
+    for lvl in range(n - 1, -1, -1):
+        iters = coarse_iters if lvl > 0 else full_res_iters
+        if iters <= 0:
+            continue
+        criteria = (cv.TERM_CRITERIA_EPS | cv.TERM_CRITERIA_COUNT, iters, eps)
+        t0 = time.perf_counter()
+        try:
+            cc_l, warp_l = cv.findTransformECC(base_pyr[lvl], mov_pyr[lvl], warp.copy(), cv.MOTION_AFFINE, criteria)
+            warp, cc, ok, lvl_ok = warp_l, float(cc_l), True, True
+        except cv.error:
+            lvl_ok = False
+        stats.append(dict(level=lvl, shape=tuple(base_pyr[lvl].shape), max_iters=iters,
+                          time_s=time.perf_counter() - t0, cc=cc if lvl_ok else None, ok=lvl_ok))
+        if lvl > 0:
+            warp = warp.copy()
+            warp[:, 2] *= 2.0  # pyrDown halves coordinates; the linear part is scale-invariant
+
+    if not ok:
+        if not orb_fallback:
+            return np.eye(2, 3, dtype=np.float32), mov_gray, False, 0.0, stats
+        t0 = time.perf_counter()
+        res = orb_homography(base_gray, mov_gray, base_features)
+        stats.append(dict(level=0, shape=tuple(base_gray.shape), max_iters=0,
+                          time_s=time.perf_counter() - t0, cc=None, ok=res[2], method='orb'))
+        return (*res, stats)
+
+    aligned = cv.warpAffine(
+        mov_gray, warp,
+        (base_gray.shape[1], base_gray.shape[0]),
+        flags=cv.INTER_LINEAR + cv.WARP_INVERSE_MAP
+    )
+    return warp, aligned, True, cc, stats
+
+# Alignment cascade: cheapest model first, stop at the first warp whose quality passes
+@dataclass
+class AlignCascade:
+    """
+    Steps and acceptance thresholds for align='cascade'. Every candidate warp is scored by
+    the same quality measure: zero-mean NCC between the baseline and the warped moving image
+    over the pixels the warp keeps in view. Scoring runs at full resolution (the resolution
+    the warp is applied at) unless probe_side is set.
+    """
+    steps: Tuple[str, ...] = ('identity', 'phase', 'pyramid', 'orb')
+    probe_side: Optional[int] = None   # None: full resolution; e.g. 1024 trades ranking fidelity for speed
+    identity_ncc: float = 0.95     # tripod re-shots: skip alignment entirely
+    phase_ncc: float = 0.95        # translation-only (phase correlation)
+    pyramid_ncc: float = 0.85      # coarse-to-fine affine ECC
+    orb_ncc: float = 0.80          # ORB homography (inlier checks in orb_homography)
+    min_valid: float = 0.5         # warps leaving less of the frame in view score -1
+    seed_ncc: float = 0.8          # a candidate this good seeds the pyramid, which then only refines it:
+    seeded_coarse_iters: int = 20  # iteration caps for the seeded pyramid (0 at full resolution:
+    seeded_full_res_iters: int = 0 # upsample the level-1 warp, as ecc_align_pyramid does)
+    phase_side: int = 1024         # phase correlation runs on this downscale; the shift is rescaled
+
+DEFAULT_CASCADE = AlignCascade()
+
+def probe_gray(gray: np.ndarray, side: Optional[int]) -> Tuple[np.ndarray, float]:
+    """gray downscaled so its longer side is `side` (never upscaled; None keeps it). Returns (image, scale)."""
+    s = 1.0 if side is None else min(1.0, side / max(gray.shape))
+    if s == 1.0:
+        return gray, s
+    return cv.resize(gray, (max(1, round(gray.shape[1] * s)), max(1, round(gray.shape[0] * s))),
+                     interpolation=cv.INTER_AREA), s
+
+def warp_ncc(base_probe: np.ndarray, mov_probe: np.ndarray, warp_probe: np.ndarray,
+             min_valid: float = 0.5) -> float:
+    """Zero-mean NCC of base vs the warped moving image over the in-view pixels (-1 if too few)."""
+    H, W = base_probe.shape
+    warped = warp_color(mov_probe, warp_probe, (W, H))[0]
+    valid = warp_color(np.full(mov_probe.shape, 255, np.uint8), warp_probe, (W, H))[0]
+    valid = cv.erode(valid, None) > 0   # drop the border row blended with the fill value
+    if valid.mean() < min_valid:
+        return -1.0
+    a = base_probe[valid].astype(np.float32); a -= a.mean()
+    b = warped[valid].astype(np.float32); b -= b.mean()
+    return float((a @ b) / max(math.sqrt(float(a @ a) * float(b @ b)), 1e-6))
+
+def align_cascade(base_gray: np.ndarray, mov_gray: np.ndarray,
+                  base_pyramid: List[np.ndarray] = None,
+                  base_features: OrbFeatures = None,
+                  cascade: AlignCascade = None) -> Tuple[np.ndarray, np.ndarray, bool, float, List[Dict[str,Any]]]:
+    """
+    Try cascade.steps in order - identity, translation by phase correlation, pyramid ECC,
+    ORB homography - and stop as soon as a step's NCC reaches its threshold. The candidate
+    with the best NCC wins (ok is False if that is the identity and no step passed).
+    The pyramid starts from the best earlier candidate with the seeded_* iteration caps if that
+    candidate scored at least seed_ncc, and from scratch with the full schedule otherwise.
+    Returns ecc_align's tuple (score = NCC) plus per-step stats: step, time_s, ncc, accepted.
+    """
+    cfg = cascade if cascade is not None else DEFAULT_CASCADE
+    bp, s = probe_gray(base_gray, cfg.probe_side)
+    mp = cv.resize(mov_gray, (max(1, round(mov_gray.shape[1] * s)), max(1, round(mov_gray.shape[0] * s))),
+                   interpolation=cv.INTER_AREA) if s < 1.0 else mov_gray
+    size_wh = (base_gray.shape[1], base_gray.shape[0])
+    identity = np.eye(2, 3, dtype=np.float32)
+    stats: List[Dict[str,Any]] = []
+    candidates = []   # (ncc, step, warp, aligned or None)
+    for step in cfg.steps:
+        t0 = time.perf_counter()
+        warp, aligned = None, None
+        if step == 'identity':
+            warp = identity
+            if mov_gray.shape == base_gray.shape:
+                aligned = mov_gray
+        elif step == 'phase':
+            bq, q = probe_gray(base_gray, cfg.phase_side)
+            mq = cv.resize(mov_gray, (max(1, round(mov_gray.shape[1] * q)), max(1, round(mov_gray.shape[0] * q))),
+                           interpolation=cv.INTER_AREA) if q < 1.0 else mov_gray
+            mq = warp_color(mq, identity, bq.shape[::-1])[0]   # crop/pad to the base size
+            win = cv.createHanningWindow(bq.shape[::-1], cv.CV_32F)
+            (dx, dy), _ = cv.phaseCorrelate(bq.astype(np.float32), mq.astype(np.float32), win)
+            warp = np.float32([[1, 0, dx / q], [0, 1, dy / q]])
+        elif step == 'pyramid':
+            best = max(candidates, key=lambda c: c[0]) if candidates else None
+            seed = best[2] if best is not None and best[0] >= cfg.seed_ncc and best[2].shape == (2,3) else None
+            iters = {} if seed is None else dict(coarse_iters=cfg.seeded_coarse_iters,
+                                                 full_res_iters=cfg.seeded_full_res_iters)
+            warp, aligned, ok_p, _, _ = ecc_align_pyramid(base_gray, mov_gray, base_pyramid, base_features,
+                                                          warp_init=seed, orb_fallback=False, **iters)
+            warp = warp if ok_p else None
+        elif step == 'orb':
+            warp, aligned, ok_o, _ = orb_homography(base_gray, mov_gray, base_features)
+            warp = warp if ok_o else None
+        else:
+            raise ValueError(f"Unknown alignment step: {step}")
+
+        ncc = None
+        if warp is not None:
+            warp_p = warp.copy()
+            if warp.shape == (2,3):
+                warp_p[:, 2] *= s
+            else:
+                warp_p = scale_warp(warp, 1.0 / s)
+            ncc = warp_ncc(bp, mp, warp_p, cfg.min_valid)
+            candidates.append((ncc, step, warp, aligned))
+        accepted = ncc is not None and ncc >= getattr(cfg, step + '_ncc')
+        stats.append(dict(step=step, time_s=time.perf_counter() - t0, ncc=ncc, accepted=accepted))
+        if accepted:
+            break
+
+    if not candidates:
+        return identity, warp_color(mov_gray, identity, size_wh)[0], False, 0.0, stats
+    ncc, step, warp, aligned = max(candidates, key=lambda c: c[0])
+    if aligned is None:
+        aligned = warp_color(mov_gray, warp, size_wh)[0]
+    return warp, aligned, stats[-1]['accepted'] or step != 'identity', ncc, stats
+
+def lab_and_hsv(img_bgr: np.ndarray, lean: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """lean=True returns float32 LAB (half the memory; values differ from float64 by <1e-4)."""
     img_rgb = cv.cvtColor(img_bgr, cv.COLOR_BGR2RGB)
+    if lean:
+        img_rgb = img_rgb.astype(np.float32)
+        img_rgb *= 1.0 / 255.0  # float input keeps rgb2lab in float32
     lab = rgb2lab(img_rgb)  # LAB for ΔE2000 computation
     hsv = cv.cvtColor(img_bgr, cv.COLOR_BGR2HSV)
     return lab, hsv
 
-def deltaE_map(lab_base: np.ndarray, lab_maint: np.ndarray) -> np.ndarray:
-    # Vectorized ΔE2000 across image
-    return deltaE_ciede2000(lab_base, lab_maint).astype(np.float32)
-
-def hot_color_mask(hsv: np.ndarray) -> np.ndarray:
-    # Reds/oranges/yellows in OpenCV HSV (H:0..179).
-    m_red1   = cv.inRange(hsv, (0,   90, 120), (10,  255, 255))
-    m_red2   = cv.inRange(hsv, (170, 90, 120), (179, 255, 255))
-    m_orange = cv.inRange(hsv, (11,  80, 120), (25,  255, 255))
-    m_yellow = cv.inRange(hsv, (26,  60, 120), (35,  255, 255))
-    mask = cv.bitwise_or(cv.bitwise_or(m_red1, m_red2), cv.bitwise_or(m_orange, m_yellow))
+DELTAE_CHUNK = 1 << 16   # pixels per deltaE_ciede2000 call in chunked (memory-lean) mode
+
+def deltaE_map(lab_base: np.ndarray, lab_maint: np.ndarray, gate: np.ndarray = None,
+               chunk: int = None) -> np.ndarray:
+    """
+    Vectorized ΔE2000 across image. With a gate mask, ΔE is only evaluated where gate > 0
+    and left at 0 elsewhere; CIEDE2000 is per-pixel, so gated values match the full map exactly.
+    chunk bounds the temporaries of deltaE_ciede2000 (several full-size float arrays) by
+    evaluating at most that many pixels per call, writing into one float32 output.
+    """
+    if gate is None and chunk is None:
+        return deltaE_ciede2000(lab_base, lab_maint).astype(np.float32)
+    dE = np.zeros(lab_base.shape[:2], dtype=np.float32)
+    idx = np.flatnonzero(gate) if gate is not None else None
+    n = len(idx) if idx is not None else dE.size
+    if n == 0:
+        return dE
+    step = chunk or n
+    flat_b = lab_base.reshape(-1, 3); flat_m = lab_maint.reshape(-1, 3); flat_d = dE.reshape(-1)
+    for s in range(0, n, step):
+        sel = idx[s:s+step] if idx is not None else slice(s, s+step)
+        flat_d[sel] = deltaE_ciede2000(flat_b[sel], flat_m[sel])
+    return dE
+
+def deltaE_gate(mask_hot: np.ndarray, margin: int = 3) -> np.ndarray:
+    """
+    Pixels whose ΔE can influence detection: the hot-colour mask grown by `margin` px.
+    morphology_clean's closing can pull blobs up to 2 px past the hot pixels, so the
+    default margin keeps blob ΔE statistics identical to an ungated run.
+    """
+    k = cv.getStructuringElement(cv.MORPH_RECT, (2*margin+1, 2*margin+1))
+    return cv.dilate(mask_hot, k, iterations=1)
+
+def hot_color_mask(hsv: np.ndarray, ranges=HOT_RANGES) -> np.ndarray:
+    # Reds/oranges/yellows in OpenCV HSV (H:0..179) by default; see HOT_RANGES.
+    mask = np.zeros(hsv.shape[:2], np.uint8)
+    for lo, hi in ranges:
+        cv.bitwise_or(mask, cv.inRange(hsv, tuple(lo), tuple(hi)), dst=mask)
     return mask
 
 def morphology_clean(mask: np.ndarray) -> np.ndarray:
@@ -116,50 +450,115 @@ def morphology_clean(mask: np.ndarray) -> np.ndarray:
     mask = cv.morphologyEx(mask, cv.MORPH_CLOSE, k, iterations=2)
     return mask
 
-def blob_props(bin_mask: np.ndarray, dE: np.ndarray, hsv: np.ndarray) -> List[Dict[str,Any]]:
-    # Connected components and basic stats
+def region_stats(labels: np.ndarray, n: int, dE: np.ndarray, hsv: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Per-component statistics for a label image in one pass over its foreground pixels
+    (bincount reductions instead of a Python loop per component).
+    Every array is indexed by label (0..n-1, row 0 = background): area, mean_deltaE,
+    peak_deltaE, mean_hsv (n,3), cov (n,3 as var_y, var_x, cov_xy; ddof=1) and elongation.
+    """
+    ys, xs = np.nonzero(labels)
+    flat = ys * labels.shape[1] + xs
+    lab = labels.ravel()[flat].astype(np.intp)  # bincount casts to intp on every call otherwise
+    area = np.bincount(lab, minlength=n).astype(np.float64)
+    safe = np.maximum(area, 1.0)
+
+    dE_fg = dE.ravel()[flat]
+    mean_dE = np.bincount(lab, weights=dE_fg, minlength=n) / safe
+    # Peak per label: stable sort groups labels, then one reduceat over the runs
+    order = np.argsort(lab, kind='stable')
+    lab_sorted = lab[order]
+    starts = np.r_[0, np.flatnonzero(lab_sorted[1:] != lab_sorted[:-1]) + 1] if len(lab) else np.zeros(0, np.int64)
+    peak_dE = np.zeros(n, dtype=np.float64)
+    if len(starts):
+        peak_dE[lab_sorted[starts]] = np.maximum.reduceat(dE_fg[order], starts)
+
+    mean_hsv = np.stack([np.bincount(lab, weights=hsv[..., c].ravel()[flat], minlength=n) / safe
+                         for c in range(3)], axis=1)
+
+    # Centred second-order moments of pixel coordinates -> 2x2 covariance per component
+    my = np.bincount(lab, weights=ys, minlength=n) / safe
+    mx = np.bincount(lab, weights=xs, minlength=n) / safe
+    dy = ys - my[lab]; dx = xs - mx[lab]
+    denom = np.maximum(area - 1.0, 1.0)
+    vyy = np.bincount(lab, weights=dy*dy, minlength=n) / denom
+    vxx = np.bincount(lab, weights=dx*dx, minlength=n) / denom
+    vxy = np.bincount(lab, weights=dx*dy, minlength=n) / denom
+
+    return dict(area=area, mean_deltaE=mean_dE, peak_deltaE=peak_dE, mean_hsv=mean_hsv,
+                cov=np.stack([vyy, vxx, vxy], axis=1), elongation=elongation(area, vyy, vxx, vxy))
+
+def elongation(area: np.ndarray, vyy: np.ndarray, vxx: np.ndarray, vxy: np.ndarray) -> np.ndarray:
+    """Major/minor axis ratio from the 2x2 pixel covariance (closed-form eigenvalues); 1 below 10 px."""
+    half_tr = 0.5 * (vyy + vxx)
+    disc = np.sqrt(0.25 * (vyy - vxx)**2 + vxy**2)
+    ev_hi = np.abs(half_tr + disc); ev_lo = np.abs(half_tr - disc)
+    ev_max = np.maximum(ev_hi, ev_lo); ev_min = np.minimum(ev_hi, ev_lo)
+    return np.where(area >= 10, (ev_max + 1e-6) / (ev_min + 1e-6), 1.0)
+
+# ---------- Blob table (columnar blob statistics) ----------
+# One row per blob, the same fields as BlobDet; classification/subtype index CLASSIFICATIONS/SUBTYPES
+# and joint_dist is inf without joints. Filled by blob_table, classified by classify_table.
+CLASSIFICATIONS = ('Normal', 'Potentially Faulty', 'Faulty')
+SUBTYPES = ('None', 'LooseJoint', 'PointOverload', 'FullWireOverload')
+BLOB_DTYPE = np.dtype([('label', np.int32), ('bbox', np.int32, (4,)), ('area', np.int32),
+                       ('centroid', np.float64, (2,)), ('mean_deltaE', np.float64), ('peak_deltaE', np.float64),
+                       ('mean_hsv', np.float64, (3,)), ('elongation', np.float64),
+                       ('classification', np.int8), ('subtype', np.int8), ('confidence', np.float64),
+                       ('severity', np.float64), ('joint_dist', np.float64)])
+
+def _blob_table(n: int) -> np.ndarray:
+    table = np.zeros(n, BLOB_DTYPE)
+    table['joint_dist'] = np.inf
+    return table
+
+def blob_table(bin_mask: np.ndarray, dE: np.ndarray, hsv: np.ndarray,
+               counts: Dict[str,int] = None) -> np.ndarray:
+    """Connected components of bin_mask (area >= 25) and their statistics as a BLOB_DTYPE table."""
     n, labels, stats, centroids = cv.connectedComponentsWithStats(bin_mask, connectivity=8)
-    out = []
-    for lab in range(1, n):
-        x,y,w,h,area = stats[lab]
-        if area < 25:    # ignore tiny speckles
-            continue
-        roi = (labels[y:y+h, x:x+w] == lab)
-        dE_roi = dE[y:y+h, x:x+w][roi]
-        hsv_roi = hsv[y:y+h, x:x+w][roi]
-        mean_dE = float(dE_roi.mean()) if dE_roi.size else 0.0
-        peak_dE = float(dE_roi.max()) if dE_roi.size else 0.0
-        mean_h = float(hsv_roi[:,0].mean()) if hsv_roi.size else 0.0
-        mean_s = float(hsv_roi[:,1].mean()) if hsv_roi.size else 0.0
-        mean_v = float(hsv_roi[:,2].mean()) if hsv_roi.size else 0.0
-
-        # Elongation via covariance eigenvalue ratio
-        pts = np.column_stack(np.where(roi))
-        if len(pts) >= 10:
-            cov = np.cov(pts.astype(np.float32).T)
-            eigvals,_ = np.linalg.eig(cov)
-            eigvals = np.sort(np.abs(eigvals))
-            elong = float((eigvals[-1]+1e-6)/(eigvals[0]+1e-6))
-        else:
-            elong = 1.0
+    if counts is not None:
+        counts['components'] = int(n - 1)
+    rs = region_stats(labels, n, dE, hsv)
+    keep = np.flatnonzero(stats[1:, cv.CC_STAT_AREA] >= 25) + 1   # ignore tiny speckles
+    table = _blob_table(len(keep))
+    table['label'] = keep
+    table['bbox'] = stats[keep, :4]
+    table['area'] = stats[keep, cv.CC_STAT_AREA]
+    table['centroid'] = centroids[keep]
+    for k in ('mean_deltaE', 'peak_deltaE', 'mean_hsv', 'elongation'):
+        table[k] = rs[k][keep]
+    return table
 
-        out.append(dict(label=lab, bbox=(int(x),int(y),int(w),int(h)), area=int(area),
-                        centroid=(float(centroids[lab][0]), float(centroids[lab][1])),
-                        mean_deltaE=mean_dE, peak_deltaE=peak_dE,
-                        mean_hsv=(mean_h, mean_s, mean_v), elongation=elong))
-    return out
+def blobs_from_table(table: np.ndarray) -> List[BlobDet]:
+    """BlobDet per classified row: the only place the pipeline creates per-blob objects."""
+    c = {k: table[k].tolist() for k in table.dtype.names}
+    return [BlobDet(label=c['label'][i], bbox=tuple(c['bbox'][i]), area=c['area'][i],
+                    centroid=tuple(c['centroid'][i]), mean_deltaE=c['mean_deltaE'][i],
+                    peak_deltaE=c['peak_deltaE'][i], mean_hsv=tuple(c['mean_hsv'][i]),
+                    elongation=c['elongation'][i], classification=CLASSIFICATIONS[c['classification'][i]],
+                    subtype=SUBTYPES[c['subtype'][i]], confidence=c['confidence'][i], severity=c['severity'][i],
+                    joint_dist=(c['joint_dist'][i] if math.isfinite(c['joint_dist'][i]) else None))
+            for i in range(len(table))]
 
 # ---------- Topology helpers (wire skeleton, joints, coverage) ----------
-def build_wire_skeleton(img_bgr: np.ndarray, hot_mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+def wire_edges(img_bgr: np.ndarray) -> np.ndarray:
+    """Dilated Canny edges: the threshold-independent half of build_wire_skeleton's input."""
+    gray = cv.cvtColor(img_bgr, cv.COLOR_BGR2GRAY)
+    edges = cv.Canny(gray, 50, 150)
+    k3 = cv.getStructuringElement(cv.MORPH_RECT, (3,3))
+    return cv.dilate(edges, k3, iterations=1)
+
+def build_wire_skeleton(img_bgr: Optional[np.ndarray], hot_mask: np.ndarray,
+                        edges: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
     """
     Build a binary 1-px skeleton of likely wires and a thin 'wire band' for sampling.
     We union Canny edges with a slightly dilated hot mask (to include warm wires).
+    edges: precomputed wire_edges(img_bgr); img_bgr is then not needed.
     """
-    gray = cv.cvtColor(img_bgr, cv.COLOR_BGR2GRAY)
-    edges = cv.Canny(gray, 50, 150)
+    if edges is None:
+        edges = wire_edges(img_bgr)
     k3 = cv.getStructuringElement(cv.MORPH_RECT, (3,3))
     k5 = cv.getStructuringElement(cv.MORPH_RECT, (5,5))
-    edges = cv.dilate(edges, k3, iterations=1)
     hot_dil = cv.dilate(hot_mask, k5, iterations=1)
     union = cv.bitwise_or(edges, hot_dil)
     # skeletonize expects boolean
@@ -169,166 +568,194 @@ def build_wire_skeleton(img_bgr: np.ndarray, hot_mask: np.ndarray) -> Tuple[np.n
     wire_band = cv.dilate(skel, k3, iterations=1)
     return skel, wire_band
 
-def _neighbors8(y: int, x: int, h: int, w: int):
-    for dy in (-1,0,1):
-        for dx in (-1,0,1):
-            if dy==0 and dx==0: continue
-            ny, nx = y+dy, x+dx
-            if 0 <= ny < h and 0 <= nx < w:
-                yield ny, nx
+# 3x3 ones with a zero centre: filtering a 0/1 skeleton with it yields each pixel's 8-neighbour count.
+_NEIGH8_KERNEL = np.array([[1,1,1],[1,0,1],[1,1,1]], dtype=np.float32)
 
-def find_skeleton_nodes(skel: np.ndarray) -> Tuple[List[Tuple[int,int]], List[Tuple[int,int]]]:
+def skeleton_degree(skel: np.ndarray) -> np.ndarray:
     """
-    Return (endpoints, junctions) on a 1-px skeleton using 8-neighborhood degree.
+    8-neighbourhood degree of every skeleton pixel in a single filter pass (0 off the skeleton).
+    Pixels outside the image count as background, matching a bounds-checked neighbour walk.
     """
     s = (skel > 0).astype(np.uint8)
-    H, W = s.shape
-    endpoints, junctions = [], []
-    ys, xs = np.where(s)
-    for y, x in zip(ys, xs):
-        deg = 0
-        for ny, nx in _neighbors8(y, x, H, W):
-            if s[ny, nx]: deg += 1
-        if deg == 1:
-            endpoints.append((x, y))
-        elif deg >= 3:
-            junctions.append((x, y))
+    deg = cv.filter2D(s, -1, _NEIGH8_KERNEL, borderType=cv.BORDER_CONSTANT)
+    deg[s == 0] = 0
+    return deg
+
+def find_skeleton_node_arrays(skel: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (endpoints, junctions) on a 1-px skeleton using 8-neighborhood degree, as int32 arrays of
+    shape (N,2) holding (x, y) rows in row-major scan order.
+    """
+    deg = skeleton_degree(skel)
+    ey, ex = np.nonzero(deg == 1)
+    jy, jx = np.nonzero(deg >= 3)
+    endpoints = np.column_stack((ex, ey)).astype(np.int32)
+    junctions = np.column_stack((jx, jy)).astype(np.int32)
     return endpoints, junctions
 
-def is_near_joint(centroid_xy: Tuple[float,float], joints: List[Tuple[int,int]], r: int = 8) -> bool:
-    cx, cy = centroid_xy
-    for jx, jy in joints:
-        if (cx - jx)**2 + (cy - jy)**2 <= r*r:
-            return True
-    return False
+class JointIndex:
+    """
+    KD-tree over skeleton joints (endpoints + junctions), built once per image.
+    Answers "is this centroid within r px of a joint" in O(log n) and exposes the nearest-joint distance.
+    """
+    def __init__(self, joints):
+        self.points = np.asarray(joints, dtype=np.float64).reshape(-1, 2)
+        self._tree = cKDTree(self.points) if len(self.points) else None
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def nearest(self, centroid_xy: Tuple[float,float]) -> Tuple[float, int]:
+        """(distance, joint index) of the nearest joint; (inf, -1) when there are none."""
+        if self._tree is None:
+            return math.inf, -1
+        d, i = self._tree.query(centroid_xy)
+        return float(d), int(i)
+
+    def nearest_many(self, centroids_xy: np.ndarray) -> np.ndarray:
+        """Nearest-joint distance for each (x, y) row; inf when there are no joints."""
+        pts = np.asarray(centroids_xy, dtype=np.float64).reshape(-1, 2)
+        if self._tree is None:
+            return np.full(len(pts), np.inf)
+        d, _ = self._tree.query(pts)
+        return d
+
+    def near_many(self, centroids_xy: np.ndarray, r: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+        """(nearest-joint distance, is_near) for each (x, y) row, with is_near's exact r test."""
+        pts = np.asarray(centroids_xy, dtype=np.float64).reshape(-1, 2)
+        if self._tree is None or not len(pts):
+            return np.full(len(pts), np.inf), np.zeros(len(pts), bool)
+        d, i = self._tree.query(pts)
+        j = self.points[i]
+        return d, (pts[:, 0] - j[:, 0])**2 + (pts[:, 1] - j[:, 1])**2 <= r*r
 
-def wire_hot_coverage(bbox: Tuple[int,int,int,int], skel: np.ndarray, hot_mask: np.ndarray,
-                      expand: int = 10) -> Tuple[float, int, int, float]:
+    def is_near(self, centroid_xy: Tuple[float,float], r: int = 8) -> bool:
+        _, i = self.nearest(centroid_xy)
+        if i < 0:
+            return False
+        # Re-test the squared distance exactly so the r boundary matches near_many.
+        cx, cy = centroid_xy
+        jx, jy = self.points[i]
+        return (cx - jx)**2 + (cy - jy)**2 <= r*r
+
+class CoverageIndex:
     """
-    Compute coverage of 'hot' along skeleton within an expanded bbox window.
-    Returns: (coverage_in_0_1, hot_len_px, wire_len_px, cool_frac_around)
+    Summed-area tables for wire-hot coverage, built once per image so every blob window
+    costs four lookups per quantity. The hot dilation and wire band are computed over the whole
+    image, so hot pixels just outside a window now count for skeleton pixels on its edge.
     """
-    H, W = skel.shape
-    x,y,w,h = bbox
-    x0 = max(0, x - expand); y0 = max(0, y - expand)
-    x1 = min(W, x + w + expand); y1 = min(H, y + h + expand)
+    def __init__(self, skel: np.ndarray, hot_mask: np.ndarray, wire_band: np.ndarray = None):
+        k3 = cv.getStructuringElement(cv.MORPH_RECT, (3,3))
+        skel_b = skel > 0
+        hot_b = hot_mask > 0
+        hot_d = cv.dilate(hot_b.astype(np.uint8), k3, iterations=1) > 0
+        band = (wire_band if wire_band is not None else cv.dilate(skel_b.astype(np.uint8), k3, iterations=1)) > 0
+        self.shape = skel.shape
+        self._wire = cv.integral(skel_b.astype(np.uint8))
+        self._hot = cv.integral((skel_b & hot_d).astype(np.uint8))
+        self._band = cv.integral(band.astype(np.uint8))
+        self._cool = cv.integral((band & ~hot_b).astype(np.uint8))
 
-    skel_roi = skel[y0:y1, x0:x1] > 0
-    hot_roi  = hot_mask[y0:y1, x0:x1] > 0
+    def _windows(self, bboxes: np.ndarray, expand: int) -> Tuple[np.ndarray, ...]:
+        H, W = self.shape
+        b = np.asarray(bboxes, dtype=np.int64).reshape(-1, 4)
+        x0 = np.clip(b[:,0] - expand, 0, W); y0 = np.clip(b[:,1] - expand, 0, H)
+        x1 = np.clip(b[:,0] + b[:,2] + expand, 0, W); y1 = np.clip(b[:,1] + b[:,3] + expand, 0, H)
+        return x0, y0, x1, y1
 
-    # hot skeleton = skeleton pixels that are also hot (dilate hot a bit to be tolerant)
-    k3 = cv.getStructuringElement(cv.MORPH_RECT, (3,3))
-    hot_roi_d = cv.dilate((hot_roi.astype(np.uint8))*255, k3, iterations=1) > 0
-
-    wire_len = int(skel_roi.sum())
-    hot_len  = int((skel_roi & hot_roi_d).sum())
-    coverage = (hot_len / wire_len) if wire_len > 0 else 0.0
-
-    # "rest-of-wire cool" measure: in a slim band, outside hot
-    band = cv.dilate((skel_roi.astype(np.uint8))*255, k3, iterations=1) > 0
-    cool_pixels = int((band & (~hot_roi)).sum())
-    total_band  = int(band.sum())
-    cool_frac = (cool_pixels / total_band) if total_band > 0 else 0.0
-    return float(coverage), hot_len, wire_len, float(cool_frac)
-
-# ---------- Enhanced rule-based classification ----------
-def classify_blob_enhanced(
-    b: Dict[str,Any],
-    dE_thr_fault=12.0,
-    dE_thr_pot=8.0,
-    skel: np.ndarray = None,
-    joints: List[Tuple[int,int]] = None,
-    hot_mask: np.ndarray = None
-) -> Tuple[str,str,float,float]:
-    """
-    Returns (label, subtype, confidence, severity)
-    subtype from: 'LooseJoint', 'PointOverload', 'FullWireOverload', 'None'
-    """
-    h,s,v = b['mean_hsv']
-    elong = b['elongation']
-    peak, mean = b['peak_deltaE'], b['mean_deltaE']
-
-    # color bands (OpenCV Hue 0..179)
-    is_red_or_orange = (h <= 10 or h >= 170 or (11 <= h <= 25))
-    is_yellowish     = (26 <= h <= 35)
-
-    # initial severity class (same as before)
-    faulty = is_red_or_orange and (peak >= dE_thr_fault)
-    potential = (is_yellowish and peak >= dE_thr_pot) or ((elong >= 3.0) and mean >= dE_thr_pot)
-
-    # Topology cues
-    near_joint = False
-    coverage = 0.0
-    cool_frac = 0.0
-
-    if skel is not None and hot_mask is not None and joints is not None:
-        near_joint = is_near_joint(b['centroid'], joints, r=8)
-        coverage, hot_len, wire_len, cool_frac = wire_hot_coverage(b['bbox'], skel, hot_mask, expand=10)
-
-    # Decide subtype
-    subtype = 'None'
-    label = 'Normal'
-
-    if near_joint:
-        subtype = 'LooseJoint'
-        if faulty:
-            label = 'Faulty'
-        elif potential:
-            label = 'Potentially Faulty'
-        else:
-            label = 'Normal'
-    else:
-        # On-wire scenario
-        # Define thresholds (tuneable)
-        FULL_COVER_THR = 0.60      # >=60% of local skeleton hot => FullWireOverload
-        POINT_COVER_THR = 0.25     # <25% coverage and rest cool => PointOverload
-        REST_COOL_THR = 0.60       # >=60% of band cool
-
-        if coverage >= FULL_COVER_THR:
-            subtype = 'FullWireOverload'
-            if faulty or potential:
-                # As per your doc, full wire is typically Potential
-                label = 'Potentially Faulty'
-            else:
-                label = 'Normal'
-        elif (coverage < POINT_COVER_THR and cool_frac >= REST_COOL_THR):
-            subtype = 'PointOverload'
-            if faulty:
-                label = 'Faulty'
-            elif potential:
-                label = 'Potentially Faulty'
-            else:
-                label = 'Normal'
-        else:
-            # Ambiguous middle case: prefer PointOverload (Potential) when there is some change
-            subtype = 'PointOverload' if (faulty or potential) else 'None'
-            if faulty:
-                label = 'Faulty'
-            elif potential:
-                label = 'Potentially Faulty'
-            else:
-                label = 'Normal'
-
-    # Confidence & severity (reuse your ΔE-based scoring; add tiny bonus if topology decisive)
-    color_bonus = 0.15 if is_red_or_orange else (0.05 if is_yellowish else 0.0)
-    conf = 0.5 + 0.5 * np.tanh((peak - dE_thr_pot)/8.0) + color_bonus
-    # topology bonus
-    if subtype == 'FullWireOverload' and coverage >= 0.6:
-        conf += 0.07
-    if subtype == 'PointOverload' and coverage < 0.25 and cool_frac >= 0.6:
-        conf += 0.07
-    if subtype == 'LooseJoint' and near_joint:
-        conf += 0.05
-    conf = float(np.clip(conf, 0.0, 1.0))
-
-    sev  = float(np.clip((0.6*peak + 0.4*mean) + 0.005*b['area'], 0, 100))
-    return label, subtype, conf, sev
+    @staticmethod
+    def _sum(sat: np.ndarray, x0, y0, x1, y1) -> np.ndarray:
+        return sat[y1, x1] - sat[y0, x1] - sat[y1, x0] + sat[y0, x0]
+
+    def coverage_many(self, bboxes: np.ndarray, expand: int = 10) -> Tuple[np.ndarray, ...]:
+        """Arrays of (coverage, hot_len, wire_len, cool_frac) per bbox window grown by expand px."""
+        win = self._windows(bboxes, expand)
+        wire_len = self._sum(self._wire, *win)
+        hot_len = self._sum(self._hot, *win)
+        total_band = self._sum(self._band, *win)
+        cool_pixels = self._sum(self._cool, *win)
+        coverage = np.where(wire_len > 0, hot_len / np.maximum(wire_len, 1), 0.0)
+        cool_frac = np.where(total_band > 0, cool_pixels / np.maximum(total_band, 1), 0.0)
+        return coverage, hot_len, wire_len, cool_frac
+
+    def coverage(self, bbox: Tuple[int,int,int,int], expand: int = 10) -> Tuple[float, int, int, float]:
+        """coverage_many for a single bbox, as (coverage, hot_len, wire_len, cool_frac)."""
+        coverage, hot_len, wire_len, cool_frac = self.coverage_many([bbox], expand)
+        return float(coverage[0]), int(hot_len[0]), int(wire_len[0]), float(cool_frac[0])
+
+class WindowCoverage:
+    """
+    CoverageIndex answers without full-frame summed-area tables: each query builds one over
+    the expanded bbox plus a 1 px pad (the reach of its dilations), so results match a
+    CoverageIndex over the whole image. For large frames with few blobs.
+    """
+    def __init__(self, skel: np.ndarray, hot_mask: np.ndarray):
+        self.skel = skel
+        self.hot_mask = hot_mask
 
+    def coverage(self, bbox: Tuple[int,int,int,int], expand: int = 10) -> Tuple[float, int, int, float]:
+        H, W = self.skel.shape
+        x, y, w, h = bbox
+        pad = expand + 1
+        x0, y0 = max(0, x - pad), max(0, y - pad)
+        x1, y1 = min(W, x + w + pad), min(H, y + h + pad)
+        index = CoverageIndex(self.skel[y0:y1, x0:x1], self.hot_mask[y0:y1, x0:x1])
+        return index.coverage((x - x0, y - y0, w, h), expand)
+
+    def coverage_many(self, bboxes: np.ndarray, expand: int = 10) -> Tuple[np.ndarray, ...]:
+        """CoverageIndex.coverage_many contract, one window per bbox."""
+        rows = [self.coverage(tuple(b), expand) for b in np.asarray(bboxes).reshape(-1, 4).tolist()]
+        return tuple(np.array(col) for col in zip(*rows)) if rows else tuple(np.zeros(0) for _ in range(4))
+
+TOPO_MARGIN = 16   # px around each blob bbox where lazy topology answers (>= coverage_expand + 1, joint_radius)
+TOPO_HALO = 16     # extra context for Canny / thinning so the window edge does not cut wires short
+
+def lazy_wire_topology(img_bgr: np.ndarray, hot_mask: np.ndarray, bboxes: List[Tuple[int,int,int,int]],
+                       margin: int = TOPO_MARGIN, halo: int = TOPO_HALO) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    build_wire_skeleton and skeleton joints only in windows of margin px around the given
+    bboxes (overlapping windows merged), each computed with a further halo of context.
+    Returns (skel, joints, input_pixels): a full-frame skeleton that is zero outside the
+    windows, (N,2) int32 (x, y) joints inside them, and the pixels skeletonized. Coverage and
+    joint queries that stay within the windows see what the full-frame skeleton would show,
+    except where Canny hysteresis or thinning reach further than the halo.
+    """
+    H, W = hot_mask.shape
+    skel = np.zeros((H, W), np.uint8)
+    joints = [np.zeros((0, 2), np.int32)]
+    input_pixels = 0
+    windows = merge_windows([(max(0, x - margin), max(0, y - margin), min(W, x + w + margin), min(H, y + h + margin))
+                             for x, y, w, h in bboxes])
+    for x0, y0, x1, y1 in windows:
+        ex0, ey0, ex1, ey1 = max(0, x0 - halo), max(0, y0 - halo), min(W, x1 + halo), min(H, y1 + halo)
+        s, _ = build_wire_skeleton(img_bgr[ey0:ey1, ex0:ex1], hot_mask[ey0:ey1, ex0:ex1])
+        input_pixels += s.size
+        skel[y0:y1, x0:x1] = s[y0 - ey0:y1 - ey0, x0 - ex0:x1 - ex0]
+        # Skeletons cut at the halo's edge end there: keep only joints inside the window proper
+        pts = np.concatenate(find_skeleton_node_arrays(s)) + np.array([ex0, ey0], np.int32)
+        inside = (pts[:, 0] >= x0) & (pts[:, 0] < x1) & (pts[:, 1] >= y0) & (pts[:, 1] < y1)
+        joints.append(pts[inside])
+    return skel, np.concatenate(joints), input_pixels
+
+# ---------- Report summary and serialization ----------
 def summarize_image(blobs: List[BlobDet]) -> str:
     if any(b.classification == 'Faulty' for b in blobs): return 'Faulty'
     if any(b.classification == 'Potentially Faulty' for b in blobs): return 'Potentially Faulty'
     return 'Normal'
 
+def report_to_dict(rep: DetectionReport) -> Dict[str,Any]:
+    """JSON-ready form of a DetectionReport (the layout written to out_json_path)."""
+    return {
+        **{k:v for k,v in asdict(rep).items() if k!='blobs'},
+        "blobs": [asdict(b) for b in rep.blobs]
+    }
+
+def report_from_dict(d: Dict[str,Any]) -> DetectionReport:
+    """Inverse of report_to_dict (JSON lists back to the tuple fields)."""
+    blobs = [BlobDet(**{**b, 'bbox': tuple(b['bbox']), 'centroid': tuple(b['centroid']),
+                        'mean_hsv': tuple(b['mean_hsv'])}) for b in d['blobs']]
+    return DetectionReport(**{**d, 'blobs': blobs})
+
 def overlay_detections(img_bgr: np.ndarray, blobs: List[BlobDet]) -> np.ndarray:
     out = img_bgr.copy()
     for b in blobs:
@@ -339,101 +766,1281 @@ def overlay_detections(img_bgr: np.ndarray, blobs: List[BlobDet]) -> np.ndarray:
         cv.putText(out, label, (x, max(0,y-5)), cv.FONT_HERSHEY_SIMPLEX, 0.45, color, 1, cv.LINE_AA)
     return out
 
-# ---------- Main entry ----------
-def detect_anomalies(transformer_id: str, baseline_path: str, maintenance_path: str,
-                     out_overlay_path: str, out_json_path: str) -> DetectionReport:
+# ---------- Baseline artifact cache ----------
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
 
-    base_bgr = read_bgr(baseline_path)
-    ment_bgr = read_bgr(maintenance_path)
+def image_key(data: Union[bytes, np.ndarray]) -> str:
+    """content_hash of encoded bytes; decoded arrays are keyed by their shape and pixels."""
+    if not isinstance(data, np.ndarray):
+        return content_hash(data)
+    data = np.ascontiguousarray(data)
+    h = hashlib.sha256(str(data.shape).encode())
+    h.update(data)
+    return h.hexdigest()
 
-    # Align maintenance to baseline (gray)
-    base_gray = to_gray(base_bgr)
-    ment_gray = to_gray(ment_bgr)
-    warp, ment_aligned_gray, ok, score = ecc_align(base_gray, ment_gray)
+class ByteLRU:
+    """Thread-safe LRU map bounded by the total byte size of its values."""
+    def __init__(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
 
-    # Apply the SAME warp to color for consistent SSIM/ΔE geometry
-    H, W = base_gray.shape
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: str) -> bool:
+        """Membership without touching the LRU order or the hit/miss counters."""
+        return key in self._items
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: str, value: Any, nbytes: int) -> None:
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            if nbytes > self.max_bytes:
+                return  # never cache something that would evict everything else
+            self._items[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, n) = self._items.popitem(last=False)
+                self.nbytes -= n
+
+def trim_cache_dir(cache_dir: str, max_bytes: int, suffixes: Tuple[str, ...]) -> None:
+    """
+    LRU eviction for an on-disk cache tier: an entry is the files <key><suffix>, its recency
+    their newest mtime (callers touch a file on every hit). Deletes the least recently used
+    entries until the directory fits max_bytes, files in suffix order (list the file whose
+    presence marks a complete entry first).
+    """
+    entries: Dict[str, List[float]] = {}
+    for name in os.listdir(cache_dir):
+        key, ext = os.path.splitext(name)
+        if ext not in suffixes:
+            continue
+        try:
+            st = os.stat(os.path.join(cache_dir, name))
+        except OSError:
+            continue   # removed by another process
+        e = entries.setdefault(key, [0.0, 0])
+        e[0], e[1] = max(e[0], st.st_mtime), e[1] + st.st_size
+    total = sum(e[1] for e in entries.values())
+    for key, (_, size) in sorted(entries.items(), key=lambda kv: kv[1][0]):
+        if total <= max_bytes:
+            break
+        for ext in suffixes:
+            try:
+                os.remove(os.path.join(cache_dir, key + ext))
+            except OSError:
+                pass
+        total -= size
+
+@dataclass
+class BaselineArtifacts:
+    key: str                       # content hash of the encoded baseline image
+    gray: np.ndarray
+    lab: np.ndarray
+    keypoints: np.ndarray          # (N,7) float32: x, y, size, angle, response, octave, class_id
+    descriptors: Optional[np.ndarray]
+    pyramid: Optional[List[np.ndarray]]  # gray pyramid, level 0 = full resolution (None: not built)
+    _features: Optional[Tuple[List[cv.KeyPoint], Optional[np.ndarray]]] = field(default=None, repr=False,
+                                                                                compare=False)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.gray, self.lab, self.keypoints, *self.pyramid[1:]]
+        if self.descriptors is not None:
+            arrays.append(self.descriptors)
+        return sum(a.nbytes for a in arrays)
+
+    def features(self) -> Tuple[List[cv.KeyPoint], Optional[np.ndarray]]:
+        """ORB (keypoints, descriptors) in the form detectAndCompute returns them (built once)."""
+        if self._features is None:
+            kps = [cv.KeyPoint(float(x), float(y), float(s), float(a), float(r), int(o), int(c))
+                   for x, y, s, a, r, o, c in self.keypoints]
+            self._features = (kps, self.descriptors)
+        return self._features
+
+def gray_pyramid(gray: np.ndarray, levels: int = 4, min_side: int = 64) -> List[np.ndarray]:
+    """Gaussian pyramid, level 0 = input; stops early once a level would drop below min_side."""
+    pyr = [gray]
+    while len(pyr) < levels and min(pyr[-1].shape[:2]) // 2 >= min_side:
+        pyr.append(cv.pyrDown(pyr[-1]))
+    return pyr
+
+def build_baseline_artifacts(img_bgr: np.ndarray, key: str = "") -> BaselineArtifacts:
+    gray = to_gray(img_bgr)
+    lab, _ = lab_and_hsv(img_bgr)
+    kps, des = cv.ORB_create(ORB_FEATURES).detectAndCompute(gray, None)
+    kp_arr = np.array([(k.pt[0], k.pt[1], k.size, k.angle, k.response, k.octave, k.class_id) for k in kps],
+                      dtype=np.float32).reshape(-1, 7)
+    return BaselineArtifacts(key=key, gray=gray, lab=lab, keypoints=kp_arr, descriptors=des,
+                             pyramid=gray_pyramid(gray))
+
+class BaselineCache:
+    """
+    Preprocessed baseline images (gray, LAB, ORB features, pyramid) keyed by content hash.
+    In-memory LRU bounded by max_bytes, backed by an optional on-disk tier of compressed .npz
+    files bounded by disk_max_bytes, least recently used evicted first. LAB is stored at full
+    float64 precision, so a baseline served from disk gives the same ΔE as a freshly built one.
+    """
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, cache_dir: Optional[str] = None,
+                 disk_max_bytes: int = 1024 * 1024 * 1024):
+        self.memory = ByteLRU(max_bytes)
+        self.cache_dir = cache_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_hits = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _load_disk(self, key: str) -> Optional[BaselineArtifacts]:
+        if not self.cache_dir or not os.path.exists(self._disk_path(key)):
+            return None
+        try:
+            with np.load(self._disk_path(key), allow_pickle=False) as z:
+                des = z["descriptors"] if z["descriptors"].size else None
+                gray = z["gray"]
+                pyr = [gray] + [z[f"pyr{i}"] for i in range(1, int(z["n_pyr"]))]
+                if z["lab"].dtype != np.float64:
+                    return None   # float32 LAB written by an older version: rebuild
+                art = BaselineArtifacts(key=key, gray=gray, lab=z["lab"],
+                                        keypoints=z["keypoints"], descriptors=des, pyramid=pyr)
+            os.utime(self._disk_path(key))   # mtime orders the disk tier's LRU eviction
+            return art
+        except (OSError, ValueError, KeyError):
+            return None  # corrupt/partial entry: rebuild
+
+    def _save_disk(self, art: BaselineArtifacts) -> None:
+        if not self.cache_dir:
+            return
+        tmp = self._disk_path(art.key) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, gray=art.gray, lab=art.lab, keypoints=art.keypoints,
+                                descriptors=art.descriptors if art.descriptors is not None else np.zeros((0, 32), np.uint8),
+                                n_pyr=len(art.pyramid), **{f"pyr{i}": p for i, p in enumerate(art.pyramid) if i > 0})
+        os.replace(tmp, self._disk_path(art.key))  # atomic: readers never see a partial file
+        trim_cache_dir(self.cache_dir, self.disk_max_bytes, (".npz",))
+
+    def get(self, data: Union[bytes, np.ndarray]) -> BaselineArtifacts:
+        """
+        Artifacts for an encoded baseline image, building and storing them on a miss.
+        A decoded BGR array is also accepted (keyed by its shape and pixels).
+        """
+        key = image_key(data)
+        art = self.memory.get(key)
+        if art is not None:
+            return art
+        art = self._load_disk(key)
+        if art is not None:
+            self.disk_hits += 1
+        else:
+            art = build_baseline_artifacts(load_bgr(data), key)
+            self._save_disk(art)
+        self.memory.put(key, art, art.nbytes)
+        return art
+
+    def stats(self) -> Dict[str, int]:
+        return dict(entries=len(self.memory), bytes=self.memory.nbytes, max_bytes=self.memory.max_bytes,
+                    hits=self.memory.hits, misses=self.memory.misses, disk_hits=self.disk_hits)
+
+# ---------- Result cache ----------
+# Part of every ResultCache key: bump whenever detection output changes for the same inputs
+# (thresholds, classification rules, overlay drawing), so stale entries are never served.
+PIPELINE_VERSION = "5"
+
+class ResultCache:
+    """
+    Finished detections (report JSON + overlay PNG) keyed by both images' content hashes, the
+    pipeline version and the result-affecting parameters. In-memory LRU bounded by max_bytes,
+    backed by an optional on-disk tier (<key>.png + <key>.json) bounded by disk_max_bytes,
+    least recently used evicted first.
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, cache_dir: Optional[str] = None,
+                 disk_max_bytes: int = 512 * 1024 * 1024):
+        self.memory = ByteLRU(max_bytes)
+        self.cache_dir = cache_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_hits = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(baseline_key: str, maintenance_key: str, params: Dict[str,Any]) -> str:
+        blob = json.dumps([PIPELINE_VERSION, baseline_key, maintenance_key, params], sort_keys=True, default=str)
+        return content_hash(blob.encode())
+
+    def _disk_paths(self, key: str) -> Tuple[str, str]:
+        return os.path.join(self.cache_dir, f"{key}.json"), os.path.join(self.cache_dir, f"{key}.png")
+
+    def _load_disk(self, key: str) -> Optional[Tuple[str, bytes]]:
+        if not self.cache_dir:
+            return None
+        json_path, png_path = self._disk_paths(key)
+        try:
+            with open(json_path) as f:
+                text = f.read()
+            with open(png_path, "rb") as f:
+                png = f.read()
+            os.utime(json_path)   # mtime orders the disk tier's LRU eviction
+            return text, png
+        except OSError:
+            return None
+
+    def _save_disk(self, key: str, text: str, png: bytes) -> None:
+        if not self.cache_dir:
+            return
+        json_path, png_path = self._disk_paths(key)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        # PNG first: a readable .json means the entry is complete
+        for path, data, mode in ((png_path, png, "wb"), (json_path, text, "w")):
+            with open(path + suffix, mode) as f:
+                f.write(data)
+            os.replace(path + suffix, path)
+        trim_cache_dir(self.cache_dir, self.disk_max_bytes, (".json", ".png"))
+
+    def __contains__(self, key: str) -> bool:
+        """Whether get(key) would hit (memory or disk), without loading the entry."""
+        return key in self.memory or (bool(self.cache_dir) and os.path.exists(self._disk_paths(key)[0]))
+
+    def get(self, key: str) -> Optional[Tuple[DetectionReport, bytes]]:
+        """(report, overlay PNG) or None. Each hit returns a fresh report the caller may modify."""
+        entry = self.memory.get(key)
+        if entry is None:
+            entry = self._load_disk(key)
+            if entry is None:
+                return None
+            self.disk_hits += 1
+            self.memory.put(key, entry, len(entry[0]) + len(entry[1]))
+        return report_from_dict(json.loads(entry[0])), entry[1]
+
+    def put(self, key: str, rep: DetectionReport, png: bytes) -> None:
+        d = report_to_dict(rep)
+        d['instrumentation'] = None   # describes the run that filled the cache, not later hits
+        text = json.dumps(d)
+        self.memory.put(key, (text, png), len(text) + len(png))
+        self._save_disk(key, text, png)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(entries=len(self.memory), bytes=self.memory.nbytes, max_bytes=self.memory.max_bytes,
+                    hits=self.memory.hits, misses=self.memory.misses, disk_hits=self.disk_hits)
+
+# ---------- No-change pre-screen (fast path) ----------
+PRESCREEN_STRIDE = 2      # ΔE is sampled on every stride-th pixel in both directions
+PRESCREEN_MARGIN = 0.75   # a peak may fall between samples, so candidates start at t_pot * this
+
+def prescreen_no_change(base_lab: np.ndarray, ment_aligned_bgr: np.ndarray, t_pot: float,
+                        hot_ranges=HOT_RANGES, stride: int = PRESCREEN_STRIDE,
+                        margin: float = PRESCREEN_MARGIN, roi: np.ndarray = None) -> Dict[str,Any]:
+    """
+    Cheap "no new hot region" test: exact ΔE2000 on a stride-decimated pixel grid (decimation,
+    unlike resizing, commutes with the LAB conversion), only where the sampled maintenance
+    pixel or a sampled neighbour is hot-coloured. Clear means no sample is a candidate
+    (ΔE >= margin * t_pot). There is deliberately no speckle opening on the grid: a 3 px line
+    survives morphology_clean's 3x3 opening but can be a single grid row thick.
+    Returns clear, hot_pixels, candidate_pixels and max_deltaE (counts on the grid).
+    roi: optional 0/255 mask (same size as the image); hot pixels outside it are ignored.
+    """
+    lab, hsv = lab_and_hsv(np.ascontiguousarray(ment_aligned_bgr[::stride, ::stride]))
+    hot = hot_color_mask(hsv, hot_ranges)
+    if roi is not None:
+        cv.bitwise_and(hot, np.ascontiguousarray(roi[::stride, ::stride]), dst=hot)
+    hot = cv.dilate(hot, None) > 0
+    n_hot = int(np.count_nonzero(hot))
+    dE = np.zeros(1)
+    if n_hot:
+        dE = deltaE_ciede2000(base_lab[::stride, ::stride][hot], lab[hot])
+    candidates = int(np.count_nonzero(dE >= margin * t_pot)) if n_hot else 0
+    return dict(clear=candidates == 0, hot_pixels=n_hot, candidate_pixels=candidates,
+                max_deltaE=float(dE.max()))
+
+# ---------- Region of interest (per-transformer equipment area) ----------
+ROI_PAD = 8   # px kept around the ROI bbox, so Canny / morphology at its edge see real neighbours
+
+def roi_polygons(roi) -> List[np.ndarray]:
+    """ROI as int32 (N,2) polygons: one polygon [[x, y], ...] or a list of them, in baseline px."""
+    try:
+        polys = [roi] if np.ndim(roi[0]) == 1 else list(roi)
+        polys = [np.asarray(p, np.float64) for p in polys]
+    except (TypeError, ValueError, IndexError) as e:
+        raise ValueError(f"Invalid ROI: {e}")
+    if not polys or any(p.ndim != 2 or p.shape[1] != 2 or len(p) < 3 for p in polys):
+        raise ValueError("ROI polygons need at least 3 [x, y] points each")
+    return [np.round(p).astype(np.int32) for p in polys]
+
+def roi_mask(roi, shape: Tuple[int,int]) -> np.ndarray:
+    """0/255 uint8 mask of the ROI polygons for an image of shape (H, W)."""
+    mask = np.zeros(shape[:2], np.uint8)
+    cv.fillPoly(mask, roi_polygons(roi), 255)
+    return mask
+
+def roi_window(mask: np.ndarray, pad: int = ROI_PAD) -> Tuple[int,int,int,int]:
+    """(x0, y0, x1, y1): the mask's bounding box grown by pad px, clipped to the image."""
+    x, y, w, h = cv.boundingRect(mask)
+    if w == 0 or h == 0:
+        raise ValueError("ROI does not overlap the image")
+    H, W = mask.shape
+    return max(0, x - pad), max(0, y - pad), min(W, x + w + pad), min(H, y + h + pad)
+
+# ---------- Main entry ----------
+def warp_color(ment_bgr: np.ndarray, warp: np.ndarray, size_wh: Tuple[int,int]) -> Tuple[np.ndarray, str]:
+    """Apply an ecc_align-style warp to the colour image. Returns (aligned_bgr, warp_model)."""
+    if warp.shape == (2,3) and ment_bgr.shape[1::-1] == tuple(size_wh) and np.array_equal(warp, np.eye(2, 3)):
+        return ment_bgr, 'affine'   # identity (e.g. a cascade tripod shot): nothing to resample
     if warp.shape == (3,3):  # homography case
-        ment_aligned_bgr = cv.warpPerspective(
-            ment_bgr, warp, (W, H),
-            flags=cv.INTER_LINEAR + cv.WARP_INVERSE_MAP
-        )
-        warp_model = 'homography'
-    elif warp.shape == (2,3):  # affine case
-        ment_aligned_bgr = cv.warpAffine(
-            ment_bgr, warp, (W, H),
-            flags=cv.INTER_LINEAR + cv.WARP_INVERSE_MAP
-        )
-        warp_model = 'affine'
-    else:
-        raise ValueError("Unexpected warp shape")
+        return cv.warpPerspective(ment_bgr, warp, size_wh, flags=cv.INTER_LINEAR + cv.WARP_INVERSE_MAP), 'homography'
+    if warp.shape == (2,3):  # affine case
+        return cv.warpAffine(ment_bgr, warp, size_wh, flags=cv.INTER_LINEAR + cv.WARP_INVERSE_MAP), 'affine'
+    raise ValueError("Unexpected warp shape")
 
-    # SSIM sanity (structure similarity)
-    mean_ssim, _ = ssim(base_gray, ment_aligned_gray, full=True, data_range=255)
+def scale_warp(warp: np.ndarray, scale: float) -> np.ndarray:
+    """Convert a warp estimated on images resized by `scale` into full-resolution coordinates."""
+    if warp.shape == (2,3):
+        out = warp.copy()
+        out[:, 2] /= scale
+        return out
+    S = np.diag([scale, scale, 1.0]).astype(np.float64)
+    return (np.linalg.inv(S) @ warp.astype(np.float64) @ S).astype(np.float32)
 
-    # Convert to LAB/HSV
-    base_lab, _ = lab_and_hsv(base_bgr)
-    ment_lab, ment_hsv = lab_and_hsv(ment_aligned_bgr)
-
-    # ΔE2000 map
-    dE = deltaE_map(base_lab, ment_lab)
-
-    # Hot color gating + ΔE threshold (adaptive to SSIM)
-    t_pot  = 8.0  if mean_ssim >= 0.70 else 10.0
-    t_fault = 12.0 if mean_ssim >= 0.70 else 14.0
-    mask_hot = hot_color_mask(ment_hsv)
-    mask_delta = (dE >= t_pot).astype(np.uint8)*255
-    mask = cv.bitwise_and(mask_hot, mask_delta)
+def ssim_thresholds(mean_ssim: float, params: DetectionParams = None) -> Tuple[float, float]:
+    """ΔE thresholds (t_pot, t_fault), relaxed when the pair is structurally dissimilar."""
+    params = params if params is not None else DEFAULT_PARAMS
+    if mean_ssim >= params.ssim_split:
+        return params.t_pot, params.t_fault
+    return params.t_pot_relaxed, params.t_fault_relaxed
+
+def classify_table(table: np.ndarray, t_pot: float, t_fault: float, joint_index: JointIndex,
+                   coverage_index, params: DetectionParams = None) -> np.ndarray:
+    """
+    Rule-based classification (colour band, ΔE, elongation and wire/joint topology) of every row
+    at once (one KD-tree query and one coverage_many call per image). Fills classification,
+    subtype, confidence, severity and joint_dist of table in place and returns it.
+    """
+    params = params if params is not None else DEFAULT_PARAMS
+    h = table['mean_hsv'][:, 0]
+    peak, mean = table['peak_deltaE'], table['mean_deltaE']
+    red_or_orange = (h <= 10) | (h >= 170) | ((h >= 11) & (h <= 25))
+    yellowish = (h >= 26) & (h <= 35)
+    faulty = red_or_orange & (peak >= t_fault)
+    potential = (yellowish & (peak >= t_pot)) | ((table['elongation'] >= params.elong_thr) & (mean >= t_pot))
+    changed = faulty | potential
+
+    joint_dist, near = joint_index.near_many(table['centroid'], r=params.joint_radius)
+    coverage, _, _, cool_frac = coverage_index.coverage_many(table['bbox'], expand=params.coverage_expand)
+    full = ~near & (coverage >= params.full_cover_thr)
+    point = ~near & ~full & (coverage < params.point_cover_thr) & (cool_frac >= params.rest_cool_thr)
+
+    # Subtype: joint first, then on-wire coverage; ambiguous blobs with some change are PointOverload
+    table['subtype'] = np.select([near, full, point | changed], [1, 3, 2], 0)
+    label = np.where(faulty, 2, np.where(potential, 1, 0))
+    table['classification'] = np.where(full, np.where(changed, 1, 0), label)
+
+    conf = 0.5 + 0.5 * np.tanh((peak - t_pot) / 8.0) + np.where(red_or_orange, 0.15, np.where(yellowish, 0.05, 0.0))
+    conf += np.where(full | point, 0.07, np.where(near, 0.05, 0.0))   # decisive topology bonus
+    table['confidence'] = np.clip(conf, 0.0, 1.0)
+    table['severity'] = np.clip((0.6 * peak + 0.4 * mean) + 0.005 * table['area'], 0, 100)
+    table['joint_dist'] = joint_dist
+    return table
+
+def detect_blobs(base_lab: np.ndarray, ment_lab: np.ndarray, ment_hsv: np.ndarray, ment_aligned_bgr: np.ndarray,
+                 t_pot: float, t_fault: float, gate_deltaE: bool = True,
+                 timer: StageTimer = None, counts: Dict[str,int] = None, lean: bool = False,
+                 params: DetectionParams = None, intermediates: Dict[str,Any] = None,
+                 roi: np.ndarray = None, lazy_topology: bool = False) -> List[BlobDet]:
+    """
+    ΔE + hot-colour masking, wire topology and blob classification on aligned images
+    (whole frames or matching crops). roi: optional 0/255 mask of the same size; hot pixels
+    outside it are ignored (so no ΔE is computed there). counts, if given, receives deltaE_pixels,
+    skeleton_pixels, joints and components. lean=True computes ΔE in DELTAE_CHUNK slices.
+    params: hot-colour ranges and classification constants (t_pot/t_fault are passed in).
+    intermediates: if given, receives deltaE, deltaE_region (the gate, None if ungated),
+                   hsv, edges, skeleton and mask_digest for redetect().
+    lazy_topology: build the wire skeleton and joints only around the blobs (lazy_wire_topology)
+                   instead of over the whole image; no blobs, no skeleton. Full-frame topology
+                   is still used when intermediates are requested.
+    """
+    params = params if params is not None else DEFAULT_PARAMS
+    timer = timer if timer is not None else StageTimer()
+    H, W = ment_hsv.shape[:2]
+
+    # ΔE2000 map (optionally only around hot-coloured pixels; blob results are unchanged)
+    mask_hot = hot_color_mask(ment_hsv, params.hot_ranges)
+    if roi is not None:
+        cv.bitwise_and(mask_hot, roi, dst=mask_hot)
+    timer.mark('mask')
+    gate = deltaE_gate(mask_hot) if gate_deltaE else None
+    dE = deltaE_map(base_lab, ment_lab, gate=gate, chunk=DELTAE_CHUNK if lean else None)
+    timer.mark('deltaE')
+
+    # Hot color gating + ΔE threshold (adaptive to SSIM); cv.compare writes 0/255 uint8 directly
+    mask = cv.compare(dE, t_pot, cv.CMP_GE)
+    cv.bitwise_and(mask_hot, mask, dst=mask)
     mask = morphology_clean(mask)
+    timer.mark('mask')
+
+    if lazy_topology and intermediates is None:
+        blobs, component_counts, joint_index, skel, skel_input = _blobs_lazy_topology(
+            mask, dE, ment_hsv, ment_aligned_bgr, t_pot, t_fault, params, timer)
+    else:
+        # --- NEW: Build wire skeleton & joints from the aligned maintenance image ---
+        edges = wire_edges(ment_aligned_bgr)
+        skel, wire_band = build_wire_skeleton(None, mask, edges=edges)
+        skel_input = H * W
+        timer.mark('skeleton')
+        if intermediates is not None:
+            intermediates.update(deltaE=dE, deltaE_region=gate, hsv=ment_hsv, edges=edges, skeleton=skel,
+                                 mask_digest=content_hash(mask.tobytes()))
+        blobs, component_counts, joint_index = _blobs_from_mask(mask, dE, ment_hsv, skel, wire_band,
+                                                                 t_pot, t_fault, params, timer)
 
-    # --- NEW: Build wire skeleton & joints from the aligned maintenance image ---
-    skel, wire_band = build_wire_skeleton(ment_aligned_bgr, mask)
-    endpoints, junctions = find_skeleton_nodes(skel)
-    joints = endpoints + junctions  # treat both as "joint" candidates
+    if counts is not None:
+        counts['deltaE_pixels'] = counts.get('deltaE_pixels', 0) + (int(cv.countNonZero(gate)) if gate is not None else int(H * W))
+        counts['skeleton_input_pixels'] = counts.get('skeleton_input_pixels', 0) + int(skel_input)
+        counts['skeleton_pixels'] = counts.get('skeleton_pixels', 0) + int(cv.countNonZero(skel))
+        counts['joints'] = counts.get('joints', 0) + len(joint_index)
+        counts['components'] = counts.get('components', 0) + component_counts.get('components', 0)
+    return blobs
+
+def _blobs_from_mask(mask: np.ndarray, dE: np.ndarray, hsv: np.ndarray, skel: np.ndarray, wire_band: np.ndarray,
+                     t_pot: float, t_fault: float, params: DetectionParams,
+                     timer: StageTimer) -> Tuple[List[BlobDet], Dict[str,int], JointIndex]:
+    """Joints, coverage, blob statistics and classification once mask and skeleton exist."""
+    joint_index = JointIndex(np.concatenate(find_skeleton_node_arrays(skel)))  # endpoints and junctions
+    coverage_index = CoverageIndex(skel, mask, wire_band)
+    timer.mark('nodes')
 
     # Blob analysis
-    props = blob_props(mask, dE, ment_hsv)
-    blobs: List[BlobDet] = []
-    for p in props:
-        cls, subtype, conf, sev = classify_blob_enhanced(
-            p, dE_thr_fault=t_fault, dE_thr_pot=t_pot,
-            skel=skel, joints=joints, hot_mask=mask
-        )
-        blobs.append(BlobDet(label=p['label'], bbox=p['bbox'], area=p['area'],
-                             centroid=p['centroid'], mean_deltaE=p['mean_deltaE'], peak_deltaE=p['peak_deltaE'],
-                             mean_hsv=p['mean_hsv'], elongation=p['elongation'],
-                             classification=cls, subtype=subtype, confidence=conf, severity=sev))
+    component_counts: Dict[str,int] = {}
+    table = blob_table(mask, dE, hsv, counts=component_counts)
+    timer.mark('blob_props')
+    blobs = blobs_from_table(classify_table(table, t_pot, t_fault, joint_index, coverage_index, params))
+    timer.mark('classify')
+    return blobs, component_counts, joint_index
+
+def _blobs_lazy_topology(mask: np.ndarray, dE: np.ndarray, hsv: np.ndarray, img_bgr: np.ndarray,
+                         t_pot: float, t_fault: float, params: DetectionParams, timer: StageTimer
+                         ) -> Tuple[List[BlobDet], Dict[str,int], JointIndex, np.ndarray, int]:
+    """_blobs_from_mask with blob statistics first and topology only in windows around the blobs."""
+    component_counts: Dict[str,int] = {}
+    table = blob_table(mask, dE, hsv, counts=component_counts)
+    timer.mark('blob_props')
+    margin = max(TOPO_MARGIN, params.coverage_expand + 1, params.joint_radius)
+    skel, joints, input_pixels = lazy_wire_topology(img_bgr, mask, table['bbox'].tolist(), margin=margin)
+    timer.mark('skeleton')
+    joint_index = JointIndex(joints)
+    coverage_index = WindowCoverage(skel, mask)
+    timer.mark('nodes')
+    blobs = blobs_from_table(classify_table(table, t_pot, t_fault, joint_index, coverage_index, params))
+    timer.mark('classify')
+    return blobs, component_counts, joint_index, skel, input_pixels
 
-    # Image-level summary & outputs
+def _cached_baseline(baseline_cache: BaselineCache, baseline: ImageSource) -> BaselineArtifacts:
+    return baseline_cache.get(read_bytes(baseline) if isinstance(baseline, str) else baseline)
+
+def _load_pair(baseline: ImageSource, maintenance: ImageSource,
+               baseline_cache: Optional[BaselineCache], lean: bool = False) -> Tuple[Any, np.ndarray]:
+    """(baseline artifacts, maintenance BGR). Artifacts are BaselineArtifacts-like (gray, lab, ...)."""
+    if baseline_cache is not None:
+        base = _cached_baseline(baseline_cache, baseline)
+    else:
+        base_bgr = load_bgr(baseline)
+        base_gray = to_gray(base_bgr)
+        base_lab, _ = lab_and_hsv(base_bgr, lean=lean)
+        del base_bgr
+        base = BaselineArtifacts(key="", gray=base_gray, lab=base_lab, keypoints=np.zeros((0,7), np.float32),
+                                 descriptors=None, pyramid=None)
+    return base, load_bgr(maintenance)
+
+def _finish(transformer_id: str, baseline: ImageSource, maintenance: ImageSource,
+            out_overlay_path: Optional[str], out_json_path: Optional[str], ment_aligned_bgr: np.ndarray,
+            warp_model: str, ok: bool, score: float, mean_ssim: float, blobs: List[BlobDet],
+            timer: StageTimer, instrumentation: Optional[Dict[str,Any]],
+            outputs: Optional[Dict[str,Any]] = None, fast_path: bool = False) -> DetectionReport:
+    # Image-level summary & outputs (files only for the paths given; PNG bytes into outputs)
     image_label = summarize_image(blobs)
     overlay = overlay_detections(ment_aligned_bgr, blobs)
-    cv.imwrite(out_overlay_path, overlay)
+    if out_overlay_path:
+        cv.imwrite(out_overlay_path, overlay)
+    if outputs is not None:
+        outputs['overlay'] = cv.imencode('.png', overlay)[1].tobytes()
+    timer.mark('overlay')
 
     rep = DetectionReport(
         transformer_id=transformer_id,
-        baseline_path=baseline_path,
-        maintenance_path=maintenance_path,
+        baseline_path=source_name(baseline),
+        maintenance_path=source_name(maintenance),
         warp_model=warp_model,
         warp_success=bool(ok),
         warp_score=float(score),
         mean_ssim=float(mean_ssim),
         image_level_label=image_label,
-        blobs=blobs
+        blobs=blobs,
+        fast_path=fast_path
     )
+    # Filled before the JSON write so it is part of the file; the json stage itself is
+    # still recorded in timer.times (shared with the report dict) afterwards.
+    rep.instrumentation = instrumentation
+
+    if out_json_path:
+        with open(out_json_path, "w") as f:
+            json.dump(report_to_dict(rep), f, indent=2)
+        timer.mark('json')
+    return rep
+
+def align_gray(base_gray: np.ndarray, ment_gray: np.ndarray, align: str, base_pyramid: List[np.ndarray] = None,
+               base_features: OrbFeatures = None) -> Tuple[np.ndarray, np.ndarray, bool, float, Optional[List[Dict[str,Any]]]]:
+    """(warp, aligned gray, ok, score, level/step stats or None) for align 'ecc' | 'pyramid' | 'cascade'."""
+    if align == 'cascade':
+        return align_cascade(base_gray, ment_gray, base_pyramid=base_pyramid, base_features=base_features)
+    if align == 'pyramid':
+        return ecc_align_pyramid(base_gray, ment_gray, base_pyramid=base_pyramid, base_features=base_features)
+    if align == 'ecc':
+        return (*ecc_align(base_gray, ment_gray, base_features=base_features), None)
+    raise ValueError(f"Unknown align mode: {align}")
+
+def _align_path(warp: np.ndarray, ok: bool, align: str, align_levels: List[Dict[str,Any]] = None) -> str:
+    if align == 'cascade' and align_levels:
+        accepted = [st['step'] for st in align_levels if st['accepted']]
+        return 'cascade_' + (accepted[0] if accepted else 'best')
+    if warp.shape == (3,3):
+        return 'orb_homography'
+    if not ok:
+        return 'identity'
+    return 'ecc_pyramid' if align == 'pyramid' else 'ecc'
+
+def detect_anomalies(transformer_id: str, baseline_path: ImageSource, maintenance_path: ImageSource,
+                     out_overlay_path: Optional[str], out_json_path: Optional[str], gate_deltaE: bool = True,
+                     baseline_cache: BaselineCache = None, align: str = 'ecc',
+                     timings: Dict[str,float] = None, instrument: bool = False,
+                     lean: bool = False, tile_size: int = None, tile_workers: int = 1,
+                     outputs: Dict[str,Any] = None, params: DetectionParams = None,
+                     intermediates: Dict[str,Any] = None, prescreen: bool = False,
+                     roi=None, lazy_topology: bool = False) -> DetectionReport:
+    """
+    baseline_path / maintenance_path: file paths, encoded image bytes or BGR arrays.
+    out_overlay_path / out_json_path: files to write; None skips that write.
+    outputs: if given, receives 'overlay' (the annotated image as PNG bytes).
+    params: ΔE thresholds, hot-colour ranges and classification constants (default DEFAULT_PARAMS).
+    intermediates: if given, receives what redetect() needs to re-run masking and classification
+                   with other params (see save_intermediates). Not filled in tiled mode.
+    align: 'ecc' (full-resolution ECC, ORB fallback), 'pyramid' (coarse-to-fine ECC) or 'cascade'
+           (identity / phase correlation / pyramid ECC / ORB, stopping at the first good warp;
+           see AlignCascade).
+    timings: if given, filled with wall seconds per stage (decode, align, ssim, lab, deltaE,
+             mask, skeleton, nodes, blob_props, classify, overlay, json).
+    instrument: attach timings, alignment path, pixel and component counts to the report
+                (and its JSON) as `instrumentation`.
+    lean: memory-lean mode - float32 LAB, chunked ΔE and early release of intermediates.
+          ΔE values shift by ~1e-4, so a blob sitting exactly on a threshold may flip.
+    tile_size: run the per-pixel stages in tiles of this size (see detect_anomalies_tiled).
+    prescreen: after alignment, run prescreen_no_change; if the maintenance image clearly has no
+               new hot region, return a Normal report with fast_path=True and the aligned image,
+               un-annotated, as overlay. Full-resolution SSIM, LAB, ΔE, skeleton and blob stages
+               are skipped (mean_ssim is then measured on the pre-screen's decimated grid).
+               Not used in tiled mode or when intermediates are requested.
+    roi: region of interest in baseline pixels, one polygon [[x, y], ...] or a list of them
+         (see roi_polygons). Alignment still uses the whole frame; SSIM and every later stage
+         run on the ROI's bounding box only, hot pixels outside the polygons are ignored, and
+         blobs are mapped back to full-frame coordinates. The overlay is the full frame.
+    lazy_topology: wire skeleton and joints only around detected blobs (see detect_blobs).
+                   Tiled mode already works per tile and ignores it.
+    """
+    if tile_size:
+        return detect_anomalies_tiled(transformer_id, baseline_path, maintenance_path, out_overlay_path,
+                                      out_json_path, gate_deltaE=gate_deltaE, baseline_cache=baseline_cache,
+                                      align=align, timings=timings, instrument=instrument, lean=lean,
+                                      tile_size=tile_size, tile_workers=tile_workers, outputs=outputs,
+                                      params=params, roi=roi)
+    timer = StageTimer(timings)
+
+    # Baseline gray/LAB/ORB come from the cache when one is supplied
+    base, ment_bgr = _load_pair(baseline_path, maintenance_path, baseline_cache, lean=lean)
+    base_gray, base_lab = base.gray, base.lab
+    base_features = base.features if baseline_cache is not None else None   # unpacked only if ORB runs
+    timer.mark('decode')
+
+    # Align maintenance to baseline (gray)
+    ment_gray = to_gray(ment_bgr)
+    warp, ment_aligned_gray, ok, score, align_levels = align_gray(base_gray, ment_gray, align, base.pyramid, base_features)
+
+    # Apply the SAME warp to color for consistent SSIM/ΔE geometry
+    H, W = base_gray.shape
+    ment_aligned_bgr, warp_model = warp_color(ment_bgr, warp, (W, H))
+    del ment_bgr, ment_gray
+    timer.mark('align')
 
-    with open(out_json_path, "w") as f:
-        json.dump({
-            **{k:v for k,v in asdict(rep).items() if k!='blobs'},
-            "blobs": [asdict(b) for b in blobs]
-        }, f, indent=2)
+    # From here on only the ROI's bounding box is processed; blobs are shifted back at the end
+    frame_bgr, x0, y0, roi_m = ment_aligned_bgr, 0, 0, None
+    if roi is not None:
+        roi_m = roi_mask(roi, (H, W))
+        x0, y0, x1, y1 = roi_window(roi_m)
+        roi_m = roi_m[y0:y1, x0:x1]
+        base_gray, base_lab = base_gray[y0:y1, x0:x1], base_lab[y0:y1, x0:x1]
+        ment_aligned_gray, ment_aligned_bgr = ment_aligned_gray[y0:y1, x0:x1], ment_aligned_bgr[y0:y1, x0:x1]
+        timer.mark('roi')
 
+    screen = None
+    if prescreen and intermediates is None:
+        # Before SSIM, so screen against the stricter of the two threshold regimes
+        p = params if params is not None else DEFAULT_PARAMS
+        screen = prescreen_no_change(base_lab, ment_aligned_bgr, min(p.t_pot, p.t_pot_relaxed), p.hot_ranges,
+                                     roi=roi_m)
+        timer.mark('prescreen')
+        if screen['clear']:
+            s = PRESCREEN_STRIDE
+            mean_ssim = ssim(base_gray[::s, ::s], ment_aligned_gray[::s, ::s], data_range=255)
+            timer.mark('ssim')
+            instrumentation = None
+            if instrument:
+                instrumentation = dict(mode='fast_path', timings=timer.times,
+                                       align_path=_align_path(warp, ok, align, align_levels),
+                                       align_levels=align_levels, baseline_cached=baseline_cache is not None,
+                                       lean=lean, image_pixels=int(H * W), prescreen=screen, blobs=0)
+                if roi is not None:
+                    instrumentation['roi_window'] = [x0, y0, x1, y1]
+            return _finish(transformer_id, baseline_path, maintenance_path, out_overlay_path, out_json_path,
+                           frame_bgr, warp_model, ok, score, mean_ssim, [], timer, instrumentation,
+                           outputs, fast_path=True)
+
+    # SSIM sanity (structure similarity); only the mean is used, so no full/gradient maps
+    mean_ssim = ssim(base_gray, ment_aligned_gray, data_range=255)
+    del ment_aligned_gray
+    timer.mark('ssim')
+    t_pot, t_fault = ssim_thresholds(mean_ssim, params)
+
+    # Convert to LAB/HSV
+    ment_lab, ment_hsv = lab_and_hsv(ment_aligned_bgr, lean=lean)
+    timer.mark('lab')
+
+    counts: Dict[str,int] = {}
+    blobs = detect_blobs(base_lab, ment_lab, ment_hsv, ment_aligned_bgr, t_pot, t_fault,
+                         gate_deltaE=gate_deltaE, timer=timer, counts=counts, lean=lean,
+                         params=params, intermediates=intermediates, roi=roi_m, lazy_topology=lazy_topology)
+    del ment_lab, ment_hsv, base_lab
+    for b in blobs:
+        bx, by, bw, bh = b.bbox
+        b.bbox = (bx + x0, by + y0, bw, bh)
+        b.centroid = (b.centroid[0] + x0, b.centroid[1] + y0)
+    if intermediates is not None:
+        if roi is not None:
+            _uncrop_intermediates(intermediates, frame_bgr, x0, y0, roi)
+        intermediates.update(transformer_id=transformer_id, baseline_path=source_name(baseline_path),
+                             maintenance_path=source_name(maintenance_path), warp=warp, warp_model=warp_model,
+                             warp_success=bool(ok), warp_score=float(score), mean_ssim=float(mean_ssim))
+
+    instrumentation = None
+    if instrument:
+        instrumentation = dict(
+            mode='full',
+            timings=timer.times,
+            align_path=_align_path(warp, ok, align, align_levels),
+            align_levels=align_levels,
+            baseline_cached=baseline_cache is not None,
+            lean=lean,
+            image_pixels=int(H * W),
+            **counts,
+            blobs=len(blobs),
+        )
+        if screen is not None:
+            instrumentation['prescreen'] = screen
+        if roi is not None:
+            instrumentation['roi_window'] = [x0, y0, x1, y1]
+    return _finish(transformer_id, baseline_path, maintenance_path, out_overlay_path, out_json_path,
+                   frame_bgr, warp_model, ok, score, mean_ssim, blobs, timer, instrumentation, outputs)
+
+def _uncrop_intermediates(d: Dict[str,Any], frame_bgr: np.ndarray, x0: int, y0: int, roi) -> None:
+    """
+    Paste ROI-window intermediates into full-frame arrays (ΔE 0, no edges outside the window)
+    and record the ROI, so redetect() gates hot pixels the same way and reports full-frame boxes.
+    """
+    H, W = frame_bgr.shape[:2]
+    for k in ('deltaE', 'deltaE_region', 'edges', 'skeleton'):
+        a = d[k]
+        if a is not None:
+            full = np.zeros((H, W), a.dtype)
+            full[y0:y0 + a.shape[0], x0:x0 + a.shape[1]] = a
+            d[k] = full
+    d['hsv'] = cv.cvtColor(frame_bgr, cv.COLOR_BGR2HSV)
+    d['roi'] = [p.tolist() for p in roi_polygons(roi)]
+    d['mask_digest'] = None   # digest was of the window's mask: redetect rebuilds the skeleton
+
+# ---------- Preview mode (coarse detection, full-resolution refinement) ----------
+PREVIEW_MAX_SIDE = 320
+PREVIEW_DE_RELAX = 0.75   # candidate ΔE threshold = t_pot * this (favour recall; refinement re-applies t_pot)
+
+def merge_windows(windows: List[Tuple[int,int,int,int]]) -> List[Tuple[int,int,int,int]]:
+    """Merge overlapping (x0, y0, x1, y1) windows until none overlap."""
+    out = [list(w) for w in windows]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(out)):
+            for j in range(i + 1, len(out)):
+                a, b = out[i], out[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    out[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del out[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [tuple(w) for w in out]
+
+def refine_windows(base_lab: np.ndarray, ment_aligned_bgr: np.ndarray, windows: List[Tuple[int,int,int,int]],
+                   t_pot: float, t_fault: float, gate_deltaE: bool = True,
+                   timer: StageTimer = None, counts: Dict[str,int] = None,
+                   lean: bool = False, params: DetectionParams = None,
+                   roi: np.ndarray = None, lazy_topology: bool = False) -> List[BlobDet]:
+    """
+    Run detect_blobs inside each full-resolution window; results are in full-frame coordinates.
+    roi: optional full-frame 0/255 mask passed to detect_blobs window by window.
+    """
+    blobs: List[BlobDet] = []
+    for x0, y0, x1, y1 in windows:
+        crop = ment_aligned_bgr[y0:y1, x0:x1]
+        ment_lab, ment_hsv = lab_and_hsv(crop, lean=lean)
+        if timer is not None:
+            timer.mark('lab')
+        for b in detect_blobs(base_lab[y0:y1, x0:x1], ment_lab, ment_hsv, crop, t_pot, t_fault,
+                              gate_deltaE=gate_deltaE, timer=timer, counts=counts, lean=lean, params=params,
+                              roi=roi[y0:y1, x0:x1] if roi is not None else None, lazy_topology=lazy_topology):
+            bx, by, bw, bh = b.bbox
+            b.bbox = (bx + x0, by + y0, bw, bh)
+            b.centroid = (b.centroid[0] + x0, b.centroid[1] + y0)
+            b.label = len(blobs) + 1
+            blobs.append(b)
+    return blobs
+
+def detect_anomalies_preview(transformer_id: str, baseline_path: ImageSource, maintenance_path: ImageSource,
+                             out_overlay_path: Optional[str], out_json_path: Optional[str], gate_deltaE: bool = True,
+                             baseline_cache: BaselineCache = None, max_side: int = PREVIEW_MAX_SIDE,
+                             margin: int = 24, timings: Dict[str,float] = None,
+                             instrument: bool = False, lean: bool = False,
+                             outputs: Dict[str,Any] = None, params: DetectionParams = None,
+                             roi=None, lazy_topology: bool = False) -> DetectionReport:
+    """
+    Fast preview: align, ΔE and the hot-colour gate run on a copy downscaled to max_side;
+    candidate regions (plus margin px) are then re-analysed at full resolution only.
+    Boxes are in original-image coordinates. Topology is window-local, so results can
+    differ slightly from detect_anomalies, which stays the exact path. Inputs, outputs, lean,
+    params, roi and lazy_topology as in detect_anomalies.
+    """
+    timer = StageTimer(timings)
+    base, ment_bgr = _load_pair(baseline_path, maintenance_path, baseline_cache, lean=lean)
+    base_gray, base_lab = base.gray, base.lab
+    timer.mark('decode')
+
+    H, W = base_gray.shape
+    scale = min(1.0, max_side / float(max(H, W)))
+    small_wh = (max(1, int(round(W * scale))), max(1, int(round(H * scale))))
+    base_small = cv.resize(base_gray, small_wh, interpolation=cv.INTER_AREA)
+    ment_small = cv.resize(to_gray(ment_bgr), small_wh, interpolation=cv.INTER_AREA)
+    warp_s, ment_aligned_small, ok, score, align_levels = ecc_align_pyramid(base_small, ment_small, levels=3)
+    # Coarse ECC can converge to a degenerate warp; keep it only if it registers better than
+    # no warp at all (the rule align_cascade uses when no step passes)
+    identity = np.eye(2, 3, dtype=np.float32)
+    if warp_ncc(base_small, ment_small, warp_s) < warp_ncc(base_small, ment_small, identity):
+        warp_s, ment_aligned_small, ok = identity, ment_small, False
+    warp = scale_warp(warp_s, scale)
+    ment_aligned_bgr, warp_model = warp_color(ment_bgr, warp, (W, H))
+    timer.mark('align')
+
+    mean_ssim = ssim(base_small, ment_aligned_small, data_range=255)
+    t_pot, t_fault = ssim_thresholds(mean_ssim, params)
+    timer.mark('ssim')
+
+    # Coarse candidates: hot-colour gate + relaxed ΔE on the downscaled pair. Both sides are
+    # point-sampled on the same grid: sampling commutes with the per-pixel LAB conversion,
+    # so identical images give ΔE 0 (area-averaging LAB on one side and BGR on the other does not)
+    base_lab_s = cv.resize(base_lab.astype(np.float32), small_wh, interpolation=cv.INTER_NEAREST)
+    ment_lab_s, ment_hsv_s = lab_and_hsv(cv.resize(ment_aligned_bgr, small_wh, interpolation=cv.INTER_NEAREST))
+    mask_hot_s = hot_color_mask(ment_hsv_s, (params or DEFAULT_PARAMS).hot_ranges)
+    roi_m = roi_mask(roi, (H, W)) if roi is not None else None
+    if roi_m is not None:
+        mask_hot_s[cv.resize(roi_m, small_wh, interpolation=cv.INTER_AREA) == 0] = 0
+    dE_s = deltaE_map(base_lab_s, ment_lab_s, gate=deltaE_gate(mask_hot_s))
+    cand = morphology_clean(cv.bitwise_and(mask_hot_s, cv.compare(dE_s, t_pot * PREVIEW_DE_RELAX, cv.CMP_GE)))
+    n, _, stats, _ = cv.connectedComponentsWithStats(cand, connectivity=8)
+    min_area = 25 * scale * scale
+    windows = []
+    for x, y, w, h, area in stats[1:]:
+        if area < min_area:
+            continue
+        windows.append((max(0, int(x / scale) - margin), max(0, int(y / scale) - margin),
+                        min(W, int(math.ceil((x + w) / scale)) + margin), min(H, int(math.ceil((y + h) / scale)) + margin)))
+    windows = merge_windows(windows)
+    timer.mark('preview')
+
+    counts: Dict[str,int] = {}
+    blobs = refine_windows(base_lab, ment_aligned_bgr, windows, t_pot, t_fault,
+                           gate_deltaE=gate_deltaE, timer=timer, counts=counts, lean=lean, params=params,
+                           roi=roi_m, lazy_topology=lazy_topology)
+
+    instrumentation = None
+    if instrument:
+        instrumentation = dict(
+            mode='preview',
+            timings=timer.times,
+            align_path=_align_path(warp_s, ok, 'pyramid'),
+            align_levels=align_levels,
+            baseline_cached=baseline_cache is not None,
+            lean=lean,
+            image_pixels=int(H * W),
+            preview_scale=scale,
+            candidates=int(n - 1),
+            windows=[list(w) for w in windows],
+            refined_pixels=int(sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in windows)),
+            **counts,
+            blobs=len(blobs),
+        )
+    return _finish(transformer_id, baseline_path, maintenance_path, out_overlay_path, out_json_path,
+                   ment_aligned_bgr, warp_model, ok, score, mean_ssim, blobs, timer, instrumentation, outputs)
+
+# ---------- In-memory entry point ----------
+# detect_* keyword arguments that do not change the result (left out of ResultCache keys)
+_RUNTIME_KWARGS = ('baseline_cache', 'timings', 'instrument', 'tile_workers', 'intermediates')
+
+def result_cache_key(baseline: ImageSource, maintenance: ImageSource, mode: str = 'full', **kwargs) -> str:
+    """The ResultCache key detect_anomalies_in_memory uses for these inputs, mode and kwargs."""
+    params = {k: v for k, v in kwargs.items() if k not in _RUNTIME_KWARGS}
+    return ResultCache.key(image_key(baseline if not isinstance(baseline, str) else read_bytes(baseline)),
+                           image_key(maintenance if not isinstance(maintenance, str) else read_bytes(maintenance)),
+                           dict(params, mode=mode))
+
+def detect_anomalies_in_memory(transformer_id: str, baseline: ImageSource, maintenance: ImageSource,
+                               mode: str = 'full', result_cache: ResultCache = None,
+                               **kwargs) -> Tuple[DetectionReport, bytes]:
+    """
+    Detection without touching the filesystem: inputs are encoded bytes or BGR arrays, and
+    nothing is written. Returns (report, overlay PNG bytes). mode: 'full' | 'preview';
+    kwargs go to detect_anomalies / detect_anomalies_preview.
+    result_cache: serve repeats of the same pair/mode/parameters without recomputing. With
+    instrument=True the report's instrumentation says whether it was a hit. A request for
+    intermediates always recomputes (the cache only holds the report and overlay).
+    """
+    if mode not in ('full', 'preview'):
+        raise ValueError(f"Unknown mode: {mode}")
+    key = None
+    if result_cache is not None:
+        t0 = time.perf_counter()
+        key = result_cache_key(baseline, maintenance, mode, **kwargs)
+        hit = result_cache.get(key) if kwargs.get('intermediates') is None else None
+        if hit is not None:
+            rep, png = hit
+            rep.transformer_id = transformer_id
+            if kwargs.get('instrument'):
+                rep.instrumentation = dict(mode=mode, result_cache='hit',
+                                           timings={'result_cache': time.perf_counter() - t0})
+            return rep, png
+
+    detect = detect_anomalies_preview if mode == 'preview' else detect_anomalies
+    outputs: Dict[str,Any] = {}
+    rep = detect(transformer_id, baseline, maintenance, None, None, outputs=outputs, **kwargs)
+    if key is not None:
+        result_cache.put(key, rep, outputs['overlay'])
+        if rep.instrumentation is not None:
+            rep.instrumentation['result_cache'] = 'miss'
+    return rep, outputs['overlay']
+
+# ---------- Persisted intermediates (re-detection with new parameters) ----------
+# ΔE is stored as uint16 multiples of DELTAE_QUANT, rounded down: `ΔE >= t` is unchanged for any
+# threshold on that grid, while blob mean/peak ΔE read up to DELTAE_QUANT low.
+DELTAE_QUANT = 0.01
+_INTERMEDIATE_ARRAYS = ('warp', 'deltaE', 'deltaE_region', 'hsv', 'edges', 'skeleton')
+
+def save_intermediates(path: str, intermediates: Dict[str,Any]) -> int:
+    """
+    Write detect_anomalies(..., intermediates=...) output as one compressed .npz: ΔE quantized
+    to uint16, aligned HSV as uint8, binary maps (ΔE region, edges, skeleton) bit-packed.
+    Other (JSON-serializable) entries, including any the caller adds, are kept as metadata.
+    Written atomically; returns the file size in bytes.
+    """
+    d = intermediates
+    H, W = d['hsv'].shape[:2]
+    pack = lambda m: np.packbits((m > 0).ravel()) if m is not None else np.zeros(0, np.uint8)
+    meta = {k: v for k, v in d.items() if k not in _INTERMEDIATE_ARRAYS}
+    meta.update(shape=[H, W], pipeline_version=PIPELINE_VERSION)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez_compressed(
+            f, meta=np.array(json.dumps(meta)), warp=np.asarray(d['warp'], np.float32),
+            deltaE=np.clip(np.floor(d['deltaE'].astype(np.float64) * (1.0 / DELTAE_QUANT)), 0, 65535).astype(np.uint16),
+            deltaE_region=pack(d['deltaE_region']), hsv=d['hsv'],
+            edges=pack(d['edges']), skeleton=pack(d['skeleton']))
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+def load_intermediates(path: str, meta_only: bool = False) -> Dict[str,Any]:
+    """
+    Inverse of save_intermediates (ΔE back to float32, binary maps as 0/255 uint8).
+    meta_only: return just the metadata without decompressing the arrays.
+    """
+    with np.load(path) as z:
+        d = json.loads(str(z['meta']))
+        if meta_only:
+            return d
+        H, W = d.pop('shape')
+        unpack = lambda a: (np.unpackbits(a, count=H * W).reshape(H, W) * 255).astype(np.uint8) if a.size else None
+        d.update(warp=z['warp'], deltaE=(z['deltaE'] / (1.0 / DELTAE_QUANT)).astype(np.float32),
+                 deltaE_region=unpack(z['deltaE_region']), hsv=z['hsv'],
+                 edges=unpack(z['edges']), skeleton=unpack(z['skeleton']))
+    return d
+
+def redetect(intermediates: Dict[str,Any], params: DetectionParams = None, timings: Dict[str,float] = None,
+             instrument: bool = False, outputs: Dict[str,Any] = None) -> DetectionReport:
+    """
+    Re-run thresholds, hot-colour masking, blobs and classification on stored intermediates
+    (no decode, alignment, SSIM, LAB or ΔE). The skeleton is reused when the new mask equals
+    the stored one and rebuilt from the stored edges otherwise. outputs['overlay'] is drawn on
+    the aligned image recovered from HSV.
+    ΔE exists only inside the stored ΔE region (the original hot-colour gate); if wider
+    hot_ranges reach beyond it, those pixels read ΔE 0 and instrumentation counts them
+    (deltaE_missing_pixels). Capture with gate_deltaE=False to tune the colour gate freely.
+    """
+    params = params if params is not None else DEFAULT_PARAMS
+    timer = StageTimer(timings)
+    dE, hsv = intermediates['deltaE'], intermediates['hsv']
+    t_pot, t_fault = ssim_thresholds(intermediates['mean_ssim'], params)
+
+    mask_hot = hot_color_mask(hsv, params.hot_ranges)
+    if intermediates.get('roi') is not None:
+        cv.bitwise_and(mask_hot, roi_mask(intermediates['roi'], hsv.shape), dst=mask_hot)
+    region = intermediates['deltaE_region']
+    missing = int(cv.countNonZero(cv.bitwise_and(mask_hot, cv.bitwise_not(region)))) if region is not None else 0
+    mask = cv.compare(dE, t_pot, cv.CMP_GE)
+    cv.bitwise_and(mask_hot, mask, dst=mask)
+    mask = morphology_clean(mask)
+    timer.mark('mask')
+
+    skel = intermediates['skeleton']
+    reused = skel is not None and content_hash(mask.tobytes()) == intermediates['mask_digest']
+    if reused:
+        wire_band = cv.dilate(skel, cv.getStructuringElement(cv.MORPH_RECT, (3,3)), iterations=1)
+    else:
+        skel, wire_band = build_wire_skeleton(None, mask, edges=intermediates['edges'])
+    timer.mark('skeleton')
+    blobs, component_counts, joint_index = _blobs_from_mask(mask, dE, hsv, skel, wire_band,
+                                                             t_pot, t_fault, params, timer)
+
+    if outputs is not None:
+        overlay = overlay_detections(cv.cvtColor(hsv, cv.COLOR_HSV2BGR), blobs)
+        outputs['overlay'] = cv.imencode('.png', overlay)[1].tobytes()
+        timer.mark('overlay')
+    rep = DetectionReport(
+        transformer_id=intermediates['transformer_id'],
+        baseline_path=intermediates['baseline_path'],
+        maintenance_path=intermediates['maintenance_path'],
+        warp_model=intermediates['warp_model'],
+        warp_success=bool(intermediates['warp_success']),
+        warp_score=float(intermediates['warp_score']),
+        mean_ssim=float(intermediates['mean_ssim']),
+        image_level_label=summarize_image(blobs),
+        blobs=blobs
+    )
+    if instrument:
+        rep.instrumentation = dict(mode='redetect', timings=timer.times, skeleton_reused=reused,
+                                   deltaE_missing_pixels=missing, joints=len(joint_index),
+                                   components=component_counts.get('components', 0), blobs=len(blobs))
     return rep
 
+# ---------- Tiled mode (bounded memory for large frames) ----------
+TILE_SIZE = 1024
+TILE_OVERLAP = 32   # halo px per side; covers ΔE gating + morphology reach (8 px), slack for Canny/thinning
+
+def tile_grid(H: int, W: int, tile: int) -> List[Tuple[int,int,int,int]]:
+    """Non-overlapping (x0, y0, x1, y1) tiles covering an H x W image in raster order."""
+    return [(x0, y0, min(W, x0 + tile), min(H, y0 + tile))
+            for y0 in range(0, H, tile) for x0 in range(0, W, tile)]
+
+def tiled_ssim(a: np.ndarray, b: np.ndarray, tile: int = TILE_SIZE, win_size: int = 7) -> float:
+    """
+    Mean SSIM (skimage defaults, data_range=255) evaluated tile by tile. Each tile is read with a
+    win_size//2 halo, so the local SSIM values equal the full-image map and the mean is the same.
+    """
+    pad = (win_size - 1) // 2
+    H, W = a.shape
+    total, count = 0.0, 0
+    for x0, y0, x1, y1 in tile_grid(H - 2*pad, W - 2*pad, tile):
+        _, S = ssim(a[y0:y1 + 2*pad, x0:x1 + 2*pad], b[y0:y1 + 2*pad, x0:x1 + 2*pad],
+                    win_size=win_size, full=True, data_range=255)
+        core = S[pad:-pad, pad:-pad]
+        total += float(core.sum())
+        count += core.size
+    return total / count if count else 0.0
+
+def _component_sums(labels: np.ndarray, n: int, dE: np.ndarray, hsv: np.ndarray,
+                    ox: int, oy: int, W: int) -> Dict[str, np.ndarray]:
+    """
+    Additive per-label statistics (labels 1..n-1) in frame coordinates, so components cut by
+    tile seams can be merged: pixel/ΔE/HSV/coordinate sums, peak ΔE and first scan position.
+    """
+    ys, xs = np.nonzero(labels)
+    lab = labels[ys, xs].astype(np.intp)
+    gx = xs.astype(np.float64) + ox; gy = ys.astype(np.float64) + oy
+    dE_fg = dE[ys, xs].astype(np.float64)
+    cols = [np.ones(len(lab)), dE_fg] + [hsv[ys, xs, c].astype(np.float64) for c in range(3)] + \
+           [gx, gy, gx*gx, gy*gy, gx*gy]
+    sums = np.stack([np.bincount(lab, weights=w, minlength=n) for w in cols], axis=1)[1:]
+    peak = np.zeros(n); np.maximum.at(peak, lab, dE_fg)
+    first = np.full(n, np.iinfo(np.int64).max)
+    # OpenCV's 8-connectivity labelling scans 2x2 blocks in raster order and numbers components
+    # by their first block; keep that key so merged labels match a whole-frame run
+    block = (ys + oy) // 2 * ((W + 1) // 2) + (xs + ox) // 2
+    np.minimum.at(first, lab, block)
+    return dict(sums=sums, peak=peak[1:], first=first[1:])
+
+def _detect_tile(core: Tuple[int,int,int,int], base_lab_at, ment_aligned_bgr: np.ndarray,
+                 t_pot: float, gate_deltaE: bool, lean: bool, overlap: int,
+                 mask_out: np.ndarray, skel_out: np.ndarray, timer: StageTimer = None,
+                 hot_ranges=HOT_RANGES, roi: np.ndarray = None) -> Dict[str,Any]:
+    """
+    detect_blobs' per-pixel stages on one tile read with an `overlap` halo. Writes the tile's
+    cleaned mask and skeleton into mask_out/skel_out and returns its core components, border
+    labels (for seam merging) and skeleton joints in frame coordinates. roi: optional
+    full-frame 0/255 mask gating the tile's hot pixels.
+    """
+    timer = timer if timer is not None else StageTimer()
+    x0, y0, x1, y1 = core
+    H, W = mask_out.shape
+    ex0, ey0 = max(0, x0 - overlap), max(0, y0 - overlap)
+    ex1, ey1 = min(W, x1 + overlap), min(H, y1 + overlap)
+    crop = ment_aligned_bgr[ey0:ey1, ex0:ex1]
+    ment_lab, ment_hsv = lab_and_hsv(crop, lean=lean)
+    base_lab = base_lab_at(ey0, ey1, ex0, ex1)
+    timer.mark('lab')
+
+    mask_hot = hot_color_mask(ment_hsv, hot_ranges)
+    if roi is not None:
+        cv.bitwise_and(mask_hot, roi[ey0:ey1, ex0:ex1], dst=mask_hot)
+    gate = deltaE_gate(mask_hot) if gate_deltaE else None
+    timer.mark('mask')
+    dE = deltaE_map(base_lab, ment_lab, gate=gate, chunk=DELTAE_CHUNK if lean else None)
+    del base_lab, ment_lab
+    timer.mark('deltaE')
+    mask = cv.compare(dE, t_pot, cv.CMP_GE)
+    cv.bitwise_and(mask_hot, mask, dst=mask)
+    mask = morphology_clean(mask)
+    timer.mark('mask')
+
+    skel, _ = build_wire_skeleton(crop, mask)
+    timer.mark('skeleton')
+    endpoints, junctions = find_skeleton_node_arrays(skel)
+    joints = np.concatenate([endpoints, junctions]) + np.array([ex0, ey0], dtype=np.int32)
+    joints = joints[(joints[:,0] >= x0) & (joints[:,0] < x1) & (joints[:,1] >= y0) & (joints[:,1] < y1)]
+    timer.mark('nodes')
+
+    sl = (slice(y0 - ey0, y1 - ey0), slice(x0 - ex0, x1 - ex0))
+    mask_out[y0:y1, x0:x1] = mask[sl]
+    skel_out[y0:y1, x0:x1] = skel[sl]
+    n, labels, stats, _ = cv.connectedComponentsWithStats(mask_out[y0:y1, x0:x1], connectivity=8)
+    out = _component_sums(labels, n, dE[sl], ment_hsv[sl], x0, y0, W)
+    bx, by, bw, bh = stats[1:, :4].astype(np.int64).T
+    out.update(n=n - 1, bbox=np.column_stack([bx + x0, by + y0, bx + bw + x0, by + bh + y0]), joints=joints,
+               top=labels[0].copy(), bottom=labels[-1].copy(), left=labels[:, 0].copy(), right=labels[:, -1].copy(),
+               deltaE_pixels=int(cv.countNonZero(gate)) if gate is not None else int(crop.shape[0] * crop.shape[1]),
+               skeleton_input_pixels=int(crop.shape[0] * crop.shape[1]),
+               skeleton_pixels=int(cv.countNonZero(skel[sl])))
+    timer.mark('blob_props')
+    return out
+
+def _merge_tile_components(tiles: List[Tuple[int,int,int,int]], parts: List[Dict[str,Any]],
+                           H: int, W: int) -> Tuple[np.ndarray, int, int]:
+    """
+    Join tile components that touch across seams (8-connectivity) and combine their sums.
+    Returns (blob table as from blob_table, component count, seam merges). Labels follow the raster
+    order of each component's first 2x2 block, as a whole-frame labelling numbers them.
+    """
+    offsets = np.cumsum([0] + [p['n'] for p in parts])
+    total = int(offsets[-1])
+    parent = np.arange(total)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # Frame-wide label strips on both sides of every seam (-1 = background)
+    h_seams = {y0: [np.full(W, -1, np.int64), np.full(W, -1, np.int64)] for _, y0, _, _ in tiles if y0 > 0}
+    v_seams = {x0: [np.full(H, -1, np.int64), np.full(H, -1, np.int64)] for x0, _, _, _ in tiles if x0 > 0}
+    glob = lambda labels, off: np.where(labels > 0, labels.astype(np.int64) - 1 + off, -1)
+    for (x0, y0, x1, y1), p, off in zip(tiles, parts, offsets):
+        if y1 in h_seams: h_seams[y1][0][x0:x1] = glob(p['bottom'], off)
+        if y0 in h_seams: h_seams[y0][1][x0:x1] = glob(p['top'], off)
+        if x1 in v_seams: v_seams[x1][0][y0:y1] = glob(p['right'], off)
+        if x0 in v_seams: v_seams[x0][1][y0:y1] = glob(p['left'], off)
+
+    merges = 0
+    for a, b in list(h_seams.values()) + list(v_seams.values()):
+        L = len(a)
+        for d in (-1, 0, 1):
+            aa = a[max(0, -d):L - max(0, d)]; bb = b[max(0, d):L - max(0, -d)]
+            hit = (aa >= 0) & (bb >= 0)
+            for i, j in set(zip(aa[hit].tolist(), bb[hit].tolist())):
+                ri, rj = find(i), find(j)
+                if ri != rj:
+                    parent[max(ri, rj)] = min(ri, rj)
+                    merges += 1
+    if total == 0:
+        return _blob_table(0), 0, merges
+
+    roots = np.array([find(i) for i in range(total)])
+    uniq, comp = np.unique(roots, return_inverse=True)
+    n = len(uniq)
+    sums = np.zeros((n, 10)); np.add.at(sums, comp, np.concatenate([p['sums'] for p in parts]))
+    peak = np.zeros(n); np.maximum.at(peak, comp, np.concatenate([p['peak'] for p in parts]))
+    first = np.full(n, np.iinfo(np.int64).max); np.minimum.at(first, comp, np.concatenate([p['first'] for p in parts]))
+    boxes = np.concatenate([p['bbox'] for p in parts])
+    lo = np.full((n, 2), np.iinfo(np.int64).max); np.minimum.at(lo, comp, boxes[:, :2])
+    hi = np.zeros((n, 2), np.int64); np.maximum.at(hi, comp, boxes[:, 2:])
+
+    area = sums[:, 0]
+    mx = sums[:, 5] / area; my = sums[:, 6] / area
+    denom = np.maximum(area - 1.0, 1.0)
+    vxx = (sums[:, 7] - area * mx * mx) / denom
+    vyy = (sums[:, 8] - area * my * my) / denom
+    vxy = (sums[:, 9] - area * mx * my) / denom
+    elong = elongation(area, vyy, vxx, vxy)
+
+    order = np.argsort(first, kind='stable')
+    keep = area[order] >= 25    # ignore tiny speckles
+    c = order[keep]
+    out = _blob_table(len(c))
+    out['label'] = np.flatnonzero(keep) + 1
+    out['bbox'] = np.column_stack([lo[c], hi[c] - lo[c]])
+    out['area'] = area[c]
+    out['centroid'] = np.column_stack([mx[c], my[c]])
+    out['mean_deltaE'] = sums[c, 1] / area[c]
+    out['peak_deltaE'] = peak[c]
+    out['mean_hsv'] = sums[c, 2:5] / area[c][:, None]
+    out['elongation'] = elong[c]
+    return out, n, merges
+
+def detect_anomalies_tiled(transformer_id: str, baseline_path: ImageSource, maintenance_path: ImageSource,
+                           out_overlay_path: Optional[str], out_json_path: Optional[str], gate_deltaE: bool = True,
+                           baseline_cache: BaselineCache = None, align: str = 'ecc',
+                           timings: Dict[str,float] = None, instrument: bool = False, lean: bool = False,
+                           tile_size: int = TILE_SIZE, tile_overlap: int = TILE_OVERLAP,
+                           tile_workers: int = 1, outputs: Dict[str,Any] = None,
+                           params: DetectionParams = None, roi=None) -> DetectionReport:
+    """
+    detect_anomalies for frames too large to hold several full-frame float arrays. Alignment
+    runs once on the whole frame; SSIM, LAB, ΔE, masking, skeletonization and component
+    labelling then run per tile (with a tile_overlap halo), tile_workers tiles at a time.
+    Components cut by seams are merged and classified against frame-wide joints/coverage.
+    Float working memory scales with tile_size x tile_workers; full-frame buffers are uint8.
+    That bound only holds without baseline_cache: cached artifacts carry the full-frame
+    float64 baseline LAB (the batch CLI runs tiled jobs uncached).
+    Masks and ΔE statistics match detect_anomalies; the skeleton (Canny hysteresis, thinning)
+    can differ within a few px of a seam, which may shift a topology subtype there.
+    With roi (as in detect_anomalies) SSIM runs on the ROI's bounding box and only tiles
+    meeting it are processed.
+    """
+    timer = StageTimer(timings)
+    if baseline_cache is not None:
+        base = _cached_baseline(baseline_cache, baseline_path)
+        base_gray, base_pyramid, base_features = base.gray, base.pyramid, base.features
+        base_lab_at = lambda y0, y1, x0, x1: base.lab[y0:y1, x0:x1]
+    else:
+        # No full-frame LAB: each tile converts its own window of the baseline
+        base_bgr = load_bgr(baseline_path)
+        base_gray, base_pyramid, base_features = to_gray(base_bgr), None, None
+        base_lab_at = lambda y0, y1, x0, x1: lab_and_hsv(base_bgr[y0:y1, x0:x1], lean=lean)[0]
+    ment_bgr = load_bgr(maintenance_path)
+    timer.mark('decode')
+
+    ment_gray = to_gray(ment_bgr)
+    warp, ment_aligned_gray, ok, score, align_levels = align_gray(base_gray, ment_gray, align, base_pyramid, base_features)
+    H, W = base_gray.shape
+    ment_aligned_bgr, warp_model = warp_color(ment_bgr, warp, (W, H))
+    del ment_bgr, ment_gray
+    timer.mark('align')
+
+    tiles = tile_grid(H, W, tile_size)
+    x0, y0, x1, y1 = 0, 0, W, H
+    roi_m = roi_mask(roi, (H, W)) if roi is not None else None
+    if roi_m is not None:
+        x0, y0, x1, y1 = roi_window(roi_m)
+        tiles = [t for t in tiles if t[0] < x1 and x0 < t[2] and t[1] < y1 and y0 < t[3]]
+    mean_ssim = tiled_ssim(base_gray[y0:y1, x0:x1], ment_aligned_gray[y0:y1, x0:x1], tile_size)
+    del ment_aligned_gray
+    params = params if params is not None else DEFAULT_PARAMS
+    t_pot, t_fault = ssim_thresholds(mean_ssim, params)
+    timer.mark('ssim')
+
+    mask = np.zeros((H, W), np.uint8)
+    skel = np.zeros((H, W), np.uint8)
+    run = lambda core, t=None: _detect_tile(core, base_lab_at, ment_aligned_bgr, t_pot, gate_deltaE, lean,
+                                            tile_overlap, mask, skel, t, params.hot_ranges, roi_m)
+    if tile_workers > 1:
+        # OpenCV/NumPy release the GIL for the heavy kernels; tiles write disjoint regions
+        with ThreadPoolExecutor(tile_workers) as ex:
+            parts = list(ex.map(run, tiles))
+        timer.mark('tiles')
+    else:
+        parts = [run(core, timer) for core in tiles]
+
+    table, n_components, seam_merges = _merge_tile_components(tiles, parts, H, W)
+    joint_index = JointIndex(np.concatenate([p['joints'] for p in parts]))
+    coverage_index = WindowCoverage(skel, mask)
+    timer.mark('merge')
+
+    blobs = blobs_from_table(classify_table(table, t_pot, t_fault, joint_index, coverage_index, params))
+    timer.mark('classify')
+
+    instrumentation = None
+    if instrument:
+        instrumentation = dict(
+            mode='tiled',
+            timings=timer.times,
+            align_path=_align_path(warp, ok, align, align_levels),
+            align_levels=align_levels,
+            baseline_cached=baseline_cache is not None,
+            lean=lean,
+            image_pixels=int(H * W),
+            tile_size=tile_size,
+            tile_overlap=tile_overlap,
+            tiles=len(tiles),
+            seam_merges=seam_merges,
+            **({'roi_window': [x0, y0, x1, y1]} if roi is not None else {}),
+            **{k: sum(p[k] for p in parts) for k in ('deltaE_pixels', 'skeleton_input_pixels', 'skeleton_pixels')},
+            joints=len(joint_index),
+            components=n_components,
+            blobs=len(blobs),
+        )
+    return _finish(transformer_id, baseline_path, maintenance_path, out_overlay_path, out_json_path,
+                   ment_aligned_bgr, warp_model, ok, score, mean_ssim, blobs, timer, instrumentation, outputs)
+
 if __name__ == "__main__":
     # Example:
     # python anomaly_cv.py TX001 baseline.jpg maintenance.jpg out_overlay.png out_report.json
+    # python anomaly_cv.py batch ../data results.jsonl      (see batch_detect.py for options)
+    # python anomaly_cv.py sequence TX001 baseline.jpg flight.mp4 results.jsonl   (see sequence_detect.py)
+    if len(sys.argv) >= 2 and sys.argv[1] == "batch":
+        import batch_detect
+        sys.exit(batch_detect.main(sys.argv[2:]))
+    if len(sys.argv) >= 2 and sys.argv[1] == "sequence":
+        import sequence_detect
+        sys.exit(sequence_detect.main(sys.argv[2:]))
     if len(sys.argv) != 6:
         print("Usage: python anomaly_cv.py <transformer_id> <baseline.jpg> <maintenance.jpg> <overlay.png> <report.json>")
+        print("       python anomaly_cv.py batch <data_dir|manifest> <results.jsonl> [options]")
+        print("       python anomaly_cv.py sequence <transformer_id> <baseline.jpg> <video|frame_dir> <results.jsonl> [options]")
         sys.exit(1)
     _, txid, bpath, mpath, opath, jpath = sys.argv
     rep = detect_anomalies(txid, bpath, mpath, opath, jpath)
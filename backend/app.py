@@ -1,13 +1,17 @@
 import os
-import uuid
 import json
 import base64
 import io
+import sqlite3
+import time
 from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 
 # Import logic
-from anomaly_cv import detect_anomalies, BlobDet
+from anomaly_cv import (detect_anomalies_in_memory, BlobDet, BaselineCache, ResultCache, DetectionParams,
+                        image_key, result_cache_key, save_intermediates, load_intermediates, redetect,
+                        roi_polygons)
+from baseline_index import BaselineIndex, load_small
 import database as db
 
 # PDF generation
@@ -43,9 +47,17 @@ CORS(app, resources={
     }
 })
 
-# Create a temporary directory for file processing if it doesn't exist
-TEMP_DIR = "temp_files"
-os.makedirs(TEMP_DIR, exist_ok=True)
+# Preprocessed baselines (gray/LAB/ORB/pyramid) reused across /analyze calls on the same baseline
+BASELINE_CACHE = BaselineCache(max_bytes=256 * 1024 * 1024, cache_dir=os.path.join("cache", "baselines"))
+# Finished reports + overlays, so repeated "Run AI" clicks on the same pair return immediately
+RESULT_CACHE = ResultCache(max_bytes=64 * 1024 * 1024, cache_dir=os.path.join("cache", "results"))
+# Global descriptors of each transformer's stored baselines (baseline_images), filled lazily
+BASELINE_INDEX = BaselineIndex()
+# baseline_id under which a transformer's primary baseline (transformers.baselineImage) is indexed
+PRIMARY_BASELINE = 'primary'
+# Per-inspection ΔE / HSV / skeleton of the last full analysis, for re-detection with new parameters
+INTERMEDIATES_DIR = os.path.join("cache", "intermediates")
+os.makedirs(INTERMEDIATES_DIR, exist_ok=True)
 
 # --- Database Initialization ---
 # Check if the database file exists, if not, initialize it.
@@ -54,88 +66,243 @@ if not os.path.exists(db.DATABASE):
     db.init_db()
 
 
-def image_to_data_uri(filepath):
-    """Convert an image file to a base64 data URI."""
-    with open(filepath, "rb") as image_file:
-        encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
+def image_to_data_uri(png_bytes):
+    """Convert encoded PNG bytes to a base64 data URI."""
+    encoded_string = base64.b64encode(png_bytes).decode('utf-8')
     return f"data:image/png;base64,{encoded_string}"
 
+def decode_data_uri(uri):
+    """Bytes of a base64 data URI (plain base64 is accepted too)."""
+    return base64.b64decode(uri.split(',', 1)[1] if uri.startswith('data:') else uri)
+
+def intermediates_path(inspection_id):
+    return os.path.join(INTERMEDIATES_DIR, f"{int(inspection_id)}.npz")
+
+def stored_pair_key(path):
+    """pair_key recorded with an inspection's intermediates, or None if there are none."""
+    try:
+        return load_intermediates(path, meta_only=True).get('pair_key')
+    except (OSError, ValueError, KeyError):
+        return None
+
+def anomalies_from_report(report):
+    """Blob detections in the frontend's 'anomalies' list format."""
+    anomalies_list = []
+    for i, blob in enumerate(report.blobs):
+        x, y, w, h = blob.bbox
+        anomalies_list.append({
+            "id": f"ai_{i + 1}",
+            "x": x,
+            "y": y,
+            "w": w,
+            "h": h,
+            "confidence": blob.confidence,
+            "severity": blob.classification, # Maps to 'Faulty', 'Potentially Faulty'
+            "classification": blob.subtype, # Maps to 'LooseJoint', 'PointOverload', etc.
+            "comment": "",
+            "source": "ai"
+        })
+    return anomalies_list
+
+def transformer_roi(transformer_id):
+    """Stored ROI of a transformer, or None if it has none or it cannot be read (e.g. no roi column yet)."""
+    try:
+        return db.get_transformer_roi(transformer_id)
+    except (sqlite3.Error, ValueError) as e:
+        app.logger.warning("Ignoring ROI of transformer %s (run migrate_database.py?): %s", transformer_id, e)
+        return None
+
+def index_baseline(transformer_id, baseline_id, image_uri, **meta):
+    try:
+        BASELINE_INDEX.add(transformer_id, baseline_id, decode_data_uri(image_uri), **meta)
+    except ValueError as e:
+        BASELINE_INDEX.remove(transformer_id, baseline_id)   # never rank a replaced image's descriptors
+        app.logger.warning("Skipping undecodable baseline %s of transformer %s: %s", baseline_id, transformer_id, e)
+
+def sync_baseline_index(transformer_id):
+    """
+    Align BASELINE_INDEX with one transformer's baselines: the primary one (as PRIMARY_BASELINE,
+    re-described when the image changes) and its baseline_images rows (only new rows are described).
+    """
+    rows = db.get_baseline_images(transformer_id, include_image=False)
+    known = set(BASELINE_INDEX.ids(transformer_id))
+    wanted = {row['id'] for row in rows}
+    primary = db.get_primary_baseline(transformer_id)
+    if primary is not None:
+        wanted.add(PRIMARY_BASELINE)
+        key = image_key(primary['image'].encode())
+        if (BASELINE_INDEX.meta(transformer_id, PRIMARY_BASELINE) or {}).get('key') != key:
+            index_baseline(transformer_id, PRIMARY_BASELINE, primary['image'],
+                           weather=primary['weather'], uploadDate=primary['uploadDate'], key=key)
+    for row in rows:
+        if row['id'] not in known:
+            index_baseline(transformer_id, row['id'], db.get_baseline_image(row['id'])['image'],
+                           weather=row['weather'], uploadDate=row['uploadDate'])
+    for stale in known - wanted:
+        BASELINE_INDEX.remove(transformer_id, stale)
+
 @app.route('/analyze', methods=['POST'])
 def analyze_images_endpoint():
     """
     Flask endpoint to receive images, run anomaly detection, and return results.
     """
-    if 'baseline' not in request.files or 'maintenance' not in request.files:
+    # Without a 'baseline' upload, 'transformer_id' selects the closest stored baseline
+    transformer_id = request.form.get('transformer_id', type=int)
+    if 'maintenance' not in request.files or ('baseline' not in request.files and transformer_id is None):
         return jsonify({"error": "Missing baseline or maintenance image"}), 400
 
-    baseline_file = request.files['baseline']
     maintenance_file = request.files['maintenance']
     
     # The frontend doesn't use the threshold with this advanced CV script,
     # but we can keep the parameter for future use.
     threshold = request.form.get('threshold', 0.5)
     inspection_id = request.form.get('inspection_id', 'unknown_inspection')
+    # 'full' (exact, default) or 'preview' (downscaled detection refined around candidates only);
+    # the UI can show a preview first and follow up with a 'full' request. A preview whose full
+    # result is already cached is answered with that result and "mode": "full" instead.
+    mode = request.form.get('mode', 'full')
+    if mode not in ('full', 'preview'):
+        return jsonify({"error": f"Unknown mode: {mode}"}), 400
 
-    # --- File Handling ---
-    # Create unique filenames to avoid conflicts
-    run_id = str(uuid.uuid4())
-    baseline_path = os.path.join(TEMP_DIR, f"{run_id}_baseline.png")
-    maintenance_path = os.path.join(TEMP_DIR, f"{run_id}_maintenance.png")
-    overlay_path = os.path.join(TEMP_DIR, f"{run_id}_overlay.png")
-    report_path = os.path.join(TEMP_DIR, f"{run_id}_report.json")
-
-    # Save uploaded files to the temporary directory
-    baseline_file.save(baseline_path)
-    maintenance_file.save(maintenance_path)
+    # Uploads stay in memory: decoded from bytes, overlay returned as PNG bytes, no temp files
+    maintenance_bytes = maintenance_file.read()
 
     try:
+        baseline_selection = None
+        if 'baseline' in request.files:
+            baseline_bytes = request.files['baseline'].read()
+        else:
+            sync_baseline_index(transformer_id)
+            baseline_selection = BASELINE_INDEX.rank(transformer_id, maintenance_bytes, top_k=3)
+            if not baseline_selection:
+                return jsonify({"error": "No stored baselines for this transformer"}), 404
+            best_id = baseline_selection[0]['baseline_id']
+            best = (db.get_primary_baseline(transformer_id) if best_id == PRIMARY_BASELINE
+                    else db.get_baseline_image(best_id))
+            baseline_bytes = decode_data_uri(best['image'])
+
+        # The transformer's stored ROI (if any) limits analysis to the equipment area
+        roi_owner = transformer_id
+        if roi_owner is None and str(inspection_id).isdigit():
+            roi_owner = db.get_inspection_transformer_id(int(inspection_id))
+        roi = transformer_roi(roi_owner) if roi_owner is not None else None
+
+        # Full analyses of a saved inspection keep their intermediates (once per image pair)
+        # so /api/inspections/<id>/redetect can re-apply new thresholds without re-aligning
+        intermediates, inter_path, needs_intermediates = None, None, False
+        if str(inspection_id).isdigit():
+            inter_path = intermediates_path(inspection_id)
+            pair_key = f"{image_key(baseline_bytes)}:{image_key(maintenance_bytes)}"
+            if roi is not None:
+                pair_key += f":{image_key(json.dumps(roi).encode())}"
+            needs_intermediates = stored_pair_key(inter_path) != pair_key
+
+        # A cached full result makes the preview pointless, unless this full run must store intermediates
+        if (mode == 'preview' and not needs_intermediates
+                and result_cache_key(baseline_bytes, maintenance_bytes, 'full', roi=roi) in RESULT_CACHE):
+            mode = 'full'
+        if mode == 'full' and needs_intermediates:
+            intermediates = {}
+
         # --- Run Core CV Logic ---
-        # Call the function from your anomaly_cv.py script
-        report = detect_anomalies(
-            transformer_id=inspection_id,
-            baseline_path=baseline_path,
-            maintenance_path=maintenance_path,
-            out_overlay_path=overlay_path,
-            out_json_path=report_path
+        report, overlay_png = detect_anomalies_in_memory(
+            inspection_id,
+            baseline_bytes,
+            maintenance_bytes,
+            mode=mode,
+            baseline_cache=BASELINE_CACHE,
+            result_cache=RESULT_CACHE,
+            instrument=True,
+            roi=roi,
+            # preview has no intermediates (it only analyses candidate windows at full resolution)
+            **({'intermediates': intermediates} if mode == 'full' else {})
         )
+        if intermediates:
+            intermediates['pair_key'] = pair_key
+            save_intermediates(inter_path, intermediates)
 
         # --- Prepare Response for Frontend ---
         # The frontend expects a specific format. We'll adapt the report.
         
         # 1. Convert the generated overlay image to a data URI
-        annotated_image_uri = image_to_data_uri(overlay_path)
+        annotated_image_uri = image_to_data_uri(overlay_png)
 
         # 2. Format the blob detections into the 'anomalies' list format
-        anomalies_list = []
-        for i, blob in enumerate(report.blobs):
-            x, y, w, h = blob.bbox
-            anomalies_list.append({
-                "id": f"ai_{i + 1}",
-                "x": x,
-                "y": y,
-                "w": w,
-                "h": h,
-                "confidence": blob.confidence,
-                "severity": blob.classification, # Maps to 'Faulty', 'Potentially Faulty'
-                "classification": blob.subtype, # Maps to 'LooseJoint', 'PointOverload', etc.
-                "comment": "",
-                "source": "ai"
-            })
+        anomalies_list = anomalies_from_report(report)
 
         return jsonify({
             "annotatedImage": annotated_image_uri,
-            "anomalies": anomalies_list
+            "anomalies": anomalies_list,
+            "mode": mode,
+            # Ranked stored baselines when the server picked one (top entry was used), else null
+            "baselineSelection": baseline_selection,
+            # Per-stage timings, alignment path and pixel counts for diagnosing slow uploads
+            "instrumentation": report.instrumentation
         })
 
     except Exception as e:
         return jsonify({"error": f"An error occurred during analysis: {str(e)}"}), 500
 
-    finally:
-        # --- Cleanup ---
-        # Clean up the temporary files after the request is complete
-        for path in [baseline_path, maintenance_path, overlay_path, report_path]:
-            if os.path.exists(path):
-                os.remove(path)
+
+@app.route('/api/analyze/cache', methods=['GET'])
+def analyze_cache_stats():
+    """Entry counts, sizes and hit/miss counters of the /analyze caches (for sizing them)."""
+    return jsonify({"results": RESULT_CACHE.stats(), "baselines": BASELINE_CACHE.stats()})
+
+
+@app.route('/api/inspections/<int:id>/redetect', methods=['POST'])
+def redetect_inspection(id):
+    """
+    Re-run masking, blobs and classification for one analysed inspection with new parameters
+    (JSON body {"params": {...}}, keys of DetectionParams); alignment and ΔE are not repeated.
+    """
+    path = intermediates_path(id)
+    if not os.path.exists(path):
+        return jsonify({"error": "No stored analysis for this inspection; run /analyze (full mode) first"}), 404
+    try:
+        params = DetectionParams.from_dict((request.json or {}).get('params', {}))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    outputs = {}
+    report = redetect(load_intermediates(path), params, instrument=True, outputs=outputs)
+    return jsonify({
+        "annotatedImage": image_to_data_uri(outputs['overlay']),
+        "anomalies": anomalies_from_report(report),
+        "label": report.image_level_label,
+        "instrumentation": report.instrumentation
+    })
+
+@app.route('/api/redetect', methods=['POST'])
+def redetect_history():
+    """
+    Re-tune over the inspection history: apply {"params": {...}} to every inspection with
+    stored intermediates (or to "inspection_ids") and return labels and detections per inspection.
+    """
+    body = request.json or {}
+    try:
+        params = DetectionParams.from_dict(body.get('params', {}))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    ids = body.get('inspection_ids')
+    if ids is not None:
+        # ints or digit strings only: int() would 500 on "abc" and silently truncate 3.5
+        if not isinstance(ids, list) or not all(
+                (isinstance(i, int) and not isinstance(i, bool)) or (isinstance(i, str) and i.isdigit()) for i in ids):
+            return jsonify({"error": "inspection_ids must be a list of integer ids"}), 400
+        ids = [int(i) for i in ids]
+    else:
+        ids = sorted(int(n[:-4]) for n in os.listdir(INTERMEDIATES_DIR) if n.endswith('.npz') and n[:-4].isdigit())
+    t0 = time.perf_counter()
+    results = []
+    for inspection_id in ids:
+        path = intermediates_path(inspection_id)
+        if not os.path.exists(path):
+            results.append({"inspection_id": inspection_id, "error": "no stored analysis"})
+            continue
+        report = redetect(load_intermediates(path), params)
+        results.append({"inspection_id": inspection_id, "label": report.image_level_label,
+                        "anomalies": anomalies_from_report(report)})
+    return jsonify({"results": results, "elapsed_ms": (time.perf_counter() - t0) * 1000.0})
 
 
 # --- CRUD API for Transformers ---
@@ -163,6 +330,60 @@ def handle_transformer(id):
         db.delete_transformer(id)
         return jsonify({'message': 'Transformer deleted'}), 200
 
+@app.route('/api/transformers/<int:id>/roi', methods=['GET', 'PUT'])
+def handle_transformer_roi(id):
+    """
+    Region of interest drawn once on the transformer's baseline: {"roi": [[x, y], ...]} or a
+    list of such polygons, in baseline pixels; {"roi": null} clears it.
+    """
+    if request.method == 'GET':
+        return jsonify({"roi": db.get_transformer_roi(id)})
+    roi = (request.json or {}).get('roi')
+    if roi is not None:
+        try:
+            roi = [p.tolist() for p in roi_polygons(roi)]
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    if not db.set_transformer_roi(id, roi):
+        return jsonify({"error": "Transformer not found"}), 404
+    return jsonify({"roi": roi}), 200
+
+@app.route('/api/transformers/<int:id>/baselines', methods=['GET', 'POST'])
+def handle_baseline_images(id):
+    if request.method == 'GET':
+        # ?images=0 lists metadata only
+        return jsonify(db.get_baseline_images(id, include_image=request.args.get('images', '1') != '0'))
+    if not db.transformer_exists(id):
+        return jsonify({"error": "Transformer not found"}), 404
+    data = request.json or {}
+    if not data.get('image'):
+        return jsonify({"error": "Missing image"}), 400
+    try:
+        image = load_small(decode_data_uri(data['image']))  # validates before anything is stored
+    except ValueError as e:
+        return jsonify({"error": f"Invalid image: {e}"}), 400
+    row = db.add_baseline_image(id, data['image'], data.get('weather'), data.get('uploadDate'))
+    BASELINE_INDEX.add(id, row['id'], image, weather=row['weather'], uploadDate=row['uploadDate'])
+    return jsonify(row), 201
+
+@app.route('/api/transformers/<int:id>/baselines/rank', methods=['POST'])
+def rank_baseline_images(id):
+    """Stored baselines of a transformer ordered by similarity to the uploaded maintenance image."""
+    if 'maintenance' not in request.files:
+        return jsonify({"error": "Missing maintenance image"}), 400
+    sync_baseline_index(id)
+    return jsonify(BASELINE_INDEX.rank(id, request.files['maintenance'].read(),
+                                       top_k=request.args.get('top_k', type=int)))
+
+@app.route('/api/baselines/<int:baseline_id>', methods=['DELETE'])
+def delete_baseline_image(baseline_id):
+    row = db.get_baseline_image(baseline_id)
+    if row is None:
+        return jsonify({"error": "Baseline not found"}), 404
+    db.delete_baseline_image(baseline_id)
+    BASELINE_INDEX.remove(row['transformer_id'], baseline_id)
+    return jsonify({'message': 'Baseline deleted'}), 200
+
 @app.route('/api/transformers/update_from_inspection', methods=['POST'])
 def handle_transformer_update_from_inspection():
     data = request.json
@@ -0,0 +1,191 @@
+# baseline_index.py
+"""
+Per-transformer index for picking the best baseline image among several (different weather,
+time of day, slightly different angles) without aligning against each one.
+
+Every baseline is reduced once to three compact global descriptors:
+  - thumbnail: 32x32 gray, zero-mean / unit-norm        -> normalized cross-correlation
+  - colour:    hue x saturation histogram (sqrt of L1)  -> Bhattacharyya coefficient
+  - ORB bag-of-words over a small per-transformer vocabulary (tf-idf, L2) -> cosine
+A maintenance image is described the same way and every candidate is scored with three
+dot products, so ranking costs one small ORB pass plus microseconds per baseline.
+
+Usage:
+    index = BaselineIndex()
+    index.add('T1', 'T1_normal_001', read_bytes('T1_normal_001.jpg'), weather='Sunny')
+    best = index.rank('T1', read_bytes('T1_faulty_010.jpg'), top_k=1)[0]
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, List, Optional
+
+import numpy as np
+import cv2 as cv
+
+from anomaly_cv import ImageSource, decode_bgr, read_bytes, to_gray
+
+DESCRIBE_MAX_SIDE = 320        # images are described at this size (thumbnail, histogram, ORB)
+THUMB_SIDE = 32
+HIST_BINS = (30, 8)            # OpenCV hue (0..179) x saturation; the thermal palette lives in hue
+ORB_FEATURES = 500
+BOW_WORDS = 64
+# Thumbnail NCC carries most of the signal on the bundled T1..T13 sets (agreement with the
+# best post-alignment SSIM); histogram and BoW mainly break ties between similar views.
+SCORE_WEIGHTS = dict(thumb=0.8, hist=0.1, bow=0.1)
+
+
+@dataclass
+class BaselineDescriptor:
+    baseline_id: Hashable
+    thumb: np.ndarray                  # (THUMB_SIDE**2,) float32, zero mean, unit norm
+    hist: np.ndarray                   # (H*S,) float32, sqrt of the L1-normalized histogram
+    orb: np.ndarray                    # (N,32) uint8 ORB descriptors (N may be 0)
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+def load_small(image: ImageSource) -> np.ndarray:
+    """
+    BGR image for describe(). Encoded input is decoded at 1/4 or 1/2 scale when that still
+    leaves DESCRIBE_MAX_SIDE px (JPEG decodes at reduced scale several times faster).
+    """
+    if isinstance(image, np.ndarray):
+        return image if image.ndim == 3 else cv.cvtColor(image, cv.COLOR_GRAY2BGR)
+    data = np.frombuffer(read_bytes(image) if isinstance(image, str) else bytes(image), np.uint8)
+    for flag in (cv.IMREAD_REDUCED_COLOR_4, cv.IMREAD_REDUCED_COLOR_2):
+        img = cv.imdecode(data, flag)
+        if img is not None and max(img.shape[:2]) >= DESCRIBE_MAX_SIDE:
+            return img
+    return decode_bgr(data.tobytes())
+
+
+def describe(img_bgr: np.ndarray) -> Dict[str, np.ndarray]:
+    """Global descriptors (thumb, hist, orb) of one image."""
+    h, w = img_bgr.shape[:2]
+    scale = min(1.0, DESCRIBE_MAX_SIDE / float(max(h, w)))
+    small = cv.resize(img_bgr, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv.INTER_AREA)
+    gray = to_gray(small)
+
+    thumb = cv.resize(gray, (THUMB_SIDE, THUMB_SIDE), interpolation=cv.INTER_AREA).astype(np.float32).ravel()
+    thumb -= thumb.mean()
+    thumb /= max(float(np.linalg.norm(thumb)), 1e-6)
+
+    hsv = cv.cvtColor(small, cv.COLOR_BGR2HSV)
+    hist = cv.calcHist([hsv], [0, 1], None, list(HIST_BINS), [0, 180, 0, 256]).ravel()
+    hist = np.sqrt(hist / max(float(hist.sum()), 1.0)).astype(np.float32)
+
+    _, des = cv.ORB_create(ORB_FEATURES).detectAndCompute(gray, None)
+    orb = des if des is not None else np.zeros((0, 32), np.uint8)
+    return dict(thumb=thumb, hist=hist, orb=orb)
+
+
+class _Vocabulary:
+    """Binary visual words: k-means on unpacked ORB bits, centroids re-binarized for Hamming lookup."""
+    def __init__(self, descriptors: List[np.ndarray], words: int = BOW_WORDS):
+        data = np.concatenate([d for d in descriptors if len(d)]) if any(len(d) for d in descriptors) \
+            else np.zeros((0, 32), np.uint8)
+        k = min(words, len(data))
+        self.centroids = np.zeros((0, 32), np.uint8)
+        if k >= 2:
+            bits = np.unpackbits(data, axis=1).astype(np.float32)
+            criteria = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 20, 1e-3)
+            cv.setRNGSeed(0)  # reproducible vocabulary (and therefore scores) for the same baselines
+            _, _, centers = cv.kmeans(bits, k, None, criteria, 1, cv.KMEANS_PP_CENTERS)
+            self.centroids = np.packbits(centers > 0.5, axis=1)
+        self._matcher = cv.BFMatcher(cv.NORM_HAMMING)
+        self.idf = np.ones(len(self.centroids), np.float32)
+
+    def __len__(self) -> int:
+        return len(self.centroids)
+
+    def histogram(self, orb: np.ndarray) -> np.ndarray:
+        tf = np.zeros(len(self.centroids), np.float32)
+        if len(orb) and len(self.centroids):
+            words = [m.trainIdx for m in self._matcher.match(orb, self.centroids)]
+            tf = np.bincount(words, minlength=len(self.centroids)).astype(np.float32)
+        return tf
+
+    def vector(self, orb: np.ndarray) -> np.ndarray:
+        v = self.histogram(orb) * self.idf
+        return v / max(float(np.linalg.norm(v)), 1e-6)
+
+
+class _TransformerEntry:
+    def __init__(self):
+        self.baselines: Dict[Hashable, BaselineDescriptor] = {}
+        self._stacked: Optional[Dict[str, Any]] = None   # matrices + vocabulary, rebuilt after changes
+
+    def stacked(self) -> Dict[str, Any]:
+        if self._stacked is None:
+            items = list(self.baselines.values())
+            vocab = _Vocabulary([b.orb for b in items])
+            if len(vocab):
+                df = np.stack([vocab.histogram(b.orb) > 0 for b in items]).sum(axis=0)
+                vocab.idf = np.log((1.0 + len(items)) / (1.0 + df)).astype(np.float32) + 1.0
+            self._stacked = dict(
+                ids=[b.baseline_id for b in items],
+                meta=[b.meta for b in items],
+                thumb=np.stack([b.thumb for b in items]),
+                hist=np.stack([b.hist for b in items]),
+                bow=np.stack([vocab.vector(b.orb) for b in items]) if len(vocab) else None,
+                vocab=vocab,
+            )
+        return self._stacked
+
+
+class BaselineIndex:
+    """Thread-safe map transformer -> baseline descriptors, with ranking for a maintenance image."""
+    def __init__(self, weights: Optional[Dict[str, float]] = None):
+        self.weights = dict(SCORE_WEIGHTS, **(weights or {}))
+        self._entries: Dict[Hashable, _TransformerEntry] = {}
+        self._lock = threading.Lock()
+
+    def add(self, transformer_id: Hashable, baseline_id: Hashable, image: ImageSource, **meta) -> None:
+        """Describe and (re)insert one baseline; meta (e.g. weather) is returned with rankings."""
+        d = describe(load_small(image))
+        desc = BaselineDescriptor(baseline_id=baseline_id, meta=meta, **d)
+        with self._lock:
+            entry = self._entries.setdefault(transformer_id, _TransformerEntry())
+            entry.baselines[baseline_id] = desc
+            entry._stacked = None
+
+    def remove(self, transformer_id: Hashable, baseline_id: Hashable) -> None:
+        with self._lock:
+            entry = self._entries.get(transformer_id)
+            if entry is not None and entry.baselines.pop(baseline_id, None) is not None:
+                entry._stacked = None
+
+    def ids(self, transformer_id: Hashable) -> List[Hashable]:
+        with self._lock:
+            entry = self._entries.get(transformer_id)
+            return list(entry.baselines) if entry is not None else []
+
+    def meta(self, transformer_id: Hashable, baseline_id: Hashable) -> Optional[Dict[str, Any]]:
+        """meta stored with one baseline, or None if it is not indexed."""
+        with self._lock:
+            entry = self._entries.get(transformer_id)
+            desc = entry.baselines.get(baseline_id) if entry is not None else None
+            return desc.meta if desc is not None else None
+
+    def rank(self, transformer_id: Hashable, maintenance: ImageSource,
+             top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Candidates for transformer_id, best first: dicts with baseline_id, score (weighted sum),
+        the per-descriptor similarities (thumb, hist, bow), meta and elapsed_ms for the query.
+        """
+        t0 = time.perf_counter()
+        with self._lock:
+            entry = self._entries.get(transformer_id)
+            if entry is None or not entry.baselines:
+                return []
+            s = entry.stacked()
+        q = describe(load_small(maintenance))
+        sims = dict(thumb=s['thumb'] @ q['thumb'], hist=s['hist'] @ q['hist'],
+                    bow=s['bow'] @ s['vocab'].vector(q['orb']) if s['bow'] is not None else None)
+        weights = {k: w for k, w in self.weights.items() if sims[k] is not None}
+        score = sum(w * sims[k] for k, w in weights.items()) / max(sum(weights.values()), 1e-6)
+        order = np.argsort(-score, kind='stable')[:top_k]
+        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+        return [dict(baseline_id=s['ids'][i], score=float(score[i]),
+                     **{k: (float(v[i]) if v is not None else None) for k, v in sims.items()},
+                     meta=s['meta'][i], elapsed_ms=elapsed_ms) for i in order]
@@ -0,0 +1,187 @@
+# batch_detect.py
+"""
+Batch anomaly detection over a dataset tree or manifest, fanned out over a process pool.
+
+Dataset layout (as in ../data):
+    <root>/<transformer>/normal/*.jpg|png   -> first image (sorted) is the baseline
+    <root>/<transformer>/faulty/*.jpg|png   -> maintenance images
+Remaining normal images are analysed against the baseline too.
+
+Manifest: a .csv (header transformer_id,baseline,maintenance) or .jsonl with the same keys.
+Relative paths are resolved against the manifest's directory.
+
+Each result is streamed as one JSON line to the output file. Re-running with the same
+output file skips pairs already recorded there, so an interrupted run can be resumed.
+
+Usage:
+    python batch_detect.py ../data results.jsonl --workers 8
+    python anomaly_cv.py batch manifest.csv results.jsonl --overlay-dir overlays
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from multiprocessing import Pool
+from typing import Dict, Iterable, List, Optional, Set
+
+import cv2 as cv
+
+from anomaly_cv import detect_anomalies, report_to_dict, BaselineCache
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+@dataclass
+class BatchJob:
+    key: str                # stable id used for resume: "<baseline>::<maintenance>"
+    transformer_id: str
+    baseline_path: str
+    maintenance_path: str
+
+
+def _images(folder: str) -> List[str]:
+    if not os.path.isdir(folder):
+        return []
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder)
+                  if f.lower().endswith(IMAGE_EXTS))
+
+
+def _job(transformer_id: str, baseline: str, maintenance: str) -> BatchJob:
+    key = f"{os.path.normpath(baseline)}::{os.path.normpath(maintenance)}"
+    return BatchJob(key, transformer_id, baseline, maintenance)
+
+
+def discover_jobs(root: str) -> List[BatchJob]:
+    """Pair every maintenance image under root/<T>/{faulty,normal} with that transformer's baseline."""
+    jobs = []
+    for name in sorted(os.listdir(root)):
+        tdir = os.path.join(root, name)
+        normals = _images(os.path.join(tdir, 'normal'))
+        if not normals:
+            continue
+        baseline = normals[0]
+        for m in _images(os.path.join(tdir, 'faulty')) + normals[1:]:
+            jobs.append(_job(name, baseline, m))
+    return jobs
+
+
+def load_manifest(path: str) -> List[BatchJob]:
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, newline='') as f:
+        if path.lower().endswith('.csv'):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    return [_job(str(r['transformer_id']),
+                 os.path.join(base_dir, r['baseline']),
+                 os.path.join(base_dir, r['maintenance'])) for r in rows]
+
+
+def completed_keys(out_path: str) -> Set[str]:
+    """Keys already present in an existing results file (a truncated last line is ignored)."""
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path) as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)['key'])
+            except (ValueError, KeyError):
+                continue
+    return done
+
+
+# --- Worker process state ---
+
+_worker: Dict[str, object] = {}
+
+
+def _init_worker(overlay_dir: Optional[str], detect_kwargs: Dict) -> None:
+    # One OpenCV thread per process: the pool already provides the parallelism.
+    cv.setNumThreads(1)
+    _worker['overlay_dir'] = overlay_dir
+    _worker['kwargs'] = detect_kwargs
+    # Jobs are grouped by transformer, so a per-process cache reuses each baseline. Tiled runs
+    # go uncached: cached artifacts hold the full-frame LAB that tiling exists to avoid.
+    _worker['cache'] = BaselineCache(max_bytes=128 * 1024 * 1024) if not detect_kwargs.get('tile_size') else None
+
+
+def _run_job(job: BatchJob) -> Dict:
+    # The report goes straight into the JSONL line; only kept overlays are written to disk.
+    overlay_dir = _worker['overlay_dir']
+    overlay_path = (os.path.join(overlay_dir, f"{job.transformer_id}_{os.path.basename(job.maintenance_path)}.png")
+                    if overlay_dir else None)
+    t0 = time.perf_counter()
+    out = dict(key=job.key, transformer_id=job.transformer_id,
+               baseline_path=job.baseline_path, maintenance_path=job.maintenance_path)
+    try:
+        rep = detect_anomalies(job.transformer_id, job.baseline_path, job.maintenance_path,
+                               overlay_path, None, baseline_cache=_worker['cache'],
+                               **_worker['kwargs'])
+        out['report'] = report_to_dict(rep)
+        if overlay_dir:
+            out['overlay_path'] = overlay_path
+    except Exception as e:
+        out['error'] = f"{type(e).__name__}: {e}"
+    out['elapsed_s'] = round(time.perf_counter() - t0, 4)
+    return out
+
+
+def run_batch(jobs: Iterable[BatchJob], out_path: str, workers: Optional[int] = None,
+              overlay_dir: Optional[str] = None, resume: bool = True, **detect_kwargs) -> Dict[str, int]:
+    """
+    Run detect_anomalies over jobs in a process pool, appending one JSON line per result to
+    out_path as results arrive. Returns counts: total, skipped, ok, failed.
+    """
+    jobs = list(jobs)
+    done = completed_keys(out_path) if resume else set()
+    todo = [j for j in jobs if j.key not in done]
+    counts = dict(total=len(jobs), skipped=len(jobs) - len(todo), ok=0, failed=0)
+    if overlay_dir:
+        os.makedirs(overlay_dir, exist_ok=True)
+    if not todo:
+        return counts
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(todo)))
+    mode = 'a' if resume else 'w'
+    with open(out_path, mode) as out, \
+            Pool(workers, initializer=_init_worker, initargs=(overlay_dir, detect_kwargs)) as pool:
+        for res in pool.imap_unordered(_run_job, todo, chunksize=1):
+            out.write(json.dumps(res) + '\n')
+            out.flush()
+            counts['failed' if 'error' in res else 'ok'] += 1
+    return counts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Batch anomaly detection over a dataset tree or manifest.")
+    ap.add_argument('source', help="dataset root (T*/normal, T*/faulty) or manifest (.csv/.jsonl)")
+    ap.add_argument('output', help="results file, one JSON object per line")
+    ap.add_argument('--workers', type=int, default=None, help="process count (default: CPU count)")
+    ap.add_argument('--overlay-dir', default=None, help="keep overlay PNGs here (default: discard)")
+    ap.add_argument('--align', choices=['ecc', 'pyramid', 'cascade'], default='ecc')
+    ap.add_argument('--lean', action='store_true', help="memory-lean mode (float32 LAB, chunked ΔE)")
+    ap.add_argument('--prescreen', action='store_true',
+                    help="return early with a Normal report when a cheap ΔE pre-screen finds no new hot region")
+    ap.add_argument('--lazy-topology', action='store_true', help="wire skeleton only around detected blobs")
+    ap.add_argument('--tile-size', type=int, default=None, help="tiled mode for large frames (e.g. 1024)")
+    ap.add_argument('--tile-workers', type=int, default=1, help="threads per image in tiled mode")
+    ap.add_argument('--no-resume', action='store_true', help="overwrite output instead of skipping done pairs")
+    args = ap.parse_args(argv)
+
+    jobs = discover_jobs(args.source) if os.path.isdir(args.source) else load_manifest(args.source)
+    t0 = time.perf_counter()
+    counts = run_batch(jobs, args.output, workers=args.workers, overlay_dir=args.overlay_dir,
+                       resume=not args.no_resume, align=args.align, lean=args.lean, prescreen=args.prescreen,
+                       lazy_topology=args.lazy_topology, tile_size=args.tile_size, tile_workers=args.tile_workers)
+    elapsed = time.perf_counter() - t0
+    print(f"Batch: {counts['ok']} ok, {counts['failed']} failed, {counts['skipped']} skipped "
+          f"of {counts['total']} in {elapsed:.1f}s", file=sys.stderr)
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+# benchmark.py
+"""
+Reproducible performance benchmark for the detection pipeline.
+
+Runs detect_anomalies over the bundled data/T1..T13 pairs (same pairing as batch_detect.py)
+at one or more worker counts and records, per configuration:
+  - p50/p95 latency per stage (decode, align, roi, prescreen, ssim, lab, deltaE, mask, skeleton,
+    nodes, blob_props, classify, tiles, merge, overlay, json, plus any other stage the run
+    recorded) and for the whole image
+  - images/sec (wall clock over the whole configuration)
+  - peak RSS of the worker processes and p50/p95 peak traced (Python/NumPy) memory per image
+Results are written as JSON (with git commit and library versions) so runs can be compared.
+
+Usage:
+    python benchmark.py                                   # ../data, workers 1,2,4
+    python benchmark.py --workers 1,8 --limit 20 --align pyramid
+    python benchmark.py --compare bench_results/bench_20250101T000000.json
+    python benchmark.py --variant align=cascade --compare bench_results/<ecc run>.json   # A/B a stage variant
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from multiprocessing import Pool
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import cv2 as cv
+
+from anomaly_cv import detect_anomalies, BaselineCache
+from batch_detect import BatchJob, discover_jobs
+from pipeline import StageCache, default_pipeline, parse_variants
+
+STAGES = ['decode', 'align', 'roi', 'prescreen', 'ssim', 'lab', 'deltaE', 'mask', 'skeleton', 'nodes',
+          'blob_props', 'classify', 'tiles', 'merge', 'overlay', 'json']
+
+_bench: Dict[str, Any] = {}
+
+
+def _init_worker(detect_kwargs: Dict[str, Any], use_cache: bool) -> None:
+    cv.setNumThreads(1)
+    _bench['scratch'] = tempfile.mkdtemp(prefix='bench_')
+    _bench['kwargs'] = detect_kwargs
+    if 'variants' in detect_kwargs:
+        # Stage-graph pipeline: --baseline-cache becomes a per-worker StageCache
+        _bench['pipeline'] = default_pipeline(StageCache() if use_cache else None)
+    else:
+        _bench['cache'] = BaselineCache() if use_cache else None
+    tracemalloc.start()  # NumPy allocations are traced; OpenCV's own buffers are not
+
+
+def _run_one(job: BatchJob) -> Dict[str, Any]:
+    overlay = os.path.join(_bench['scratch'], 'overlay.png')
+    report = os.path.join(_bench['scratch'], 'report.json')
+    timings: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    out: Dict[str, Any] = dict(key=job.key)
+    tracemalloc.reset_peak()
+    try:
+        if 'pipeline' in _bench:
+            rep = _bench['pipeline'].run(job.transformer_id, job.baseline_path, job.maintenance_path, overlay, report,
+                                         timings=timings, **_bench['kwargs'])
+        else:
+            rep = detect_anomalies(job.transformer_id, job.baseline_path, job.maintenance_path, overlay, report,
+                                   baseline_cache=_bench['cache'], timings=timings, **_bench['kwargs'])
+        out['blobs'] = len(rep.blobs)
+    except Exception as e:
+        out['error'] = f"{type(e).__name__}: {e}"
+    out['total_s'] = time.perf_counter() - t0
+    out['timings'] = timings
+    out['peak_mem_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+    out['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0  # Linux: KiB
+    return out
+
+
+def _pct(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return dict(p50=0.0, p95=0.0, mean=0.0)
+    a = np.asarray(values)
+    return dict(p50=float(np.percentile(a, 50)), p95=float(np.percentile(a, 95)), mean=float(a.mean()))
+
+
+def run_config(jobs: List[BatchJob], workers: int, repeat: int = 1, use_cache: bool = False,
+               **detect_kwargs) -> Dict[str, Any]:
+    """Benchmark one worker count. A fresh pool per call keeps peak RSS per configuration."""
+    work = jobs * repeat
+    t0 = time.perf_counter()
+    with Pool(workers, initializer=_init_worker, initargs=(detect_kwargs, use_cache)) as pool:
+        results = list(pool.imap_unordered(_run_one, work, chunksize=1))
+    wall = time.perf_counter() - t0
+    good = [r for r in results if 'error' not in r]
+    # Stages not listed in STAGES still get a column, so the table always adds up to the total
+    stages = STAGES + sorted({s for r in good for s in r['timings']} - set(STAGES))
+    return dict(
+        workers=workers,
+        images=len(results),
+        errors=[dict(key=r['key'], error=r['error']) for r in results if 'error' in r],
+        wall_s=wall,
+        images_per_s=len(results) / wall if wall > 0 else 0.0,
+        peak_rss_mb=max((r['peak_rss_mb'] for r in results), default=0.0),
+        peak_mem_mb=_pct([r['peak_mem_mb'] for r in good]),
+        total=_pct([r['total_s'] for r in good]),
+        stages={s: _pct([r['timings'].get(s, 0.0) for r in good]) for s in stages},
+    )
+
+
+def _environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    import skimage
+    return dict(commit=commit, python=platform.python_version(), platform=platform.platform(),
+                cpu_count=os.cpu_count(), numpy=np.__version__, opencv=cv.__version__,
+                skimage=skimage.__version__)
+
+
+def print_summary(result: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> None:
+    prev = {c['workers']: c for c in (previous or {}).get('configs', [])}
+    for c in result['configs']:
+        p = prev.get(c['workers'])
+        print(f"\nworkers={c['workers']}  images={c['images']}  {c['images_per_s']:.2f} img/s  "
+              f"peak RSS {c['peak_rss_mb']:.0f} MB  image peak mem p50 {c['peak_mem_mb']['p50']:.0f} / "
+              f"p95 {c['peak_mem_mb']['p95']:.0f} MB  total p50 {c['total']['p50']*1000:.0f} ms "
+              f"p95 {c['total']['p95']*1000:.0f} ms" + (f"  errors={len(c['errors'])}" if c['errors'] else ""))
+        for s, st in c['stages'].items():
+            line = f"  {s:<11} p50 {st['p50']*1000:8.1f} ms   p95 {st['p95']*1000:8.1f} ms"
+            if p and p['stages'].get(s, {}).get('p50', 0) > 0:
+                line += f"   (p50 x{st['p50'] / p['stages'][s]['p50']:.2f} vs previous)"
+            print(line)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    here = os.path.dirname(os.path.abspath(__file__))
+    ap = argparse.ArgumentParser(description="Benchmark detect_anomalies over the bundled dataset.")
+    ap.add_argument('--data', default=os.path.join(here, '..', 'data'))
+    ap.add_argument('--workers', default='1,2,4', help="comma-separated worker counts")
+    ap.add_argument('--limit', type=int, default=None, help="only the first N pairs")
+    ap.add_argument('--repeat', type=int, default=1, help="run each pair N times per configuration")
+    ap.add_argument('--align', choices=['ecc', 'pyramid', 'cascade'], default='ecc')
+    ap.add_argument('--lean', action='store_true', help="memory-lean mode (float32 LAB, chunked ΔE)")
+    ap.add_argument('--prescreen', action='store_true', help="no-change pre-screen with early exit")
+    ap.add_argument('--lazy-topology', action='store_true', help="wire skeleton only around detected blobs")
+    ap.add_argument('--tile-size', type=int, default=None, help="tiled mode for large frames (e.g. 1024)")
+    ap.add_argument('--tile-workers', type=int, default=1, help="threads per image in tiled mode")
+    ap.add_argument('--baseline-cache', action='store_true', help="reuse a per-worker BaselineCache")
+    ap.add_argument('--variant', action='append', default=[], metavar='STAGE=VARIANT',
+                    help="run the stage-graph pipeline (pipeline.py) with this stage variant; repeatable")
+    ap.add_argument('--out', default=None, help="results JSON (default: bench_results/bench_<time>.json)")
+    ap.add_argument('--compare', default=None, help="previous results JSON to compare stage p50s against")
+    args = ap.parse_args(argv)
+
+    jobs = discover_jobs(args.data)[:args.limit]
+    workers = [int(w) for w in args.workers.split(',') if w.strip()]
+    detect_kwargs = dict(align=args.align, lean=args.lean, prescreen=args.prescreen,
+                         lazy_topology=args.lazy_topology, tile_size=args.tile_size, tile_workers=args.tile_workers)
+    if args.baseline_cache and args.tile_size and not args.variant:
+        ap.error("--baseline-cache keeps full-frame baseline LAB, which --tile-size exists to avoid")
+    if args.variant:
+        if args.prescreen or args.tile_size:
+            ap.error("--variant runs the stage graph, which has no --prescreen or --tile-size")
+        try:
+            variants = dict(align=args.align, **(dict(topology='lazy') if args.lazy_topology else {}),
+                            **parse_variants(args.variant))
+            default_pipeline().plan(variants)
+        except ValueError as e:
+            ap.error(str(e))
+        detect_kwargs = dict(variants=variants, lean=args.lean)
+    result = dict(
+        created=time.strftime('%Y-%m-%dT%H:%M:%S'),
+        environment=_environment(),
+        params=dict(data=os.path.abspath(args.data), pairs=len(jobs), repeat=args.repeat,
+                    baseline_cache=args.baseline_cache, **detect_kwargs),
+        configs=[run_config(jobs, w, args.repeat, args.baseline_cache, **detect_kwargs) for w in workers],
+    )
+
+    out = args.out or os.path.join(here, 'bench_results', f"bench_{time.strftime('%Y%m%dT%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_summary(result, previous)
+    print(f"\nSaved {out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,295 @@
+# calibrate.py
+"""
+Threshold calibration against the engineers' corrections recorded in annotation_logs.
+
+For every inspection with logged annotations, the final user boxes (latest state of each
+annotation, minus deletions) are the ground truth. Stored inspections are replayed through
+the post-ΔE stages over a grid of DetectionParams and every setting is scored by box IoU:
+precision, recall, F1, plus severity/subtype agreement on matched boxes. The report lists
+the Pareto front of F1 versus per-image runtime. A transformer's stored ROI applies as in
+/analyze and redetect, so detections outside the equipment area are never scored.
+
+Expensive work is shared instead of repeated per grid point:
+  - alignment, LAB, ΔE and wire edges run once per inspection (detect_anomalies
+    intermediates, loaded from the app's cache/intermediates or computed and saved there;
+    when the grid moves the colour gate, gated ones are recomputed without the gate);
+  - grid points that produce the same mask (same effective t_pot and hot-colour ranges)
+    share masking, skeleton, joints and blob statistics; only classification re-runs.
+Inspections are spread over a process pool.
+
+Grid: JSON object {name: [values]}, names being DetectionParams fields plus two shorthands:
+  deltaE_shift  added to all four ΔE thresholds (t_pot, t_fault and their relaxed pair)
+  hot_v_min     minimum HSV value (brightness) of every hot-colour range
+
+Usage:
+    python calibrate.py                                   # DEFAULT_GRID, backend.db
+    python calibrate.py --grid grid.json --workers 4 --out calibration.json
+"""
+import argparse
+import base64
+import itertools
+import json
+import os
+import sys
+import time
+from dataclasses import replace
+from multiprocessing import Pool
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import cv2 as cv
+from skimage.color import deltaE_ciede2000
+
+from anomaly_cv import (
+    CLASSIFICATIONS, CoverageIndex, DetectionParams, JointIndex, bbox_iou, blob_table, blobs_from_table,
+    build_wire_skeleton, classify_table, deltaE_gate, detect_anomalies, find_skeleton_node_arrays,
+    hot_color_mask, load_intermediates, morphology_clean, roi_mask, save_intermediates, ssim_thresholds,
+)
+import database as db
+
+DEFAULT_GRID = dict(deltaE_shift=[-2.0, -1.0, 0.0, 1.0, 2.0],
+                    hot_v_min=[100, 120, 140],
+                    full_cover_thr=[0.5, 0.6, 0.7])
+IOU_THR = 0.5
+INTERMEDIATES_DIR = os.path.join("cache", "intermediates")
+
+
+# --- Ground truth ---
+
+def final_annotations(logs: List[Dict[str,Any]]) -> Dict[int, List[Dict[str,Any]]]:
+    """Per inspection, the last logged state of every annotation that was not deleted."""
+    latest: Dict[Tuple[int,str], Dict[str,Any]] = {}
+    for log in sorted(logs, key=lambda l: (l['timestamp'], l['id'])):
+        ann = log.get('user_annotation') or log.get('annotation_data') or {}
+        if 'id' not in ann:
+            continue
+        deleted = log['action_type'] == 'deleted' or bool(ann.get('deleted'))
+        latest[(log['inspection_id'], str(ann['id']))] = None if deleted else ann
+    truth: Dict[int, List[Dict[str,Any]]] = {}
+    for (inspection_id, _), ann in latest.items():
+        boxes = truth.setdefault(inspection_id, [])
+        if ann is not None and ann.get('severity') != 'Normal':
+            boxes.append(dict(bbox=(ann['x'], ann['y'], ann['w'], ann['h']),
+                              severity=ann.get('severity'), classification=ann.get('classification')))
+    return truth
+
+
+def match_boxes(pred: List[Tuple[int,int,int,int]], truth: List[Tuple[int,int,int,int]],
+                iou_thr: float = IOU_THR) -> List[Tuple[int,int]]:
+    """Greedy one-to-one (pred, truth) index pairs with IoU >= iou_thr, best overlaps first."""
+    pairs = sorted(((bbox_iou(p, t), i, j) for i, p in enumerate(pred) for j, t in enumerate(truth)), reverse=True)
+    used_p, used_t, out = set(), set(), []
+    for iou, i, j in pairs:
+        if iou < iou_thr:
+            break
+        if i not in used_p and j not in used_t:
+            used_p.add(i); used_t.add(j); out.append((i, j))
+    return out
+
+
+# --- Grid ---
+
+def expand_grid(grid: Dict[str, List[Any]]) -> List[Dict[str,Any]]:
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def params_for(point: Dict[str,Any]) -> DetectionParams:
+    """DetectionParams for one grid point (defaults, then the point's fields, then shorthands)."""
+    point = dict(point)
+    shift = point.pop('deltaE_shift', 0.0)
+    v_min = point.pop('hot_v_min', None)
+    p = DetectionParams.from_dict(point)
+    p = replace(p, t_pot=p.t_pot + shift, t_fault=p.t_fault + shift,
+                t_pot_relaxed=p.t_pot_relaxed + shift, t_fault_relaxed=p.t_fault_relaxed + shift)
+    if v_min is not None:
+        p = replace(p, hot_ranges=tuple(((lo[0], lo[1], v_min), hi) for lo, hi in p.hot_ranges))
+    return p
+
+
+def deltaE_pixel_cost(samples: int = 200000) -> float:
+    """Seconds per pixel of deltaE_ciede2000 on this machine (for the runtime axis)."""
+    rng = np.random.default_rng(0)
+    a = rng.uniform([0, -60, -60], [100, 60, 60], (samples, 3))
+    b = a + rng.normal(0, 5, a.shape)
+    t0 = time.perf_counter()
+    deltaE_ciede2000(a, b)
+    return (time.perf_counter() - t0) / samples
+
+
+# --- Worker ---
+
+def _evaluate(task: Tuple[int, str, List[Dict[str,Any]], List[Dict[str,Any]], float, float]) -> Dict[str,Any]:
+    """Score every grid point on one inspection; stages before classification are shared."""
+    inspection_id, path, truth, points, iou_thr, de_cost = task
+    cv.setNumThreads(1)
+    inter = load_intermediates(path)
+    dE, hsv, edges = inter['deltaE'], inter['hsv'], inter['edges']
+    region = inter['deltaE_region']
+    # As in redetect: the stored ROI (what /analyze inspected) limits the hot-colour gate
+    roi = roi_mask(inter['roi'], hsv.shape) if inter.get('roi') is not None else None
+    truth_boxes = [t['bbox'] for t in truth]
+    staged: Dict[Any, Dict[str,Any]] = {}
+    rows = []
+    for point in points:
+        params = params_for(point)
+        t_pot, t_fault = ssim_thresholds(inter['mean_ssim'], params)
+        key = (t_pot, params.hot_ranges)
+        if key not in staged:
+            t0 = time.perf_counter()
+            mask_hot = hot_color_mask(hsv, params.hot_ranges)
+            if roi is not None:
+                cv.bitwise_and(mask_hot, roi, dst=mask_hot)
+            gate = deltaE_gate(mask_hot)
+            mask = cv.compare(dE, t_pot, cv.CMP_GE)
+            cv.bitwise_and(mask_hot, mask, dst=mask)
+            mask = morphology_clean(mask)
+            # Always rebuilt (never the stored skeleton) so runtime_s is comparable across settings
+            skel, wire_band = build_wire_skeleton(None, mask, edges=edges)
+            stage = dict(joint_index=JointIndex(np.concatenate(find_skeleton_node_arrays(skel))),
+                         coverage_index=CoverageIndex(skel, mask, wire_band),
+                         table=blob_table(mask, dE, hsv),
+                         deltaE_pixels=int(cv.countNonZero(gate)),
+                         deltaE_missing=(int(cv.countNonZero(cv.bitwise_and(gate, cv.bitwise_not(region))))
+                                         if region is not None else 0))
+            stage['time_s'] = time.perf_counter() - t0
+            staged[key] = stage
+        stage = staged[key]
+        t0 = time.perf_counter()
+        table = classify_table(stage['table'], t_pot, t_fault, stage['joint_index'], stage['coverage_index'], params)
+        blobs = blobs_from_table(table[table['classification'] != CLASSIFICATIONS.index('Normal')])
+        t_cls = time.perf_counter() - t0
+        matches = match_boxes([b.bbox for b in blobs], truth_boxes, iou_thr)
+        rows.append(dict(
+            tp=len(matches), fp=len(blobs) - len(matches), fn=len(truth_boxes) - len(matches),
+            severity_ok=sum(blobs[i].classification == truth[j]['severity'] for i, j in matches),
+            subtype_ok=sum(blobs[i].subtype == truth[j]['classification'] for i, j in matches),
+            # Standalone cost of this setting: its own post-ΔE stages plus ΔE over its gate
+            runtime_s=stage['time_s'] + t_cls + stage['deltaE_pixels'] * de_cost,
+            deltaE_missing=stage['deltaE_missing'],
+        ))
+    return dict(inspection_id=inspection_id, rows=rows, shared_stages=len(staged))
+
+
+# --- Driver ---
+
+def _decode_data_uri(uri: str) -> bytes:
+    return base64.b64decode(uri.split(',', 1)[1] if uri.startswith('data:') else uri)
+
+
+def _gated(path: str) -> bool:
+    """Whether stored intermediates hold ΔE only inside the hot-colour gate (unreadable counts as gated)."""
+    try:
+        with np.load(path) as z:
+            return z['deltaE_region'].size > 0
+    except (OSError, ValueError, KeyError):
+        return True
+
+
+def _prepare(task: Tuple[int, str, bool]) -> Tuple[int, Optional[str]]:
+    """Compute and save intermediates for an inspection (none yet, or gated where the grid needs ungated)."""
+    inspection_id, path, gate_deltaE = task
+    cv.setNumThreads(1)
+    images = db.get_inspection_images(inspection_id)
+    if not images or not images.get('maintenanceImage') or not images.get('baselineImage'):
+        return inspection_id, "missing maintenance or baseline image"
+    try:
+        inter: Dict[str,Any] = {}
+        detect_anomalies(str(inspection_id), _decode_data_uri(images['baselineImage']),
+                         _decode_data_uri(images['maintenanceImage']), None, None,
+                         gate_deltaE=gate_deltaE, intermediates=inter,
+                         roi=db.get_transformer_roi(images['transformer_id']))  # same crop as /analyze
+        save_intermediates(path, inter)
+    except Exception as e:
+        return inspection_id, f"{type(e).__name__}: {e}"
+    return inspection_id, None
+
+
+def pareto_front(settings: List[Dict[str,Any]]) -> List[Dict[str,Any]]:
+    """Settings not beaten on both F1 (higher) and runtime (lower), fastest first."""
+    front, best = [], -1.0
+    for s in sorted(settings, key=lambda s: (s['runtime_ms'], -s['f1'])):
+        if s['f1'] > best:
+            front.append(s)
+            best = s['f1']
+    return front
+
+
+def calibrate(grid: Dict[str, List[Any]], workers: Optional[int] = None, iou_thr: float = IOU_THR,
+              intermediates_dir: str = INTERMEDIATES_DIR) -> Dict[str,Any]:
+    """Replay every annotated inspection over the grid; returns per-setting scores and the Pareto front."""
+    truth = final_annotations(db.get_annotation_logs())
+    points = expand_grid(grid)
+    for point in points:
+        params_for(point)  # reject unknown names before starting workers
+    os.makedirs(intermediates_dir, exist_ok=True)
+    paths = {i: os.path.join(intermediates_dir, f"{int(i)}.npz") for i in truth}
+    # Colour-range tuning needs ΔE beyond the default gate: captures are ungated then, and gated
+    # ones already saved by /analyze are recomputed (reused, widened ranges would read ΔE 0)
+    gate_deltaE = not ({'hot_v_min', 'hot_ranges'} & set(grid))
+    missing = [(i, p, gate_deltaE) for i, p in paths.items()
+               if not os.path.exists(p) or (not gate_deltaE and _gated(p))]
+    workers = max(1, min(workers or os.cpu_count() or 1, max(len(truth), 1)))
+    skipped: Dict[int,str] = {}
+    de_cost = deltaE_pixel_cost()
+    t0 = time.perf_counter()
+    with Pool(workers) as pool:
+        for inspection_id, err in pool.imap_unordered(_prepare, missing):
+            if err:
+                skipped[inspection_id] = err
+        prepare_s = time.perf_counter() - t0
+        tasks = [(i, paths[i], truth[i], points, iou_thr, de_cost) for i in sorted(truth) if i not in skipped]
+        results = list(pool.imap_unordered(_evaluate, tasks))
+    evaluate_s = time.perf_counter() - t0 - prepare_s
+
+    settings = []
+    for k, point in enumerate(points):
+        rows = [r['rows'][k] for r in results]
+        tp, fp, fn = (sum(r[f] for r in rows) for f in ('tp', 'fp', 'fn'))
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        settings.append(dict(
+            point=point, tp=tp, fp=fp, fn=fn, precision=precision, recall=recall,
+            f1=2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+            severity_acc=sum(r['severity_ok'] for r in rows) / tp if tp else None,
+            subtype_acc=sum(r['subtype_ok'] for r in rows) / tp if tp else None,
+            runtime_ms=1000.0 * sum(r['runtime_s'] for r in rows) / max(len(rows), 1),
+            deltaE_missing_pixels=sum(r['deltaE_missing'] for r in rows),
+        ))
+    return dict(grid=grid, iou_thr=iou_thr, inspections=len(results), skipped=skipped,
+                grid_points=len(points), shared_stage_runs=sum(r['shared_stages'] for r in results),
+                prepare_s=prepare_s, evaluate_s=evaluate_s, deltaE_s_per_mpx=de_cost * 1e6,
+                settings=settings, pareto=pareto_front(settings))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Calibrate detection thresholds against annotation feedback.")
+    ap.add_argument('--grid', default=None, help="JSON file {param: [values]} (default: DEFAULT_GRID)")
+    ap.add_argument('--db', default=db.DATABASE, help="SQLite database with annotation_logs")
+    ap.add_argument('--intermediates-dir', default=INTERMEDIATES_DIR)
+    ap.add_argument('--workers', type=int, default=None, help="process count (default: CPU count)")
+    ap.add_argument('--iou', type=float, default=IOU_THR, help="IoU for a detection to match an annotation")
+    ap.add_argument('--out', default=None, help="write the full result as JSON")
+    args = ap.parse_args(argv)
+
+    db.DATABASE = args.db
+    grid = DEFAULT_GRID
+    if args.grid:
+        with open(args.grid) as f:
+            grid = json.load(f)
+    res = calibrate(grid, workers=args.workers, iou_thr=args.iou, intermediates_dir=args.intermediates_dir)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(res, f, indent=2)
+
+    print(f"{res['inspections']} inspections ({len(res['skipped'])} skipped), {res['grid_points']} grid points, "
+          f"{res['shared_stage_runs']} mask/skeleton runs; prepare {res['prepare_s']:.1f}s, "
+          f"evaluate {res['evaluate_s']:.1f}s", file=sys.stderr)
+    print(f"{'F1':>6} {'prec':>6} {'recall':>6} {'ms/img':>8}  setting")
+    for s in res['pareto']:
+        print(f"{s['f1']:6.3f} {s['precision']:6.3f} {s['recall']:6.3f} {s['runtime_ms']:8.1f}  {json.dumps(s['point'])}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
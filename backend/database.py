@@ -88,6 +88,7 @@ def delete_transformer(transformer_id):
     """Deletes a transformer and its associated inspections."""
     conn = get_db_connection()
     conn.execute('DELETE FROM inspections WHERE transformer_id = ?', (transformer_id,))
+    conn.execute('DELETE FROM baseline_images WHERE transformer_id = ?', (transformer_id,))
     conn.execute('DELETE FROM transformers WHERE id = ?', (transformer_id,))
     conn.commit()
     conn.close()
@@ -102,6 +103,73 @@ def update_transformer_from_inspection(transformer_id, baseline_image, baseline_
     conn.commit()
     conn.close()
 
+def transformer_exists(transformer_id):
+    """True if a transformer with this id exists."""
+    conn = get_db_connection()
+    row = conn.execute('SELECT 1 FROM transformers WHERE id = ?', (transformer_id,)).fetchone()
+    conn.close()
+    return row is not None
+
+def get_transformer_roi(transformer_id):
+    """The transformer's region of interest (list of [x, y] polygons) or None if none is set."""
+    conn = get_db_connection()
+    row = conn.execute('SELECT roi FROM transformers WHERE id = ?', (transformer_id,)).fetchone()
+    conn.close()
+    return json.loads(row['roi']) if row and row['roi'] else None
+
+def set_transformer_roi(transformer_id, roi):
+    """Stores (or with roi=None clears) a transformer's region of interest; False if no such transformer."""
+    conn = get_db_connection()
+    cursor = conn.execute('UPDATE transformers SET roi = ? WHERE id = ?',
+                          (json.dumps(roi) if roi is not None else None, transformer_id))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount > 0
+
+# --- Baseline Image Functions (multiple baselines per transformer) ---
+
+def get_primary_baseline(transformer_id):
+    """The transformer's own baseline (transformers.baselineImage) as image/weather/uploadDate, or None."""
+    conn = get_db_connection()
+    row = conn.execute('SELECT baselineImage AS image, weather, baselineUploadDate AS uploadDate '
+                       'FROM transformers WHERE id = ?', (transformer_id,)).fetchone()
+    conn.close()
+    return dict_from_row(row) if row and row['image'] else None
+
+def add_baseline_image(transformer_id, image, weather=None, upload_date=None):
+    """Stores an additional baseline image (data URI) for a transformer."""
+    from datetime import datetime
+    conn = get_db_connection()
+    cursor = conn.execute(
+        'INSERT INTO baseline_images (transformer_id, image, weather, uploadDate, created_at) VALUES (?, ?, ?, ?, ?)',
+        (transformer_id, image, weather, upload_date, datetime.now().isoformat())
+    )
+    conn.commit()
+    row = conn.execute('SELECT * FROM baseline_images WHERE id = ?', (cursor.lastrowid,)).fetchone()
+    conn.close()
+    return dict_from_row(row)
+
+def get_baseline_images(transformer_id, include_image=True):
+    """Lists a transformer's baselines; include_image=False skips the (large) image column."""
+    cols = '*' if include_image else 'id, transformer_id, weather, uploadDate, created_at'
+    conn = get_db_connection()
+    rows = conn.execute(f'SELECT {cols} FROM baseline_images WHERE transformer_id = ? ORDER BY id',
+                        (transformer_id,)).fetchall()
+    conn.close()
+    return [dict_from_row(r) for r in rows]
+
+def get_baseline_image(baseline_id):
+    conn = get_db_connection()
+    row = conn.execute('SELECT * FROM baseline_images WHERE id = ?', (baseline_id,)).fetchone()
+    conn.close()
+    return dict_from_row(row)
+
+def delete_baseline_image(baseline_id):
+    conn = get_db_connection()
+    conn.execute('DELETE FROM baseline_images WHERE id = ?', (baseline_id,))
+    conn.commit()
+    conn.close()
+
 # --- Inspection Functions ---
 
 def add_inspection(i):
@@ -134,6 +202,25 @@ def get_all_inspections():
         result.append(inspection_dict)
     return result
 
+def get_inspection_images(inspection_id):
+    """Maintenance image of an inspection and its transformer's baseline (data URIs), or None."""
+    conn = get_db_connection()
+    row = conn.execute(
+        '''SELECT i.transformer_id, i.maintenanceImage, t.baselineImage
+           FROM inspections i JOIN transformers t ON t.id = i.transformer_id
+           WHERE i.id = ?''',
+        (inspection_id,)
+    ).fetchone()
+    conn.close()
+    return dict_from_row(row) if row else None
+
+def get_inspection_transformer_id(inspection_id):
+    """transformer_id of an inspection, or None if it does not exist."""
+    conn = get_db_connection()
+    row = conn.execute('SELECT transformer_id FROM inspections WHERE id = ?', (inspection_id,)).fetchone()
+    conn.close()
+    return row['transformer_id'] if row else None
+
 def update_inspection(i):
     """Updates an existing inspection."""
     conn = get_db_connection()
@@ -33,9 +33,19 @@ def check_tables_exist():
 
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='maintenance_records'")
     records_exists = cursor.fetchone() is not None
+
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='baseline_images'")
+    baselines_exists = cursor.fetchone() is not None
     
     conn.close()
-    return annotations_exists, logs_exists, records_exists
+    return annotations_exists, logs_exists, records_exists, baselines_exists
+
+def check_column_exists(table, column):
+    """Check if a column exists (columns added by later migrations, e.g. transformers.roi)"""
+    conn = sqlite3.connect(DATABASE)
+    cols = [r[1] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+    conn.close()
+    return column in cols
 
 def migrate_database():
     """Add new annotation tables to existing database"""
@@ -119,6 +129,30 @@ def migrate_database():
                 print("✓ Added 'location' column to existing maintenance_records table")
         except Exception as e:
             print(f"(i) Skipped adding location column (maybe already exists): {e}")
+
+        # Region of interest per transformer (JSON polygons in baseline pixels)
+        try:
+            cursor.execute("PRAGMA table_info(transformers)")
+            cols = [r[1] for r in cursor.fetchall()]
+            if 'roi' not in cols:
+                cursor.execute('ALTER TABLE transformers ADD COLUMN roi TEXT')
+                print("✓ Added 'roi' column to existing transformers table")
+        except Exception as e:
+            print(f"(i) Skipped adding roi column (maybe already exists): {e}")
+
+        # Create baseline_images table (multiple baselines per transformer)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS baseline_images (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                transformer_id INTEGER NOT NULL,
+                image TEXT NOT NULL,
+                weather TEXT,
+                uploadDate TEXT,
+                created_at TEXT NOT NULL,
+                FOREIGN KEY (transformer_id) REFERENCES transformers (id) ON DELETE CASCADE
+            )
+        ''')
+        print("✓ Created 'baseline_images' table")
         
         conn.commit()
         print("\n✓ Migration completed successfully!")
@@ -180,9 +214,10 @@ def main():
         return
     
     # Check what already exists
-    annotations_exists, logs_exists, records_exists = check_tables_exist()
+    annotations_exists, logs_exists, records_exists, baselines_exists = check_tables_exist()
+    roi_exists = check_column_exists('transformers', 'roi')
     
-    if annotations_exists and logs_exists and records_exists:
+    if annotations_exists and logs_exists and records_exists and baselines_exists and roi_exists:
         print("\n✓ Annotation tables already exist. No migration needed.")
         print("\nOptions:")
         print("1. Exit (no changes)")
@@ -201,6 +236,8 @@ def main():
     print(f"  - Annotations table exists: {annotations_exists}")
     print(f"  - Annotation logs table exists: {logs_exists}")
     print(f"  - Maintenance records table exists: {records_exists}")
+    print(f"  - Baseline images table exists: {baselines_exists}")
+    print(f"  - Transformers roi column exists: {roi_exists}")
     
     # Create backup
     if backup_database():
@@ -0,0 +1,398 @@
+# pipeline.py
+"""
+The detect_anomalies pipeline as a declared graph of stages, for benchmarking and A/B-testing
+stage variants (benchmark.py --variant). It is not a production path: the API, batch, sequence
+and calibration tools all call detect_anomalies, and this graph has no ROI crop, pre-screen,
+tiling, preview or BaselineCache (the align stage builds its own pyramid and ORB features).
+tests/test_caches.py checks that the default variants still reproduce detect_anomalies, so a
+detection change that is made only on one side fails there.
+
+Each Stage names the artifacts it reads and writes (typed in ARTIFACT_TYPES), the run options
+it depends on, and a function. Pipeline.run orders the stages by their inputs, times each one
+(timings use the StageTimer names of detect_anomalies) and, given a StageCache, skips any stage
+whose variant, options and input digests match an entry it already holds.
+
+Digests are by content: source images are hashed, and a stage's outputs are hashed when it
+runs (stored with its cache entry, so a hit hashes nothing). A stage that re-runs but produces
+the same output therefore leaves everything downstream cached. Options are keyed per field: a
+stage listing 'params.hot_ranges' is invalidated by that DetectionParams field only, so a new
+t_pot re-runs thresholds, mask and what follows, not SSIM, LAB, the hot mask or ΔE. Artifacts
+without a canonical form (the joint and coverage indexes) are digested by their stage's key.
+
+A stage can have several registered variants (implementations with the same outputs); one is
+picked per run, so an aligner or ΔE strategy can be swapped or A/B benchmarked without
+editing detect_anomalies:
+
+    pipe = default_pipeline(StageCache())
+    rep = pipe.run('T1', 'baseline.jpg', 'maintenance.jpg', variants={'align': 'cascade'})
+    pipe.register(Stage('align', ('base_gray', 'ment_bgr'), ALIGN_OUTPUTS, my_aligner, variant='mine'))
+
+    python benchmark.py --variant align=cascade --variant topology=lazy
+
+The default variants reproduce detect_anomalies(align='ecc') exactly (report and overlay).
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, is_dataclass, replace
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import cv2 as cv
+
+from anomaly_cv import (
+    ByteLRU, CoverageIndex, DEFAULT_PARAMS, DELTAE_CHUNK, DetectionReport, ImageSource,
+    JointIndex, PIPELINE_VERSION, TOPO_MARGIN, WindowCoverage, align_gray, blob_table, blobs_from_table,
+    build_wire_skeleton, classify_table, content_hash, deltaE_gate, deltaE_map, find_skeleton_node_arrays,
+    hot_color_mask, image_key, lab_and_hsv, lazy_wire_topology, load_bgr, morphology_clean, overlay_detections,
+    read_bytes, report_to_dict, source_name, ssim, ssim_thresholds, summarize_image, to_gray, warp_color,
+    wire_edges,
+)
+
+# Every artifact a stage may read or write, with the type(s) its value must have
+ARTIFACT_TYPES: Dict[str, Any] = dict(
+    baseline=object, maintenance=object,                          # sources (ImageSource)
+    base_gray=np.ndarray, base_lab=np.ndarray, ment_bgr=np.ndarray,
+    warp=np.ndarray, warp_success=bool, warp_score=float, align_levels=(list, type(None)),
+    ment_aligned_bgr=np.ndarray, ment_aligned_gray=np.ndarray, warp_model=str,
+    mean_ssim=float, t_pot=float, t_fault=float,
+    ment_lab=np.ndarray, ment_hsv=np.ndarray,
+    mask_hot=np.ndarray, deltaE=np.ndarray, deltaE_region=(np.ndarray, type(None)),
+    mask=np.ndarray,
+    skeleton=np.ndarray, joint_index=JointIndex, coverage_index=(CoverageIndex, WindowCoverage),
+    blob_table=np.ndarray, components=int,
+    blobs=list, overlay=np.ndarray,
+)
+SOURCES = ('baseline', 'maintenance')
+# Run options and their defaults; a stage lists the ones it reads in Stage.params, DetectionParams
+# fields as 'params.<field>'
+DEFAULT_OPTIONS: Dict[str, Any] = dict(lean=False, params=DEFAULT_PARAMS)
+
+ALIGN_OUTPUTS = ('warp', 'warp_success', 'warp_score', 'align_levels', 'ment_aligned_bgr', 'ment_aligned_gray',
+                 'warp_model')
+TOPOLOGY_OUTPUTS = ('skeleton', 'joint_index', 'coverage_index')
+# DetectionParams fields read by ssim_thresholds and by classify_table (the hot ranges only reach
+# classification through the mask)
+THRESHOLD_PARAMS = ('params.ssim_split', 'params.t_pot', 'params.t_fault', 'params.t_pot_relaxed',
+                    'params.t_fault_relaxed')
+CLASSIFY_PARAMS = ('params.joint_radius', 'params.coverage_expand', 'params.elong_thr',
+                   'params.full_cover_thr', 'params.point_cover_thr', 'params.rest_cool_thr')
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    inputs: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+    fn: Callable[..., Tuple]       # fn(*inputs, **params) -> tuple of outputs, in order
+    params: Tuple[str, ...] = ()   # options it reads (cache key); 'params.<field>' passes params
+    variant: str = 'default'
+    timing: Optional[str] = None   # timings key it is charged to (default: name)
+
+
+class StageCache:
+    """
+    Stage outputs and their digests keyed by stage, variant, options and input digests;
+    LRU bounded by max_bytes.
+    """
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.memory = ByteLRU(max_bytes)
+
+    @staticmethod
+    def key(stage: Stage, options: Dict[str, Any], digests: Iterable[str]) -> str:
+        blob = json.dumps([PIPELINE_VERSION, stage.name, stage.variant, [_option(options, p) for p in stage.params],
+                           list(digests)], default=str)
+        return content_hash(blob.encode())
+
+    def get(self, key: str) -> Optional[Tuple[Tuple, Tuple[str, ...]]]:
+        """(outputs, output digests) or None."""
+        return self.memory.get(key)
+
+    def put(self, key: str, values: Tuple, digests: Tuple[str, ...]) -> None:
+        self.memory.put(key, (values, digests), sum(_nbytes(v) for v in values) + 64 * len(digests))
+
+    def stats(self) -> Dict[str, int]:
+        return dict(entries=len(self.memory), bytes=self.memory.nbytes, max_bytes=self.memory.max_bytes,
+                    hits=self.memory.hits, misses=self.memory.misses)
+
+
+def _nbytes(value: Any) -> int:
+    """Approximate size: arrays directly, objects by the arrays they hold (one level deep)."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(v) for v in value) + 64 * len(value)
+    if hasattr(value, '__dict__'):
+        return sum(v.nbytes for v in vars(value).values() if isinstance(v, np.ndarray)) + 256
+    return 64
+
+
+def _source_digest(src: ImageSource) -> str:
+    return image_key(read_bytes(src) if isinstance(src, str) else src)
+
+
+def _plain(obj: Any) -> Any:
+    if is_dataclass(obj):
+        return asdict(obj)
+    raise TypeError(type(obj).__name__)
+
+
+def _digest(value: Any, fallback: str) -> str:
+    """Content digest of an artifact: arrays by dtype, shape and bytes, plain values as JSON."""
+    if isinstance(value, np.ndarray):
+        h = hashlib.sha256(f"{value.dtype}{value.shape}".encode())
+        h.update(np.ascontiguousarray(value))
+        return h.hexdigest()
+    try:
+        return content_hash(json.dumps(value, default=_plain).encode())
+    except (TypeError, ValueError):
+        return fallback
+
+
+def _option(options: Dict[str, Any], name: str) -> Any:
+    """Value of a run option; 'params.t_pot' is one field of the params option."""
+    head, _, attr = name.partition('.')
+    return getattr(options[head], attr) if attr else options[head]
+
+
+def _option_kwargs(stage: Stage, options: Dict[str, Any]) -> Dict[str, Any]:
+    return {head: options[head] for head in (p.partition('.')[0] for p in stage.params)}
+
+
+class Pipeline:
+    """Registered stages (one default variant each) and the runner that executes the graph."""
+    def __init__(self, cache: StageCache = None):
+        self.cache = cache
+        self.stages: "OrderedDict[str, Dict[str, Stage]]" = OrderedDict()
+        self.defaults: Dict[str, str] = {}
+
+    def register(self, stage: Stage, default: bool = False) -> Stage:
+        """Add a stage or a variant of one; the first variant of a stage is its default."""
+        for name in stage.inputs + stage.outputs:
+            if name not in ARTIFACT_TYPES:
+                raise ValueError(f"Stage {stage.name}: unknown artifact {name!r}")
+        for name in stage.params:
+            head, _, attr = name.partition('.')
+            if head not in DEFAULT_OPTIONS or (attr and not hasattr(DEFAULT_OPTIONS[head], attr)):
+                raise ValueError(f"Stage {stage.name}: unknown option {name!r}")
+        variants = self.stages.setdefault(stage.name, {})
+        if variants and set(stage.outputs) != set(next(iter(variants.values())).outputs):
+            raise ValueError(f"Stage {stage.name}: variant {stage.variant!r} changes the outputs")
+        variants[stage.variant] = stage
+        if default or stage.name not in self.defaults:
+            self.defaults[stage.name] = stage.variant
+        return stage
+
+    def variants(self) -> Dict[str, List[str]]:
+        """Registered variants per stage (default first)."""
+        return {name: sorted(v, key=lambda k: k != self.defaults[name]) for name, v in self.stages.items()}
+
+    def plan(self, variants: Dict[str, str] = None) -> List[Stage]:
+        """The chosen variant of every stage in an order where inputs are produced before use."""
+        variants = variants or {}
+        for name, variant in variants.items():
+            if name not in self.stages or variant not in self.stages[name]:
+                raise ValueError(f"Unknown stage variant {name}={variant}")
+        pending = [self.stages[n][variants.get(n, self.defaults[n])] for n in self.stages]
+        available, order = set(SOURCES), []
+        while pending:
+            ready = next((s for s in pending if available.issuperset(s.inputs)), None)
+            if ready is None:
+                missing = sorted({i for s in pending for i in s.inputs} - available
+                                 - {o for s in pending for o in s.outputs})
+                raise ValueError(f"Stage graph cannot be ordered (missing inputs {missing} or a cycle)")
+            pending.remove(ready)
+            order.append(ready)
+            available.update(ready.outputs)
+        return order
+
+    def execute(self, baseline: ImageSource, maintenance: ImageSource, variants: Dict[str, str] = None,
+                timings: Dict[str, float] = None, hooks: List[Callable] = None,
+                stats: List[Dict[str, Any]] = None, **options) -> Dict[str, Any]:
+        """
+        Run the graph and return every artifact. timings: filled with seconds per stage timing
+        name. hooks: called as hook(stage, variant, seconds, cached) after each stage. stats: if
+        given, receives {stage, variant, time_s, cached} per stage.
+        """
+        unknown = set(options) - set(DEFAULT_OPTIONS)
+        if unknown:
+            raise TypeError(f"Unknown pipeline options: {sorted(unknown)}")
+        options = {**DEFAULT_OPTIONS, **{k: v for k, v in options.items() if v is not None}}
+        timings = timings if timings is not None else {}
+        artifacts: Dict[str, Any] = dict(baseline=baseline, maintenance=maintenance)
+        digests = {s: _source_digest(artifacts[s]) for s in SOURCES} if self.cache is not None else {}
+
+        for stage in self.plan(variants):
+            t0 = time.perf_counter()
+            key = entry = None
+            if self.cache is not None:
+                key = StageCache.key(stage, options, (digests[i] for i in stage.inputs))
+                entry = self.cache.get(key)
+            cached = entry is not None
+            if cached:
+                values, out_digests = entry
+            else:
+                values = stage.fn(*(artifacts[i] for i in stage.inputs), **_option_kwargs(stage, options))
+                for name, value in zip(stage.outputs, values):
+                    if not isinstance(value, ARTIFACT_TYPES[name]):
+                        raise TypeError(f"Stage {stage.name}/{stage.variant}: {name} is {type(value).__name__}")
+                if key is not None:
+                    out_digests = tuple(_digest(v, f"{key}:{n}") for n, v in zip(stage.outputs, values))
+                    self.cache.put(key, values, out_digests)
+            artifacts.update(zip(stage.outputs, values))
+            if key is not None:
+                digests.update(zip(stage.outputs, out_digests))
+            dt = time.perf_counter() - t0
+            timing = stage.timing or stage.name
+            timings[timing] = timings.get(timing, 0.0) + dt
+            if stats is not None:
+                stats.append(dict(stage=stage.name, variant=stage.variant, time_s=dt, cached=cached))
+            for hook in hooks or ():
+                hook(stage.name, stage.variant, dt, cached)
+        return artifacts
+
+    def run(self, transformer_id: str, baseline: ImageSource, maintenance: ImageSource,
+            out_overlay_path: Optional[str] = None, out_json_path: Optional[str] = None,
+            variants: Dict[str, str] = None, timings: Dict[str, float] = None, instrument: bool = False,
+            outputs: Dict[str, Any] = None, hooks: List[Callable] = None, **options) -> DetectionReport:
+        """
+        detect_anomalies over the stage graph; out paths, timings, instrument and outputs as there.
+        options: lean, params. variants: {stage: variant}, see variants().
+        """
+        timings = timings if timings is not None else {}
+        stats: List[Dict[str, Any]] = []
+        a = self.execute(baseline, maintenance, variants, timings, hooks, stats, **options)
+        t0 = time.perf_counter()
+        blobs = [replace(b) for b in a['blobs']]   # cached BlobDets stay untouched by callers
+        if out_overlay_path:
+            cv.imwrite(out_overlay_path, a['overlay'])
+        if outputs is not None:
+            outputs['overlay'] = cv.imencode('.png', a['overlay'])[1].tobytes()
+        timings['overlay'] = timings.get('overlay', 0.0) + time.perf_counter() - t0
+        rep = DetectionReport(
+            transformer_id=transformer_id,
+            baseline_path=source_name(baseline),
+            maintenance_path=source_name(maintenance),
+            warp_model=a['warp_model'],
+            warp_success=a['warp_success'],
+            warp_score=a['warp_score'],
+            mean_ssim=a['mean_ssim'],
+            image_level_label=summarize_image(blobs),
+            blobs=blobs
+        )
+        if instrument:
+            H, W = a['base_gray'].shape
+            rep.instrumentation = dict(mode='pipeline', timings=timings, stages=stats,
+                                       variants={s['stage']: s['variant'] for s in stats},
+                                       image_pixels=int(H * W), components=a['components'], blobs=len(blobs))
+            if self.cache is not None:
+                rep.instrumentation['stage_cache'] = self.cache.stats()
+        if out_json_path:
+            t0 = time.perf_counter()
+            with open(out_json_path, "w") as f:
+                json.dump(report_to_dict(rep), f, indent=2)
+            timings['json'] = timings.get('json', 0.0) + time.perf_counter() - t0
+        return rep
+
+
+# ---------- Stage functions ----------
+def _baseline(baseline, lean):
+    base_bgr = load_bgr(baseline)
+    return to_gray(base_bgr), lab_and_hsv(base_bgr, lean=lean)[0]
+
+def _decode(maintenance):
+    return (load_bgr(maintenance),)
+
+def _aligner(mode: str) -> Callable:
+    def align(base_gray, ment_bgr):
+        warp, ment_aligned_gray, ok, score, levels = align_gray(base_gray, to_gray(ment_bgr), mode)
+        H, W = base_gray.shape
+        ment_aligned_bgr, warp_model = warp_color(ment_bgr, warp, (W, H))
+        return warp, bool(ok), float(score), levels, ment_aligned_bgr, ment_aligned_gray, warp_model
+    return align
+
+def _ssim(base_gray, ment_aligned_gray):
+    return (float(ssim(base_gray, ment_aligned_gray, data_range=255)),)
+
+def _thresholds(mean_ssim, params):
+    t_pot, t_fault = ssim_thresholds(mean_ssim, params)
+    return float(t_pot), float(t_fault)
+
+def _lab(ment_aligned_bgr, lean):
+    return lab_and_hsv(ment_aligned_bgr, lean=lean)
+
+def _hot_mask(ment_hsv, params):
+    return (hot_color_mask(ment_hsv, params.hot_ranges),)
+
+def _deltaE_gated(base_lab, ment_lab, mask_hot, lean):
+    gate = deltaE_gate(mask_hot)
+    return deltaE_map(base_lab, ment_lab, gate=gate, chunk=DELTAE_CHUNK if lean else None), gate
+
+def _deltaE_full(base_lab, ment_lab, lean):
+    return deltaE_map(base_lab, ment_lab, chunk=DELTAE_CHUNK if lean else None), None
+
+def _mask(deltaE, mask_hot, t_pot):
+    mask = cv.compare(deltaE, t_pot, cv.CMP_GE)
+    cv.bitwise_and(mask_hot, mask, dst=mask)
+    return (morphology_clean(mask),)
+
+def _topology_full(ment_aligned_bgr, mask):
+    skel, wire_band = build_wire_skeleton(None, mask, edges=wire_edges(ment_aligned_bgr))
+    return skel, JointIndex(np.concatenate(find_skeleton_node_arrays(skel))), CoverageIndex(skel, mask, wire_band)
+
+def _topology_lazy(ment_aligned_bgr, mask, blob_table, params):
+    margin = max(TOPO_MARGIN, params.coverage_expand + 1, params.joint_radius)
+    skel, joints, _ = lazy_wire_topology(ment_aligned_bgr, mask, blob_table['bbox'].tolist(), margin=margin)
+    return skel, JointIndex(joints), WindowCoverage(skel, mask)
+
+def _blob_props(mask, deltaE, ment_hsv):
+    counts: Dict[str, int] = {}
+    table = blob_table(mask, deltaE, ment_hsv, counts=counts)
+    return table, counts['components']
+
+def _classify(blob_table, t_pot, t_fault, joint_index, coverage_index, params):
+    # classify_table fills its table in place: work on a copy so a cached blob_table stays as produced
+    return (blobs_from_table(classify_table(blob_table.copy(), t_pot, t_fault, joint_index, coverage_index, params)),)
+
+def _overlay(ment_aligned_bgr, blobs):
+    return (overlay_detections(ment_aligned_bgr, blobs),)
+
+
+def default_pipeline(cache: StageCache = None) -> Pipeline:
+    """The detect_anomalies stages, with align ecc|pyramid|cascade, deltaE gated|full, topology full|lazy."""
+    p = Pipeline(cache)
+    p.register(Stage('baseline', ('baseline',), ('base_gray', 'base_lab'), _baseline, ('lean',), timing='decode'))
+    p.register(Stage('decode', ('maintenance',), ('ment_bgr',), _decode))
+    for mode in ('ecc', 'pyramid', 'cascade'):
+        p.register(Stage('align', ('base_gray', 'ment_bgr'), ALIGN_OUTPUTS, _aligner(mode), variant=mode))
+    p.register(Stage('ssim', ('base_gray', 'ment_aligned_gray'), ('mean_ssim',), _ssim))
+    p.register(Stage('thresholds', ('mean_ssim',), ('t_pot', 't_fault'), _thresholds, THRESHOLD_PARAMS,
+                     timing='ssim'))
+    p.register(Stage('lab', ('ment_aligned_bgr',), ('ment_lab', 'ment_hsv'), _lab, ('lean',)))
+    p.register(Stage('hot_mask', ('ment_hsv',), ('mask_hot',), _hot_mask, ('params.hot_ranges',), timing='mask'))
+    p.register(Stage('deltaE', ('base_lab', 'ment_lab', 'mask_hot'), ('deltaE', 'deltaE_region'), _deltaE_gated,
+                     ('lean',), variant='gated'))
+    p.register(Stage('deltaE', ('base_lab', 'ment_lab'), ('deltaE', 'deltaE_region'), _deltaE_full,
+                     ('lean',), variant='full'))
+    p.register(Stage('mask', ('deltaE', 'mask_hot', 't_pot'), ('mask',), _mask))
+    p.register(Stage('topology', ('ment_aligned_bgr', 'mask'), TOPOLOGY_OUTPUTS, _topology_full,
+                     variant='full', timing='skeleton'))
+    p.register(Stage('topology', ('ment_aligned_bgr', 'mask', 'blob_table'), TOPOLOGY_OUTPUTS, _topology_lazy,
+                     ('params.coverage_expand', 'params.joint_radius'), variant='lazy', timing='skeleton'))
+    p.register(Stage('blob_props', ('mask', 'deltaE', 'ment_hsv'), ('blob_table', 'components'), _blob_props))
+    p.register(Stage('classify', ('blob_table', 't_pot', 't_fault', 'joint_index', 'coverage_index'), ('blobs',),
+                     _classify, CLASSIFY_PARAMS))
+    p.register(Stage('overlay', ('ment_aligned_bgr', 'blobs'), ('overlay',), _overlay))
+    return p
+
+
+def parse_variants(specs: Iterable[str]) -> Dict[str, str]:
+    """['align=cascade', 'topology=lazy'] -> {'align': 'cascade', 'topology': 'lazy'}."""
+    out = {}
+    for spec in specs:
+        stage, sep, variant = spec.partition('=')
+        if not sep or not stage or not variant:
+            raise ValueError(f"Expected STAGE=VARIANT, got {spec!r}")
+        out[stage.strip()] = variant.strip()
+    return out
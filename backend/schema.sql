@@ -1,3 +1,4 @@
+DROP TABLE IF EXISTS baseline_images;
 DROP TABLE IF EXISTS annotation_logs;
 DROP TABLE IF EXISTS annotations;
 DROP TABLE IF EXISTS inspections;
@@ -13,7 +14,20 @@ CREATE TABLE transformers (
     baselineImage TEXT,
     baselineUploadDate TEXT,
     weather TEXT,
-    location TEXT
+    location TEXT,
+    roi TEXT -- JSON polygon(s) [[x, y], ...] in baseline pixels; /analyze only inspects inside it
+);
+
+-- Additional baselines per transformer (different weather / angles); /analyze can pick
+-- the closest one to a maintenance image instead of using the single baselineImage
+CREATE TABLE baseline_images (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    transformer_id INTEGER NOT NULL,
+    image TEXT NOT NULL, -- data URI, same format as transformers.baselineImage
+    weather TEXT, -- Sunny / Cloudy / Rainy
+    uploadDate TEXT,
+    created_at TEXT NOT NULL,
+    FOREIGN KEY (transformer_id) REFERENCES transformers (id) ON DELETE CASCADE
 );
 
 CREATE TABLE inspections (
@@ -0,0 +1,314 @@
+# sequence_detect.py
+"""
+Streaming inspection of a frame sequence (video file, frame directory or any iterator of
+images) against one baseline.
+
+Consecutive frames of a drone pass or handheld clip are nearly identical, so per frame:
+  - the baseline is prepared once (gray, LAB, ORB features, pyramid);
+  - ECC starts from the previous frame's warp, which converges in a few iterations;
+  - frames whose small gray thumbnail barely differs from the last processed frame are
+    skipped and repeat that frame's report;
+  - blobs are tracked across frames by bounding-box IoU. Every frame is aligned to the
+    baseline, so boxes of a persistent hotspot stay put even while the camera moves.
+Results are yielded one frame at a time, together with the running throughput.
+
+Usage:
+    for res in detect_sequence('T1', 'baseline.jpg', iter_frames('flight.mp4')):
+        print(res.index, res.report.image_level_label, res.track_ids, f"{res.fps:.1f} fps")
+
+    python sequence_detect.py T1 baseline.jpg flight.mp4 results.jsonl --video-out overlay.mp4
+    python anomaly_cv.py sequence T1 baseline.jpg frames_dir/ results.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import cv2 as cv
+
+from anomaly_cv import (
+    BaselineArtifacts, BaselineCache, BlobDet, bbox_iou, DetectionParams, DetectionReport, ImageSource, StageTimer,
+    align_cascade, build_baseline_artifacts, detect_blobs, ecc_align, ecc_align_pyramid, lab_and_hsv, load_bgr,
+    overlay_detections, read_bytes, report_to_dict, source_name, ssim, ssim_thresholds,
+    summarize_image, to_gray, warp_color,
+)
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+SKIP_THUMB_SIDE = 64      # frames are compared on a thumbnail this wide
+SKIP_MAD = 1.5            # mean |Δgray| (0..255) below which a frame counts as a repeat
+SEEDED_ECC_ITERS = 50     # ECC cap when starting from the previous warp
+TRACK_IOU = 0.3
+TRACK_MAX_MISSED = 5      # processed frames a track survives without a match
+
+
+@dataclass
+class Track:
+    track_id: int
+    bbox: Tuple[int,int,int,int]   # latest x,y,w,h in baseline coordinates
+    classification: str
+    subtype: str
+    first_frame: int
+    last_frame: int
+    hits: int = 1
+    missed: int = 0
+    peak_severity: float = 0.0
+
+
+@dataclass
+class FrameResult:
+    index: int                     # position in the input sequence
+    skipped: bool                  # near-duplicate: report/track_ids repeat the last processed frame
+    report: Optional[DetectionReport]
+    track_ids: List[int]           # one per report.blobs entry
+    seeded: bool                   # ECC converged from the previous frame's warp
+    elapsed_s: float               # wall time spent on this frame
+    fps: float                     # frames (processed + skipped) per second so far
+    overlay: Optional[np.ndarray] = None
+    timings: Dict[str,float] = field(default_factory=dict)
+
+
+def iter_frames(source: str, stride: int = 1) -> Iterator[ImageSource]:
+    """Frames of a video file (BGR arrays) or image paths of a directory in sorted order."""
+    if os.path.isdir(source):
+        names = sorted(n for n in os.listdir(source) if n.lower().endswith(IMAGE_EXTS))
+        for n in names[::stride]:
+            yield os.path.join(source, n)
+        return
+    cap = cv.VideoCapture(source)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video: {source}")
+    try:
+        i = 0
+        while True:
+            ok = cap.grab()
+            if not ok:
+                break
+            if i % stride == 0:
+                ok, frame = cap.retrieve()
+                if ok:
+                    yield frame
+            i += 1
+    finally:
+        cap.release()
+
+
+def frame_thumb(gray: np.ndarray) -> np.ndarray:
+    h, w = gray.shape[:2]
+    size = (SKIP_THUMB_SIDE, max(1, round(h * SKIP_THUMB_SIDE / float(w))))
+    return cv.resize(gray, size, interpolation=cv.INTER_AREA).astype(np.float32)
+
+
+class BlobTracker:
+    """Greedy IoU association of per-frame blobs with live tracks (baseline coordinates)."""
+    def __init__(self, iou: float = TRACK_IOU, max_missed: int = TRACK_MAX_MISSED):
+        self.iou = iou
+        self.max_missed = max_missed
+        self.tracks: Dict[int,Track] = {}
+        self.finished: List[Track] = []
+        self._next_id = 1
+
+    def update(self, frame_index: int, blobs: List[BlobDet]) -> List[int]:
+        """Track id for every blob; unmatched blobs open new tracks, stale tracks are retired."""
+        live = list(self.tracks.values())
+        pairs = sorted(((bbox_iou(t.bbox, b.bbox), ti, bi) for ti, t in enumerate(live)
+                        for bi, b in enumerate(blobs)), reverse=True)
+        ids: List[Optional[int]] = [None] * len(blobs)
+        used = set()
+        for iou, ti, bi in pairs:
+            if iou < self.iou:
+                break
+            if ti in used or ids[bi] is not None:
+                continue
+            used.add(ti)
+            t, b = live[ti], blobs[bi]
+            t.bbox, t.classification, t.subtype = b.bbox, b.classification, b.subtype
+            t.last_frame, t.hits, t.missed = frame_index, t.hits + 1, 0
+            t.peak_severity = max(t.peak_severity, b.severity)
+            ids[bi] = t.track_id
+        for ti, t in enumerate(live):
+            if ti not in used:
+                t.missed += 1
+                if t.missed > self.max_missed:
+                    self.finished.append(self.tracks.pop(t.track_id))
+        for bi, b in enumerate(blobs):
+            if ids[bi] is None:
+                t = Track(self._next_id, b.bbox, b.classification, b.subtype, frame_index, frame_index,
+                          peak_severity=b.severity)
+                self.tracks[t.track_id] = t
+                ids[bi] = t.track_id
+                self._next_id += 1
+        return ids
+
+    def all_tracks(self) -> List[Track]:
+        return sorted(self.finished + list(self.tracks.values()), key=lambda t: t.track_id)
+
+
+def _prepare_baseline(baseline: ImageSource, baseline_cache: Optional[BaselineCache]) -> BaselineArtifacts:
+    if baseline_cache is not None:
+        return baseline_cache.get(read_bytes(baseline) if isinstance(baseline, str) else baseline)
+    return build_baseline_artifacts(load_bgr(baseline))
+
+
+def _detect_frame(transformer_id: str, baseline: ImageSource, frame: ImageSource, base: BaselineArtifacts,
+                  base_features, ment_bgr: np.ndarray, ment_gray: np.ndarray, warp_init: Optional[np.ndarray],
+                  align: str, gate_deltaE: bool, lean: bool, params: Optional[DetectionParams],
+                  timer: StageTimer, lazy_topology: bool = False) -> Tuple[DetectionReport, np.ndarray, np.ndarray, bool]:
+    """(report, warp, aligned BGR, seeded) for one frame; same stages as detect_anomalies."""
+    seeded = False
+    if align == 'cascade':
+        warp, _, ok, score, _ = align_cascade(base.gray, ment_gray, base_pyramid=base.pyramid,
+                                              base_features=base_features)
+    else:
+        if warp_init is not None:
+            # No ORB here: a failed seeded ECC falls through to the configured alignment
+            warp, _, ok, score = ecc_align(base.gray, ment_gray, warp_init=warp_init,
+                                           max_iters=SEEDED_ECC_ITERS, orb_fallback=False)
+            seeded = ok
+        if not seeded and align == 'pyramid':
+            warp, _, ok, score, _ = ecc_align_pyramid(base.gray, ment_gray, base_pyramid=base.pyramid,
+                                                      base_features=base_features)
+        elif not seeded:
+            warp, _, ok, score = ecc_align(base.gray, ment_gray, base_features=base_features)
+    H, W = base.gray.shape
+    ment_aligned_bgr, warp_model = warp_color(ment_bgr, warp, (W, H))
+    timer.mark('align')
+
+    mean_ssim = ssim(base.gray, to_gray(ment_aligned_bgr), data_range=255)
+    timer.mark('ssim')
+    ment_lab, ment_hsv = lab_and_hsv(ment_aligned_bgr, lean=lean)
+    timer.mark('lab')
+    t_pot, t_fault = ssim_thresholds(mean_ssim, params)
+    blobs = detect_blobs(base.lab, ment_lab, ment_hsv, ment_aligned_bgr, t_pot, t_fault,
+                         gate_deltaE=gate_deltaE, timer=timer, lean=lean, params=params,
+                         lazy_topology=lazy_topology)
+    rep = DetectionReport(
+        transformer_id=transformer_id,
+        baseline_path=source_name(baseline),
+        maintenance_path=source_name(frame),
+        warp_model=warp_model,
+        warp_success=bool(ok),
+        warp_score=float(score),
+        mean_ssim=float(mean_ssim),
+        image_level_label=summarize_image(blobs),
+        blobs=blobs
+    )
+    return rep, warp, ment_aligned_bgr, seeded
+
+
+def detect_sequence(transformer_id: str, baseline: ImageSource, frames: Iterable[ImageSource],
+                    baseline_cache: BaselineCache = None, align: str = 'ecc', gate_deltaE: bool = True,
+                    lean: bool = False, skip_mad: float = SKIP_MAD, track_iou: float = TRACK_IOU,
+                    max_missed: int = TRACK_MAX_MISSED, draw_overlay: bool = False,
+                    tracker: BlobTracker = None, params: DetectionParams = None,
+                    lazy_topology: bool = False) -> Iterator[FrameResult]:
+    """
+    Generator over frames: one FrameResult per input frame, produced as soon as it is done.
+    align applies to the first frame and to any frame whose seeded ECC failed; 'cascade' runs
+    on every frame instead of seeding (its identity check already makes a static camera cheap).
+    skip_mad: 0 disables near-duplicate skipping.
+    draw_overlay: attach the annotated aligned frame (with track ids); skipped frames repeat it.
+    tracker: pass a BlobTracker to read the full track list after (or during) the run.
+    params: thresholds and classification constants, as in detect_anomalies.
+    lazy_topology: wire skeleton only around each frame's blobs (see detect_blobs).
+    """
+    base = _prepare_baseline(baseline, baseline_cache)
+    base_features = base.features   # unpacked on first use by the ORB fallback
+    tracker = tracker if tracker is not None else BlobTracker(track_iou, max_missed)
+    t_start = time.perf_counter()
+    warp_prev: Optional[np.ndarray] = None
+    thumb_prev: Optional[np.ndarray] = None
+    last: Optional[FrameResult] = None
+
+    for index, frame in enumerate(frames):
+        t0 = time.perf_counter()
+        timer = StageTimer()
+        ment_bgr = load_bgr(frame)
+        ment_gray = to_gray(ment_bgr)
+        thumb = frame_thumb(ment_gray)
+        timer.mark('decode')
+
+        if (last is not None and skip_mad > 0 and thumb.shape == thumb_prev.shape
+                and float(np.mean(np.abs(thumb - thumb_prev))) < skip_mad):
+            res = FrameResult(index, True, last.report, last.track_ids, False, time.perf_counter() - t0, 0.0,
+                              overlay=last.overlay, timings=timer.times)
+        else:
+            rep, warp, aligned_bgr, seeded = _detect_frame(
+                transformer_id, baseline, frame, base, base_features, ment_bgr, ment_gray,
+                warp_prev if warp_prev is not None and warp_prev.shape == (2, 3) else None,
+                align, gate_deltaE, lean, params, timer, lazy_topology)
+            # Only a converged affine warp is a useful seed; homography/identity restart from scratch
+            warp_prev = warp if rep.warp_success and warp.shape == (2, 3) else None
+            thumb_prev = thumb
+            track_ids = tracker.update(index, rep.blobs)
+            timer.mark('track')
+            overlay = None
+            if draw_overlay:
+                overlay = overlay_detections(aligned_bgr, rep.blobs)
+                for b, tid in zip(rep.blobs, track_ids):
+                    x, y, w, h = b.bbox
+                    cv.putText(overlay, f"#{tid}", (x, y + h + 14), cv.FONT_HERSHEY_SIMPLEX, 0.5,
+                               (255, 255, 255), 1, cv.LINE_AA)
+                timer.mark('overlay')
+            res = FrameResult(index, False, rep, track_ids, seeded, time.perf_counter() - t0, 0.0,
+                              overlay=overlay, timings=timer.times)
+            last = res
+        res.fps = (index + 1) / max(time.perf_counter() - t_start, 1e-9)
+        yield res
+
+
+def frame_result_to_dict(res: FrameResult) -> Dict:
+    d = dict(index=res.index, skipped=res.skipped, seeded=res.seeded, track_ids=res.track_ids,
+             elapsed_s=res.elapsed_s, fps=res.fps, timings=res.timings)
+    if res.report is not None:
+        d['report'] = report_to_dict(res.report)
+    return d
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Anomaly detection over a video or frame sequence.")
+    ap.add_argument('transformer_id')
+    ap.add_argument('baseline', help="baseline image")
+    ap.add_argument('source', help="video file or directory of frames (sorted by name)")
+    ap.add_argument('output', help="results file, one JSON object per frame")
+    ap.add_argument('--video-out', default=None, help="write annotated aligned frames to this video")
+    ap.add_argument('--fps-out', type=float, default=10.0, help="frame rate of --video-out")
+    ap.add_argument('--stride', type=int, default=1, help="use every Nth input frame")
+    ap.add_argument('--skip-mad', type=float, default=SKIP_MAD, help="near-duplicate threshold (0: off)")
+    ap.add_argument('--track-iou', type=float, default=TRACK_IOU)
+    ap.add_argument('--align', choices=['ecc', 'pyramid', 'cascade'], default='ecc')
+    ap.add_argument('--lean', action='store_true', help="memory-lean mode (float32 LAB, chunked ΔE)")
+    ap.add_argument('--lazy-topology', action='store_true', help="wire skeleton only around detected blobs")
+    args = ap.parse_args(argv)
+
+    tracker = BlobTracker(args.track_iou)
+    writer = None
+    n = skipped = 0
+    fps = 0.0
+    with open(args.output, 'w') as out:
+        for res in detect_sequence(args.transformer_id, args.baseline, iter_frames(args.source, args.stride),
+                                   align=args.align, lean=args.lean, skip_mad=args.skip_mad,
+                                   lazy_topology=args.lazy_topology,
+                                   draw_overlay=args.video_out is not None, tracker=tracker):
+            out.write(json.dumps(frame_result_to_dict(res)) + "\n")
+            out.flush()
+            if args.video_out and res.overlay is not None:
+                if writer is None:
+                    h, w = res.overlay.shape[:2]
+                    writer = cv.VideoWriter(args.video_out, cv.VideoWriter_fourcc(*'mp4v'), args.fps_out, (w, h))
+                writer.write(res.overlay)
+            n += 1
+            skipped += res.skipped
+            fps = res.fps
+    if writer is not None:
+        writer.release()
+    tracks = tracker.all_tracks()
+    print(f"Sequence: {n} frames ({skipped} skipped), {len(tracks)} tracks, {fps:.2f} fps", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
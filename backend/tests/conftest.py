@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+DATA = os.path.join(os.path.dirname(BACKEND), 'data')
+
+
+@pytest.fixture(scope='session')
+def pair():
+    """(baseline, maintenance) paths of a small bundled pair (T2, 493x300) with several blobs."""
+    paths = (os.path.join(DATA, 'T2', 'normal', 'T2_normal_001.png'),
+             os.path.join(DATA, 'T2', 'faulty', 'T2_faulty_001.png'))
+    if not all(os.path.exists(p) for p in paths):
+        pytest.skip('bundled data/T2 images not found')
+    return paths
+
+
+def blob_keys(rep, deltaE=False):
+    """Comparable per-blob summary of a DetectionReport."""
+    return [(b.bbox, b.area, b.classification, b.subtype) + ((round(b.mean_deltaE, 2),) if deltaE else ())
+            for b in rep.blobs]
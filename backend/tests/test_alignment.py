@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+import anomaly_cv as A
+from conftest import DATA, blob_keys
+
+
+@pytest.fixture(scope='module')
+def t6_pair():
+    """A pair whose cascade falls through to the ORB homography."""
+    paths = (os.path.join(DATA, 'T6', 'normal', 'T6_normal_001.jpg'),
+             os.path.join(DATA, 'T6', 'faulty', 'T6_faulty_001.jpg'))
+    if not all(os.path.exists(p) for p in paths):
+        pytest.skip('bundled data/T6 images not found')
+    return paths
+
+
+def test_orb_homography_is_deterministic(t6_pair):
+    base, ment = (A.to_gray(A.read_bgr(p)) for p in t6_pair)
+    first = A.orb_homography(base, ment)
+    second = A.orb_homography(base, ment)
+    assert first[2] and (first[0] == second[0]).all() and first[3] == second[3]
+
+
+def test_cascade_detection_is_deterministic(t6_pair):
+    runs = [A.detect_anomalies('T6', *t6_pair, None, None, align='cascade') for _ in range(2)]
+    assert runs[0].blobs and blob_keys(runs[0], deltaE=True) == blob_keys(runs[1], deltaE=True)
@@ -0,0 +1,28 @@
+import os
+
+import numpy as np
+
+import anomaly_cv as A
+
+
+def test_baseline_cache_tiers(pair, tmp_path):
+    data = [A.read_bytes(p) for p in pair]
+    cache = A.BaselineCache(cache_dir=str(tmp_path))
+    art = cache.get(data[0])
+    assert cache.get(data[0]) is art and cache.stats()['hits'] == 1
+
+    fresh = A.BaselineCache(cache_dir=str(tmp_path))
+    loaded = fresh.get(data[0])
+    assert fresh.disk_hits == 1
+    assert np.array_equal(loaded.gray, art.gray)
+    assert loaded.lab.dtype == art.lab.dtype and np.array_equal(loaded.lab, art.lab)   # ΔE unchanged by the tier
+    assert loaded.features()[1].shape == art.features()[1].shape
+
+    # the disk tier keeps the most recently used entries that fit disk_max_bytes
+    other = cache.get(data[1])
+    size = max(os.path.getsize(os.path.join(str(tmp_path), f"{a.key}.npz")) for a in (art, other))
+    capped_dir = tmp_path / 'capped'
+    capped = A.BaselineCache(cache_dir=str(capped_dir), disk_max_bytes=size + 1)
+    capped.get(data[0])
+    capped.get(data[1])
+    assert sorted(os.listdir(str(capped_dir))) == [f"{other.key}.npz"]
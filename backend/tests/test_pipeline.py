@@ -0,0 +1,39 @@
+from dataclasses import replace
+
+import anomaly_cv as A
+import pipeline as P
+from conftest import blob_keys
+
+
+def _cached_stages(pipe, pair, **options):
+    stats = []
+    pipe.run('T2', *pair, hooks=[lambda stage, variant, dt, cached: stats.append((stage, cached))], **options)
+    return {stage for stage, cached in stats if cached}, {stage for stage, cached in stats if not cached}
+
+
+def test_stage_cache_keys(pair, monkeypatch):
+    pipe = P.default_pipeline(P.StageCache())
+    cached, ran = _cached_stages(pipe, pair)
+    assert not cached
+    cached, ran = _cached_stages(pipe, pair)
+    assert not ran
+
+    # a new t_pot re-runs thresholds and mask; SSIM, LAB, the hot mask and ΔE stay cached
+    cached, ran = _cached_stages(pipe, pair, params=replace(A.DEFAULT_PARAMS, t_pot=6.0, t_pot_relaxed=7.0))
+    assert {'thresholds', 'mask'} <= ran
+    assert {'baseline', 'decode', 'align', 'ssim', 'lab', 'hot_mask', 'deltaE'} <= cached
+    # a classification constant re-runs classify (and the overlay it draws) only
+    cached, ran = _cached_stages(pipe, pair, params=replace(A.DEFAULT_PARAMS, elong_thr=2.0))
+    assert ran <= {'classify', 'overlay'} and 'classify' in ran
+    # a new maintenance image reuses the baseline stage
+    cached, ran = _cached_stages(pipe, (pair[0], pair[1].replace('_001.png', '_002.png.png')))
+    assert 'baseline' in cached and {'decode', 'align'} <= ran
+
+    monkeypatch.setattr(P, 'PIPELINE_VERSION', P.PIPELINE_VERSION + '-test')
+    cached, ran = _cached_stages(pipe, pair)
+    assert not cached
+
+
+def test_pipeline_matches_detect(pair):
+    rep = P.default_pipeline().run('T2', *pair)
+    assert blob_keys(rep, deltaE=True) == blob_keys(A.detect_anomalies('T2', *pair, None, None), deltaE=True)
@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+import anomaly_cv as A
+
+
+@pytest.mark.parametrize('y0', [100, 101])   # both parities of the stride-2 sample grid
+def test_prescreen_keeps_thin_hot_line(pair, y0):
+    base = A.read_bgr(pair[0])
+    ment = base.copy()
+    ment[y0:y0 + 3, 50:351] = (0, 0, 255)   # 301x3 px red line
+    ref = A.detect_anomalies('T2', base, ment, None, None)
+    assert [b.bbox for b in ref.blobs] == [(50, y0, 301, 3)]
+
+    rep = A.detect_anomalies('T2', base, ment, None, None, prescreen=True)
+    assert not rep.fast_path
+    assert [(b.bbox, b.classification) for b in rep.blobs] == [(b.bbox, b.classification) for b in ref.blobs]
+
+
+def test_prescreen_fast_path_on_unchanged_image(pair):
+    base = A.read_bgr(pair[0])
+    rep = A.detect_anomalies('T2', base, base.copy(), None, None, prescreen=True)
+    assert rep.fast_path and rep.image_level_label == 'Normal' and not rep.blobs
@@ -0,0 +1,24 @@
+from dataclasses import replace
+
+import pytest
+
+import anomaly_cv as A
+from conftest import blob_keys
+
+
+@pytest.mark.parametrize('params', [A.DEFAULT_PARAMS,
+                                    replace(A.DEFAULT_PARAMS, t_pot=6.0, t_pot_relaxed=7.0),
+                                    replace(A.DEFAULT_PARAMS, joint_radius=4, elong_thr=2.0)])
+def test_redetect_matches_detect(pair, tmp_path, params):
+    inter = {}
+    A.detect_anomalies('T2', *pair, None, None, intermediates=inter)
+    path = str(tmp_path / 'inter.npz')
+    A.save_intermediates(path, inter)
+    stored = A.load_intermediates(path)
+    assert stored['pipeline_version'] == A.PIPELINE_VERSION
+
+    rep = A.redetect(stored, params)
+    ref = A.detect_anomalies('T2', *pair, None, None, params=params)
+    assert blob_keys(rep) == blob_keys(ref)
+    for r, d in zip(rep.blobs, ref.blobs):   # stored ΔE is rounded down to DELTAE_QUANT
+        assert d.mean_deltaE - A.DELTAE_QUANT <= r.mean_deltaE <= d.mean_deltaE + 1e-6
@@ -0,0 +1,50 @@
+import json
+import os
+from dataclasses import replace
+
+import anomaly_cv as A
+from conftest import blob_keys
+
+
+def _in_memory(pair, cache, **kwargs):
+    return A.detect_anomalies_in_memory('T2', *pair, result_cache=cache, instrument=True, **kwargs)
+
+
+def test_result_cache_keys(pair, tmp_path, monkeypatch):
+    cache = A.ResultCache(cache_dir=str(tmp_path))
+    rep, png = _in_memory(pair, cache)
+    assert rep.instrumentation['result_cache'] == 'miss'
+    hit, hit_png = _in_memory(pair, cache)
+    assert hit.instrumentation['result_cache'] == 'hit'
+    assert blob_keys(hit) == blob_keys(rep) and hit_png == png
+    # membership (what /analyze checks before a preview) agrees with get and counts nothing
+    stats = cache.stats()
+    assert A.result_cache_key(*pair) in cache and A.result_cache_key(*pair, mode='preview') not in cache
+    assert cache.stats() == stats
+
+    # result-affecting parameters, the mode and the pipeline version are all part of the key
+    assert _in_memory(pair, cache, params=replace(A.DEFAULT_PARAMS, t_pot=6.0))[0].instrumentation['result_cache'] == 'miss'
+    assert _in_memory(pair, cache, mode='preview')[0].instrumentation['result_cache'] == 'miss'
+    assert _in_memory(pair, cache, timings={})[0].instrumentation['result_cache'] == 'hit'   # runtime-only kwarg
+    monkeypatch.setattr(A, 'PIPELINE_VERSION', A.PIPELINE_VERSION + '-test')
+    assert _in_memory(pair, cache)[0].instrumentation['result_cache'] == 'miss'
+    monkeypatch.undo()
+
+    fresh = A.ResultCache(cache_dir=str(tmp_path))   # disk tier survives a restart
+    assert _in_memory(pair, fresh)[0].instrumentation['result_cache'] == 'hit'
+    assert fresh.disk_hits == 1
+    assert A.result_cache_key(*pair, mode='preview') in A.ResultCache(cache_dir=str(tmp_path))
+
+
+def test_result_cache_disk_lru(tmp_path):
+    rep = A.DetectionReport('T2', 'b', 'm', 'affine', True, 1.0, 1.0, 'Normal', [])
+    png = bytes(10000)
+    entry = len(json.dumps(A.report_to_dict(rep))) + len(png)
+    cache = A.ResultCache(cache_dir=str(tmp_path), disk_max_bytes=2 * entry + 100)
+    cache.put('a', rep, png)
+    cache.put('b', rep, png)
+    for k, name in enumerate(sorted(os.listdir(str(tmp_path)))):   # a before b, older than any hit
+        os.utime(str(tmp_path / name), (1e9 + k, 1e9 + k))
+    assert A.ResultCache(cache_dir=str(tmp_path)).get('a') is not None   # disk hit: 'a' becomes most recent
+    cache.put('c', rep, png)
+    assert sorted(os.listdir(str(tmp_path))) == ['a.json', 'a.png', 'c.json', 'c.png']
@@ -0,0 +1,62 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import anomaly_cv as A
+import database as db
+import migrate_database as M
+from conftest import BACKEND, blob_keys
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """A working directory with schema.sql, where both modules open ./backend.db."""
+    shutil.copy(os.path.join(BACKEND, 'schema.sql'), str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def _create(drop_roi=False):
+    conn = sqlite3.connect(M.DATABASE)
+    with open('schema.sql') as f:
+        conn.executescript(f.read())
+    if drop_roi:   # a database migrated before transformers.roi existed
+        conn.execute('ALTER TABLE transformers DROP COLUMN roi')
+    conn.execute("INSERT INTO transformers (id, number) VALUES (1, 'TX-1')")
+    conn.commit()
+    conn.close()
+
+
+def test_migration_adds_roi_to_migrated_db(workdir, monkeypatch):
+    _create(drop_roi=True)
+    assert all(M.check_tables_exist()) and not M.check_column_exists('transformers', 'roi')
+    with pytest.raises(sqlite3.OperationalError):
+        db.get_transformer_roi(1)
+    monkeypatch.setattr('builtins.input', lambda *a: pytest.fail('prompted on a database that needs migrating'))
+
+    M.main()
+    assert M.check_column_exists('transformers', 'roi')
+    assert os.path.exists('backend_backup.db')
+    assert db.get_transformer_roi(1) is None
+    assert db.set_transformer_roi(1, [[[0, 0], [10, 0], [10, 10]]])
+    assert db.get_transformer_roi(1) == [[[0, 0], [10, 0], [10, 10]]]
+
+
+def test_migration_is_a_no_op_when_current(workdir, monkeypatch):
+    _create()
+    monkeypatch.setattr('builtins.input', lambda *a: '1')
+    before = os.path.getmtime(M.DATABASE)
+    M.main()
+    assert os.path.getmtime(M.DATABASE) == before
+    assert not os.path.exists('backend_backup.db')
+
+
+def test_redetect_honours_stored_roi(pair):
+    inter = {}
+    roi = [[[0, 0], [300, 0], [300, 300], [0, 300]]]
+    ref = A.detect_anomalies('T2', *pair, None, None, intermediates=inter, roi=roi)
+    assert ref.blobs
+    assert blob_keys(A.redetect(inter)) == blob_keys(ref)
+    assert all(b.bbox[0] + b.bbox[2] <= 301 for b in ref.blobs)
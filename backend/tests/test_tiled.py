@@ -0,0 +1,15 @@
+import pytest
+
+import anomaly_cv as A
+
+
+def test_tiled_matches_full(pair):
+    full = A.detect_anomalies('T2', *pair, None, None)
+    tiled = A.detect_anomalies_tiled('T2', *pair, None, None, tile_size=128, tile_overlap=16)
+    assert full.blobs
+    # masks and ΔE statistics match; the topology subtype may differ near a seam
+    assert [(b.bbox, b.area) for b in tiled.blobs] == [(b.bbox, b.area) for b in full.blobs]
+    for t, f in zip(tiled.blobs, full.blobs):
+        assert t.mean_deltaE == pytest.approx(f.mean_deltaE, abs=1e-3)
+        assert t.peak_deltaE == pytest.approx(f.peak_deltaE, abs=1e-3)
+    assert tiled.mean_ssim == pytest.approx(full.mean_ssim, abs=1e-3)
@@ -440,42 +440,59 @@ export default function InspectionViewModal({
     setProgressStatus(prev => ({ ...prev, aiAnalysis: "In Progress" }));
 
     try {
-      const form = new FormData();
       // backend expects files; convert dataURI to File if necessary
       const bfile = baselineImage instanceof File ? baselineImage : dataURLtoFile(baselineImage, 'baseline.png');
       const mfile = maintenanceImage instanceof File ? maintenanceImage : dataURLtoFile(maintenanceImage, 'maintenance.png');
-      form.append('baseline', bfile);
-      form.append('maintenance', mfile);
-      form.append('inspection_id', inspection.id);
-      form.append('threshold', aiThreshold); // Send threshold to backend
-
-      const res = await fetch("http://localhost:8000/analyze", {
-        method: "POST",
-        body: form
-      });
 
-      if (!res.ok) {
-        const txt = await res.text();
-        throw new Error(`AI analyze failed: ${txt}`);
-      }
+      const runAnalyze = async (mode) => {
+        const form = new FormData();
+        form.append('baseline', bfile);
+        form.append('maintenance', mfile);
+        form.append('inspection_id', inspection.id);
+        form.append('threshold', aiThreshold); // Send threshold to backend
+        form.append('mode', mode); // 'preview' (fast, coarse-to-fine) or 'full' (exact)
+
+        const res = await fetch("http://localhost:8000/analyze", {
+          method: "POST",
+          body: form
+        });
 
-      const j = await res.json();
-      // Expect: { annotatedImage: <data-uri or url>, anomalies: [{id,x,y,w,h,confidence,severity}] }
-      // Use the image data URI sent directly from the backend. This is crucial.
-      setAnnotatedImage(j.annotatedImage);
-
-      // map anomalies, ensure ids exist
-      const mapped = (j.anomalies || []).map(a => ({
-        id: a.id ?? `${Date.now()}_${Math.random().toString(36).slice(2,7)}`,
-        x: a.x, y: a.y, w: a.w, h: a.h,
-        confidence: a.confidence ?? null,
-        classification: a.classification ?? 'Unknown',
-        severity: a.severity ?? null,
-        comment: a.comment ?? '',
-        source: 'ai',
-        deleted: false
-      }));
-      setAnomalies(mapped);
+        if (!res.ok) {
+          const txt = await res.text();
+          throw new Error(`AI analyze failed: ${txt}`);
+        }
+
+        const j = await res.json();
+        // Expect: { annotatedImage: <data-uri or url>, anomalies: [{id,x,y,w,h,confidence,severity}] }
+        // Use the image data URI sent directly from the backend. This is crucial.
+        setAnnotatedImage(j.annotatedImage);
+
+        // map anomalies, ensure ids exist
+        const mapped = (j.anomalies || []).map(a => ({
+          id: a.id ?? `${Date.now()}_${Math.random().toString(36).slice(2,7)}`,
+          x: a.x, y: a.y, w: a.w, h: a.h,
+          confidence: a.confidence ?? null,
+          classification: a.classification ?? 'Unknown',
+          severity: a.severity ?? null,
+          comment: a.comment ?? '',
+          source: 'ai',
+          deleted: false
+        }));
+        setAnomalies(mapped);
+        return j.mode;
+      };
+
+      // Show the quick preview boxes first, then replace them with the exact result.
+      // The backend answers the preview with the full result when that is already cached.
+      let served = null;
+      try {
+        served = await runAnalyze('preview');
+      } catch (previewErr) {
+        console.warn("AI preview failed, waiting for full analysis", previewErr);
+      }
+      if (served !== 'full') {
+        await runAnalyze('full');
+      }
       setProgressStatus(prev => ({ ...prev, aiAnalysis: "Completed", review: "In Progress", thermalUpload: "Completed" }));
     } catch (err) {
       console.error(err);